@@ -0,0 +1,134 @@
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import select, insert, delete, func, union_all, literal, DateTime
+from sqlalchemy.orm import Session, aliased
+from database import SessionLocal, Pret, PretArchive
+
+# Archivage des prêts rendus depuis plus de N mois dans la table Pret_archive
+# La table Pret ne conserve ainsi que les prêts actifs et l'historique récent ;
+# l'historique complet est reconstitué (UNION ALL) seulement quand la période demandée
+# remonte avant l'horizon d'archivage.
+# Configuration :
+# - RADIOTRACK_ARCHIVE_MOIS : ancienneté du retour avant archivage (défaut 12, 0 = désactivé)
+# - RADIOTRACK_ARCHIVE_INTERVALLE_HEURES : période entre deux passages (défaut 24)
+
+ARCHIVE_MOIS = int(os.getenv("RADIOTRACK_ARCHIVE_MOIS", "12"))
+ARCHIVE_INTERVALLE_HEURES = float(os.getenv("RADIOTRACK_ARCHIVE_INTERVALLE_HEURES", "24"))
+ARCHIVE_LOT = 5000  # Nombre de prêts déplacés par transaction
+
+PRET_COLUMNS = [column.name for column in Pret.__table__.columns]
+
+def archive_prets(mois: int = ARCHIVE_MOIS, now: Optional[datetime] = None):
+    """
+    Déplace vers Pret_archive les prêts rendus depuis plus de `mois` mois.
+    Traitement par lots (transactions courtes) ; retourne le nombre de prêts archivés.
+    """
+    if mois <= 0:
+        return 0
+
+    limite = (now or datetime.now()) - timedelta(days=30 * mois)
+    pret = Pret.__table__
+    archive = PretArchive.__table__
+    total = 0
+
+    while True:
+        db = SessionLocal()
+        try:
+            ids = db.execute(
+                select(pret.c.id).where(
+                    pret.c.date_retour.isnot(None),
+                    pret.c.date_retour < limite,
+                    # Identifiant déjà archivé (réutilisé avant next_pret_id) : prêt laissé dans Pret
+                    pret.c.id.notin_(select(archive.c.id))
+                ).order_by(pret.c.id).limit(ARCHIVE_LOT)
+            ).scalars().all()
+            if not ids:
+                return total
+
+            db.execute(
+                insert(archive).from_select(
+                    PRET_COLUMNS + ["date_archivage"],
+                    select(*[pret.c[name] for name in PRET_COLUMNS], literal(datetime.now(), DateTime))
+                    .where(pret.c.id.in_(ids))
+                )
+            )
+            # Seuls les prêts dont la copie vient d'être insérée sont supprimés (même transaction)
+            db.execute(
+                delete(pret).where(
+                    pret.c.id.in_(select(archive.c.id).where(archive.c.id.in_(ids)))
+                )
+            )
+            db.commit()
+            total += len(ids)
+        finally:
+            db.close()
+
+def next_pret_id():
+    """
+    Identifiant du prochain prêt (expression SQL) : supérieur à ceux des prêts courants
+    et archivés. Sans AUTOINCREMENT, SQLite réattribuerait sinon les identifiants des
+    derniers prêts archivés, qui entreraient en collision avec leur copie dans Pret_archive.
+    """
+    maximums = union_all(
+        select(func.max(Pret.__table__.c.id).label("id")),
+        select(func.max(PretArchive.__table__.c.id).label("id"))
+    ).subquery("maximums")
+    return select(func.coalesce(func.max(maximums.c.id), 0) + 1).scalar_subquery()
+
+def archive_horizon(db: Session):
+    """Date de retour la plus récente parmi les prêts archivés (None si l'archive est vide)"""
+    return db.query(func.max(PretArchive.date_retour)).scalar()
+
+def archive_needed(db: Session, debut: Optional[datetime] = None):
+    """
+    Indique si une période commençant à `debut` (None = depuis toujours) peut contenir
+    des prêts archivés : tout prêt archivé a été emprunté et rendu avant l'horizon.
+    """
+    horizon = archive_horizon(db)
+    if horizon is None:
+        return False
+    return debut is None or debut <= horizon
+
+def pret_historique():
+    """
+    Entité équivalente à Pret couvrant les prêts courants et archivés.
+    S'utilise comme Pret dans les requêtes (filtres, relations radio/personne, joinedload).
+    """
+    courants = select(*[Pret.__table__.c[name] for name in PRET_COLUMNS])
+    archives = select(*[PretArchive.__table__.c[name].label(name) for name in PRET_COLUMNS])
+    return aliased(Pret, union_all(courants, archives).subquery("pret_historique"))
+
+def pret_source(db: Session, debut: Optional[datetime] = None):
+    """Pret seul, ou l'union avec l'archive si la période commençant à `debut` l'exige"""
+    return pret_historique() if archive_needed(db, debut) else Pret
+
+def start_archive_scheduler():
+    """Lance l'archivage périodique dans un thread de fond (une fois par processus)"""
+    if ARCHIVE_MOIS <= 0 or ARCHIVE_INTERVALLE_HEURES <= 0:
+        return None
+
+    stop = threading.Event()
+
+    def run():
+        while not stop.is_set():
+            try:
+                archived = archive_prets()
+                if archived:
+                    print(f"Archivage: {archived} prêts déplacés vers Pret_archive")
+            except Exception as e:
+                print(f"Erreur lors de l'archivage des prêts: {e}")
+            stop.wait(ARCHIVE_INTERVALLE_HEURES * 3600)
+
+    threading.Thread(target=run, name="archivage-prets", daemon=True).start()
+    return stop
+
+# Exécution manuelle : python archive.py [mois]
+if __name__ == "__main__":
+    import sys
+    from database import init_db
+
+    init_db()
+    mois = int(sys.argv[1]) if len(sys.argv) > 1 else ARCHIVE_MOIS
+    print(f"{archive_prets(mois)} prêts archivés")
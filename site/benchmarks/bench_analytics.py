@@ -0,0 +1,81 @@
+import argparse
+import time
+
+# Latence du tableau de bord analytique (/api/historique/analytics) face aux quatre appels
+# séparés qu'il remplace (/stats, /top/radios, /top/emprunteurs, /duree/equipes) :
+# - appels séparés (non mis en cache),
+# - analytics à froid : cache invalidé avant chaque appel (générations de tables incrémentées),
+# - analytics à froid après une écriture réelle : prêt créé puis rendu via l'API, seul
+#   l'appel analytics est chronométré,
+# - analytics à chaud : valeur servie par le cache.
+# Vérifie aussi que le tableau de bord renvoie les mêmes valeurs que les appels séparés.
+# Option --archive : déplace d'abord les prêts de plus de 12 mois vers Pret_archive
+# (les agrégats parcourent alors l'union des deux tables).
+# Usage : python benchmarks/bench_analytics.py [--prets 200000] [--repetitions 10] [--archive]
+
+SEPARES = ("/api/historique/stats", "/api/historique/top/radios",
+           "/api/historique/top/emprunteurs", "/api/historique/duree/equipes")
+
+def main():
+    parser = argparse.ArgumentParser(description="Latence de /api/historique/analytics face aux appels séparés")
+    parser.add_argument("--prets", type=int, default=200000, help="Nombre de prêts de la base")
+    parser.add_argument("--repetitions", type=int, default=10, help="Mesures par variante")
+    parser.add_argument("--limit", type=int, default=10, help="Taille des tops")
+    parser.add_argument("--archive", action="store_true", help="Archiver les prêts de plus de 12 mois avant la mesure")
+    args = parser.parse_args()
+
+    from outils import base_temporaire, client_api, peupler, mesurer, resume
+
+    path = base_temporaire()
+    peupler(path, prets=args.prets)
+
+    import cache
+    from archive import archive_prets
+    from routes.historique import ANALYTICS_TABLES
+
+    if args.archive:
+        archive_prets()
+
+    params = {"limit": args.limit}
+
+    with client_api() as client:
+        def get(url):
+            response = client.get(url, params=params)
+            response.raise_for_status()
+            return response.json()
+
+        def separes():
+            return [get(url) for url in SEPARES]
+
+        def analytics_froid():
+            cache.invalidate(ANALYTICS_TABLES)
+            return get("/api/historique/analytics")
+
+        # Cohérence : mêmes valeurs que les quatre points d'accès
+        stats, top_radios, top_emprunteurs, duree_equipes = separes()
+        bundle = analytics_froid()
+        identiques = (bundle["stats"] == stats and bundle["top_radios"] == top_radios
+                      and bundle["top_emprunteurs"] == top_emprunteurs
+                      and bundle["duree_equipes"] == duree_equipes)
+
+        def apres_ecriture():
+            # Prêt créé puis rendu (radio et personne 1, libres : tous les prêts générés sont rendus)
+            response = client.post("/api/prets/", json={"id_radio": 1, "id_personne": 1})
+            response.raise_for_status()
+            client.put(f"/api/prets/{response.json()['id']}/retour").raise_for_status()
+            debut = time.perf_counter()
+            get("/api/historique/analytics")
+            return time.perf_counter() - debut
+
+        apres_ecriture()
+        durees_ecriture = [apres_ecriture() for _ in range(args.repetitions)]
+
+        print(f"{args.prets} prêts{' (archivés au-delà de 12 mois)' if args.archive else ''}, tops de {args.limit}")
+        print(f"valeurs identiques aux appels séparés : {'oui' if identiques else 'NON'}")
+        print(f"4 appels séparés                : {resume(mesurer(separes, args.repetitions))}")
+        print(f"analytics à froid (invalidé)    : {resume(mesurer(analytics_froid, args.repetitions))}")
+        print(f"analytics après prêt + retour   : {resume(durees_ecriture)}")
+        print(f"analytics à chaud (cache)       : {resume(mesurer(lambda: get('/api/historique/analytics'), args.repetitions))}")
+
+if __name__ == "__main__":
+    main()
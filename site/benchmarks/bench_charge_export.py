@@ -0,0 +1,73 @@
+import argparse
+import threading
+
+# Latence de /api/prets pendant un export CSV de l'historique
+# L'application est servie par uvicorn (un worker) dans un processus séparé. Des clients
+# parallèles interrogent la liste des prêts, d'abord seuls, puis pendant que d'autres
+# clients téléchargent en boucle l'export complet des prêts : la latence ne doit pas se
+# dégrader (gestionnaires synchrones exécutés dans le pool de threads de FastAPI, la
+# boucle d'événements n'est jamais bloquée par une requête SQL).
+# Usage : python benchmarks/bench_charge_export.py [--prets 100000] [--clients 4] [--requetes 200] [--exports 1]
+
+def latences_liste(url, headers, clients: int, requetes: int):
+    import httpx
+    from outils import mesurer
+
+    resultats = []
+    verrou = threading.Lock()
+
+    def client():
+        with httpx.Client(base_url=url, headers=headers, timeout=60) as http:
+            durees = mesurer(lambda: http.get("/api/prets/", params={"limit": 20}).raise_for_status(), requetes)
+        with verrou:
+            resultats.extend(durees)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return resultats
+
+def main():
+    parser = argparse.ArgumentParser(description="Latence de /api/prets pendant un export CSV")
+    parser.add_argument("--prets", type=int, default=100000, help="Nombre de prêts de la base")
+    parser.add_argument("--clients", type=int, default=4, help="Clients parallèles sur /api/prets")
+    parser.add_argument("--requetes", type=int, default=200, help="Requêtes par client")
+    parser.add_argument("--exports", type=int, default=1, help="Exports simultanés")
+    args = parser.parse_args()
+
+    from outils import base_temporaire, peupler, serveur, resume
+
+    path = base_temporaire()
+    peupler(path, prets=args.prets)
+
+    import httpx
+
+    with serveur(path) as (url, headers):
+        seul = latences_liste(url, headers, args.clients, args.requetes)
+
+        stop = threading.Event()
+        exports = [0]
+
+        def exporter():
+            with httpx.Client(base_url=url, headers=headers, timeout=300) as http:
+                while not stop.is_set():
+                    with http.stream("GET", "/api/historique/prets/export") as response:
+                        for _ in response.iter_bytes():
+                            pass
+                    exports[0] += 1
+
+        exporteurs = [threading.Thread(target=exporter) for _ in range(args.exports)]
+        for thread in exporteurs:
+            thread.start()
+        pendant_export = latences_liste(url, headers, args.clients, args.requetes)
+        stop.set()
+        for thread in exporteurs:
+            thread.join()
+
+    print(f"/api/prets seul            : {resume(seul)}")
+    print(f"/api/prets pendant l'export : {resume(pendant_export)} ({exports[0]} exports de {args.prets} prêts terminés)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import argparse
+
+# Latence d'une page de l'historique des prêts et coût du total (X-Total-Count)
+# Compare, sur la même requête filtrée que /api/historique/prets (relations chargées par
+# jointures), les stratégies de comptage :
+# - query.count() sur la requête complète (ancien comportement : sous-requête avec jointures),
+# - comptage sur l'identifiant seul (pagination.count_rows),
+# - total en cache (pagination.count_total) : seule la page est lue,
+# - COUNT(*) OVER () dans la requête de la page (option --fenetre, lent : SQLite trie
+#   toutes les lignes filtrées avant LIMIT),
+# puis mesure les points d'accès /api/historique/prets et /api/prets avec le cache.
+# Usage : python benchmarks/bench_pagination.py [--prets 500000] [--repetitions 20] [--fenetre]
+
+def main():
+    parser = argparse.ArgumentParser(description="Latence d'une page de prêts selon la stratégie de comptage")
+    parser.add_argument("--prets", type=int, default=500000, help="Nombre de prêts de la base")
+    parser.add_argument("--repetitions", type=int, default=20, help="Mesures par stratégie")
+    parser.add_argument("--limit", type=int, default=50, help="Taille de la page")
+    parser.add_argument("--fenetre", action="store_true", help="Mesurer aussi COUNT(*) OVER ()")
+    args = parser.parse_args()
+
+    from outils import base_temporaire, client_api, peupler, mesurer, resume
+
+    path = base_temporaire()
+    peupler(path, prets=args.prets)
+
+    from sqlalchemy import func
+    from sqlalchemy.orm import joinedload
+    from database import SessionLocal, Pret, Personne
+    from pagination import count_rows, paginate
+    from routes.historique import PretFilter, pret_conditions
+
+    db = SessionLocal()
+    filtres = PretFilter(status="returned")
+
+    def requete():
+        return db.query(Pret).options(
+            joinedload(Pret.radio),
+            joinedload(Pret.personne).joinedload(Personne.equipe),
+            joinedload(Pret.personne).joinedload(Personne.cfi)
+        ).filter(*pret_conditions(Pret, filtres))
+
+    def page(query, keyset=True):
+        return paginate(query, [Pret.date_emprunt, Pret.id], 0, args.limit, None, descending=True, keyset=keyset)
+
+    strategies = [
+        ("query.count() + page", lambda: (requete().count(), page(requete()))),
+        ("count_rows() + page", lambda: (count_rows(requete()), page(requete()))),
+        ("total en cache : page seule", lambda: page(requete())),
+    ]
+    if args.fenetre:
+        strategies.append(("COUNT(*) OVER () + page", lambda: page(requete().add_columns(func.count().over()), keyset=False)))
+
+    print(f"{args.prets} prêts, page de {args.limit}, filtre status=returned")
+    for libelle, fonction in strategies:
+        repetitions = 3 if "OVER" in libelle else args.repetitions
+        print(f"{libelle:32}: {resume(mesurer(fonction, repetitions))}")
+    db.close()
+
+    with client_api() as client:
+        for url in ("/api/historique/prets", "/api/prets/"):
+            params = {"limit": args.limit}
+            durees = mesurer(lambda: client.get(url, params=params).raise_for_status(), args.repetitions)
+            print(f"GET {url:28}: {resume(durees)} (total en cache après la première requête)")
+
+if __name__ == "__main__":
+    main()
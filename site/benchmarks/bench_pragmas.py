@@ -0,0 +1,54 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+# Débit des emprunts / retours avec et sans le profil de pragmas SQLite (database.py)
+# Chaque configuration s'exécute dans un processus distinct (le profil est appliqué à
+# l'ouverture des connexions du pool) sur une base neuve : chaque emprunt et chaque
+# retour passe par l'API et valide sa propre transaction.
+# Usage : python benchmarks/bench_pragmas.py [--cycles 20] [--radios 50]
+
+def run(cycles: int, radios: int):
+    from outils import base_temporaire, client_api, peupler
+
+    path = base_temporaire()
+    peupler(path, prets=0, radios=radios, personnes=radios)
+
+    operations = 0
+    with client_api() as client:
+        debut = time.perf_counter()
+        for _ in range(cycles):
+            ids = []
+            for id_radio in range(1, radios + 1):
+                response = client.post("/api/prets/", json={"id_radio": id_radio, "id_personne": id_radio})
+                ids.append(response.json()["id"])
+            for pret_id in ids:
+                client.put(f"/api/prets/{pret_id}/retour")
+            operations += 2 * radios
+        duree = time.perf_counter() - debut
+    print(f"{operations} opérations en {duree:.2f} s : {operations / duree:.0f} emprunts/retours par seconde")
+
+def main():
+    parser = argparse.ArgumentParser(description="Débit des emprunts / retours selon le profil de pragmas SQLite")
+    parser.add_argument("--cycles", type=int, default=20, help="Cycles emprunt + retour de toutes les radios")
+    parser.add_argument("--radios", type=int, default=50, help="Nombre de radios")
+    parser.add_argument("--profil", choices=["0", "1"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.profil is not None:
+        run(args.cycles, args.radios)
+        return
+
+    for profil, libelle in (("0", "sans profil (journal rollback, synchronous=FULL)"), ("1", "profil par défaut (WAL, NORMAL)")):
+        sortie = subprocess.run(
+            [sys.executable, "-W", "ignore", __file__, "--profil", profil,
+             "--cycles", str(args.cycles), "--radios", str(args.radios)],
+            env={**os.environ, "RADIOTRACK_SQLITE_PRAGMAS": profil},
+            capture_output=True, text=True, check=True
+        )
+        print(f"{libelle} : {sortie.stdout.strip().splitlines()[-1]}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+# Outils communs aux scripts de mesure de performance (benchmarks/*.py)
+# Chaque script travaille sur une base SQLite neuve dans un répertoire temporaire :
+# base_temporaire() doit être appelée avant tout import des modules de l'application
+# (database.py lit RADIOTRACK_DATABASE_URL à l'import). Les données sont insérées
+# directement en SQL (peupler) : les déclencheurs tiennent à jour les tables dérivées.
+# Lancement depuis le répertoire site : python benchmarks/<script>.py [options]
+
+SITE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def base_temporaire():
+    """Crée une base vide (migrations appliquées) et retourne son chemin"""
+    path = os.path.join(tempfile.mkdtemp(prefix="radiotrack_bench_"), "radio_tracker.db")
+    os.environ["RADIOTRACK_DATABASE_URL"] = f"sqlite:///{path}"
+    # Archivage périodique désactivé (lu à l'import d'archive.py) : les prêts générés
+    # (depuis 2020) seraient sinon déplacés vers l'archive pendant la mesure
+    os.environ["RADIOTRACK_ARCHIVE_INTERVALLE_HEURES"] = "0"
+    sys.path.insert(0, SITE_DIR)
+    os.chdir(SITE_DIR)
+
+    from database import init_db
+    init_db()
+    return path
+
+def client_api():
+    """
+    Client de test de l'application, authentifié sans passer par /token.
+    À utiliser comme gestionnaire de contexte (with client_api() as client) : une seule
+    boucle d'événements pour toutes les requêtes et les tâches de fond démarrées.
+    """
+    from fastapi.testclient import TestClient
+    from database import User
+    import auth
+    import main
+
+    main.app.dependency_overrides[auth.get_current_active_user] = lambda: User(id=1, username="bench", is_active=True)
+    return TestClient(main.app)
+
+@contextmanager
+def serveur(path: str, port: int = 8765, workers: int = 1):
+    """
+    Application servie par uvicorn dans un processus séparé, sur la base `path`.
+    Retourne l'URL de base et les en-têtes d'authentification d'un utilisateur créé pour l'occasion.
+    """
+    import httpx
+    from auth import create_access_token
+
+    con = sqlite3.connect(path)
+    try:
+        con.execute(
+            "INSERT OR IGNORE INTO users (username, email, hashed_password, is_active, created_at) "
+            "VALUES ('bench', 'bench@example.org', '-', 1, ?)", (str(datetime.now()),)
+        )
+        con.commit()
+    finally:
+        con.close()
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': 'bench'}, timedelta(hours=1))}"}
+
+    url = f"http://127.0.0.1:{port}"
+    # Archivage périodique désactivé, comme pour client_api (voir base_temporaire)
+    env = {
+        **os.environ,
+        "RADIOTRACK_DATABASE_URL": f"sqlite:///{path}",
+        "RADIOTRACK_ARCHIVE_INTERVALLE_HEURES": "0",
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-W", "ignore", "-m", "uvicorn", "main:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=SITE_DIR, env=env
+    )
+    try:
+        for _ in range(100):
+            try:
+                if httpx.get(f"{url}/api/prets/?limit=1", headers=headers).status_code == 200:
+                    break
+            except httpx.TransportError:
+                pass
+            time.sleep(0.1)
+        else:
+            raise RuntimeError("Le serveur de test n'a pas démarré")
+        yield url, headers
+    finally:
+        process.terminate()
+        process.wait()
+
+def peupler(path: str, prets: int, radios: int = 300, personnes: int = 2000,
+            equipes: int = 20, cfis: int = 10, seed: int = 1):
+    """
+    Insère un jeu de données : prêts rendus de 1 à 72 heures, un toutes les 5 minutes
+    à partir du 1er janvier 2020, répartis au hasard entre radios et personnes
+    """
+    random.seed(seed)
+    debut = datetime(2020, 1, 1)
+    con = sqlite3.connect(path)
+    try:
+        con.executemany("INSERT INTO CFI (nom, responsable) VALUES (?, 'Responsable')",
+                        [(f"CFI {i}",) for i in range(cfis)])
+        con.executemany("INSERT INTO Equipe (nom, categorie) VALUES (?, 'secours')",
+                        [(f"Équipe {i}",) for i in range(equipes)])
+        con.executemany(
+            "INSERT INTO Radio (code_barre, marque, modele, numero_serie, en_maintenance, est_geolocalisable) "
+            "VALUES (?, ?, 'DP4400', ?, 0, 0)",
+            [(f"R{i:05d}", random.choice(["Motorola", "Hytera", "Kenwood"]), f"S{i:06d}") for i in range(radios)]
+        )
+        con.executemany(
+            "INSERT INTO Personne (code_barre, nom, prenom, id_equipe, id_cfi) VALUES (?, ?, ?, ?, ?)",
+            [(f"P{i:05d}", f"Nom{i}", f"Prénom{i}", i % equipes + 1, i % cfis + 1) for i in range(personnes)]
+        )
+
+        def pret(i):
+            emprunt = debut + timedelta(minutes=5 * i)
+            duree = timedelta(hours=random.randint(1, 72))
+            return (
+                random.randint(1, radios), random.randint(1, personnes), str(emprunt), str(emprunt + duree),
+                str(emprunt + timedelta(hours=168)), duree.total_seconds()
+            )
+
+        for lot in range(0, prets, 10000):
+            con.executemany(
+                "INSERT INTO Pret (id_radio, id_personne, date_emprunt, date_retour, date_echeance, "
+                "duree_secondes, accessoires) VALUES (?, ?, ?, ?, ?, ?, 'aucun')",
+                [pret(i) for i in range(lot, min(lot + 10000, prets))]
+            )
+        con.execute("ANALYZE")
+        con.commit()
+    finally:
+        con.close()
+
+def mesurer(fonction, repetitions: int, echauffement: int = 1):
+    """Durées (secondes) de `repetitions` appels de `fonction`, après `echauffement` appels"""
+    for _ in range(echauffement):
+        fonction()
+    durees = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        fonction()
+        durees.append(time.perf_counter() - debut)
+    return durees
+
+def percentile(durees, p: float):
+    ordonnees = sorted(durees)
+    return ordonnees[min(len(ordonnees) - 1, int(len(ordonnees) * p / 100))]
+
+def resume(durees):
+    """Médiane et p99 en millisecondes"""
+    return f"p50 {statistics.median(durees) * 1000:.1f} ms, p99 {percentile(durees, 99) * 1000:.1f} ms"
@@ -0,0 +1,145 @@
+import os
+import threading
+import time
+from collections import defaultdict
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+# Cache en mémoire du processus, invalidé par les écritures
+# Chaque table possède un numéro de génération incrémenté à chaque commit qui la modifie
+# (unité de travail de la session ou instruction INSERT/UPDATE/DELETE exécutée via la session).
+# Une valeur mise en cache mémorise les générations des tables dont elle dépend et n'est
+# plus servie dès que l'une d'elles a changé.
+# Le cache est propre à chaque processus : avec plusieurs workers uvicorn, le désactiver
+# via RADIOTRACK_CACHE=0 (les écritures d'un worker ne sont pas visibles des autres).
+
+CACHE_ENABLED = os.getenv("RADIOTRACK_CACHE", "1").lower() not in ("0", "false", "non", "off")
+
+_lock = threading.Lock()
+_generations = defaultdict(int)
+
+def table_generations(tables):
+    with _lock:
+        return tuple(_generations[table] for table in tables)
+
+def invalidate(tables):
+    with _lock:
+        for table in tables:
+            _generations[table] += 1
+
+def _modified_tables(session: Session):
+    return session.info.setdefault("tables_modifiees", set())
+
+@event.listens_for(Session, "after_flush")
+def _track_flush(session, flush_context):
+    modified = _modified_tables(session)
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        mapper = inspect(obj).mapper
+        modified.update(table.name for table in mapper.tables)
+
+@event.listens_for(Session, "do_orm_execute")
+def _track_statement(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is not None:
+            _modified_tables(orm_execute_state.session).add(table.name)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_on_commit(session):
+    modified = session.info.pop("tables_modifiees", None)
+    if modified:
+        invalidate(modified)
+
+@event.listens_for(Session, "after_rollback")
+def _forget_on_rollback(session):
+    session.info.pop("tables_modifiees", None)
+
+
+class GenerationCache:
+    """Cache clé -> valeur, chaque entrée étant liée aux générations de ses tables"""
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, tables, compute):
+        if not CACHE_ENABLED:
+            return compute()
+
+        generations = table_generations(tables)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[0] == generations:
+            return entry[1]
+
+        value = compute()
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+            self._entries[key] = (generations, value)
+        return value
+
+
+class RefreshCache:
+    """
+    Cache à durée de vie avec rafraîchissement en arrière-plan (stale-while-revalidate).
+    - entrée de moins de `ttl` secondes : servie telle quelle ;
+    - entrée expirée depuis moins de `stale_ttl` secondes : servie, et recalculée en fond ;
+    - entrée plus ancienne, absente ou dont une table a été modifiée : recalcul immédiat.
+    `compute` doit ouvrir sa propre session : il peut s'exécuter dans un thread de fond.
+    """
+
+    def __init__(self, ttl: float, stale_ttl: float, max_entries: int = 100):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, tables, compute):
+        if not CACHE_ENABLED:
+            return compute()
+
+        generations = table_generations(tables)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[0] == generations:
+            age = time.monotonic() - entry[1]
+            if age < self.ttl:
+                return entry[2]
+            if age < self.ttl + self.stale_ttl:
+                self._refresh_in_background(key, tables, compute)
+                return entry[2]
+
+        return self._compute(key, tables, compute)
+
+    def _compute(self, key, tables, compute):
+        # Générations relevées avant le calcul : une écriture concurrente rend l'entrée périmée
+        generations = table_generations(tables)
+        computed_at = time.monotonic()
+        value = compute()
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+            self._entries[key] = (generations, computed_at, value)
+        return value
+
+    def _refresh_in_background(self, key, tables, compute):
+        # Un seul recalcul en cours par clé
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            try:
+                self._compute(key, tables, compute)
+            except Exception as e:
+                print(f"Erreur lors du rafraîchissement du cache {key}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, name="rafraichissement-cache", daemon=True).start()
@@ -1,4 +1,5 @@
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, ForeignKey, Text, CheckConstraint, event, DDL
+from sqlalchemy import create_engine, Column, Integer, Float, String, Boolean, Date, DateTime, ForeignKey, Text, CheckConstraint, event, DDL, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship, Session
 from sqlalchemy.schema import Index, UniqueConstraint
@@ -6,8 +7,46 @@ from datetime import datetime, timezone
 import os
 
 # Création de la connexion à la base de données
-DATABASE_URL = "sqlite:///./radio_tracker.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+DATABASE_URL = os.getenv("RADIOTRACK_DATABASE_URL", "sqlite:///./radio_tracker.db")
+# check_same_thread n'existe que pour le pilote SQLite (les autres pilotes le refusent)
+connect_args = {"check_same_thread": False} if make_url(DATABASE_URL).get_backend_name() == "sqlite" else {}
+engine = create_engine(DATABASE_URL, connect_args=connect_args)
+
+# Profil de performance SQLite appliqué à chaque connexion du pool :
+# - WAL : les lectures ne bloquent plus les écritures (rafales de scans les jours d'exercice)
+# - synchronous=NORMAL : un seul fsync par checkpoint au lieu d'un par commit (sûr en mode WAL)
+# - busy_timeout : attendre le verrou d'écriture plutôt que d'échouer immédiatement
+# Chaque valeur peut être surchargée par une variable d'environnement RADIOTRACK_SQLITE_<PRAGMA>
+# (ex: RADIOTRACK_SQLITE_SYNCHRONOUS=FULL). RADIOTRACK_SQLITE_PRAGMAS=0 désactive le profil.
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,        # millisecondes
+    "cache_size": -20000,        # valeur négative = en Kio, soit ~20 Mo par connexion
+    "mmap_size": 268435456,      # 256 Mo lus via mmap
+    "temp_store": "MEMORY",
+}
+
+def get_sqlite_pragmas():
+    """Retourne le profil de pragmas effectif (défauts + surcharges d'environnement)"""
+    if os.getenv("RADIOTRACK_SQLITE_PRAGMAS", "1").lower() in ("0", "false", "non", "off"):
+        return {}
+    return {
+        name: os.getenv(f"RADIOTRACK_SQLITE_{name.upper()}", default)
+        for name, default in SQLITE_PRAGMAS.items()
+    }
+
+@event.listens_for(engine, "connect")
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    if engine.dialect.name != "sqlite":
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in get_sqlite_pragmas().items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -48,6 +87,8 @@ class Equipe(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     nom = Column(String, nullable=False)
     categorie = Column(String, CheckConstraint("categorie IN ('secours', 'logistique', 'direction', 'externe')"), nullable=False)
+    # Durée de prêt maximale des membres (heures), durée par défaut si NULL (voir echeances.py)
+    duree_pret_heures = Column(Integer, nullable=True)
     date_creation = Column(DateTime, default=datetime.now)
     date_modification = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     
@@ -119,6 +160,10 @@ class Pret(Base):
     # Nouvelle colonne pour les accessoires
     accessoires = Column(String, CheckConstraint("accessoires IN ('oreillettes', 'micro', 'les deux', 'aucun')"), 
                          nullable=False, default="aucun")
+    # Date à laquelle le prêt passe en retard (voir echeances.py)
+    date_echeance = Column(DateTime, nullable=True)
+    # Durée du prêt en secondes, renseignée au retour (NULL pour un prêt actif)
+    duree_secondes = Column(Float, nullable=True)
     
     radio = relationship("Radio", back_populates="prets")
     personne = relationship("Personne", back_populates="prets")
@@ -131,6 +176,18 @@ class Pret(Base):
         Index('idx_pret_date_retour', 'date_retour'),
         # Index composite pour trouver rapidement les prêts actifs (sans date de retour)
         Index('idx_pret_actif', 'id_radio', 'date_retour'),
+        # Index unique partiel : au plus un prêt actif par radio, garanti par la base
+        Index('idx_pret_actif_unique', 'id_radio', unique=True,
+              sqlite_where=text('date_retour IS NULL'), postgresql_where=text('date_retour IS NULL')),
+        # Index composite pour retrouver le dernier prêt d'une radio avant une date (état à un instant T)
+        Index('idx_pret_radio_emprunt', 'id_radio', 'date_emprunt'),
+        # Index partiel des échéances des prêts actifs (prêts en retard)
+        Index('idx_pret_echeance_actif', 'date_echeance',
+              sqlite_where=text('date_retour IS NULL'), postgresql_where=text('date_retour IS NULL')),
+        # Index des durées : filtres de durée et tri par durée de l'historique
+        Index('idx_pret_duree', 'duree_secondes'),
+        # Index composite du filtre par accessoires de l'historique, trié par date d'emprunt
+        Index('idx_pret_accessoires_emprunt', 'accessoires', 'date_emprunt'),
     )
 
 class Maintenance(Base):
@@ -152,8 +209,104 @@ class Maintenance(Base):
         Index('idx_maintenance_date_fin', 'date_fin'),
         # Index composite pour trouver rapidement les maintenances actives (sans date de fin)
         Index('idx_maintenance_active', 'id_radio', 'date_fin'),
+        # Index composite pour retrouver la dernière maintenance d'une radio avant une date
+        Index('idx_maintenance_radio_debut', 'id_radio', 'date_debut'),
+    )
+
+class PretArchive(Base):
+    """
+    Stockage froid des prêts rendus depuis longtemps (voir archive.py).
+    Mêmes colonnes que Pret, identifiants conservés : l'historique réunit les deux tables
+    uniquement lorsque la période demandée remonte avant l'horizon d'archivage.
+    """
+    __tablename__ = "Pret_archive"
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    id_radio = Column(Integer, ForeignKey("Radio.id"), nullable=False)
+    id_personne = Column(Integer, ForeignKey("Personne.id"), nullable=False)
+    date_emprunt = Column(DateTime, nullable=False)
+    date_retour = Column(DateTime, nullable=False)
+    commentaire = Column(Text, nullable=True)
+    accessoires = Column(String, nullable=False, default="aucun")
+    date_echeance = Column(DateTime, nullable=True)
+    duree_secondes = Column(Float, nullable=True)
+    date_archivage = Column(DateTime, default=datetime.now, nullable=False)
+    
+    # Index pour optimiser les recherches
+    __table_args__ = (
+        Index('idx_pret_archive_id_radio', 'id_radio'),
+        Index('idx_pret_archive_id_personne', 'id_personne'),
+        Index('idx_pret_archive_date_emprunt', 'date_emprunt'),
+        Index('idx_pret_archive_date_retour', 'date_retour'),
+        Index('idx_pret_archive_radio_emprunt', 'id_radio', 'date_emprunt'),
+        Index('idx_pret_archive_duree', 'duree_secondes'),
+        Index('idx_pret_archive_accessoires_emprunt', 'accessoires', 'date_emprunt'),
     )
 
+class RadioEtat(Base):
+    """
+    Modèle de lecture : une ligne par radio décrivant son état courant.
+    Maintenu exclusivement par les triggers SQLite définis plus bas (prêts et maintenances),
+    il permet de filtrer les radios en prêt / disponibles par simple recherche indexée.
+    """
+    __tablename__ = "RadioEtat"
+    
+    id_radio = Column(Integer, ForeignKey("Radio.id"), primary_key=True)
+    id_pret = Column(Integer, ForeignKey("Pret.id"), nullable=True)  # Prêt actif, NULL si la radio est rendue
+    id_personne = Column(Integer, ForeignKey("Personne.id"), nullable=True)
+    date_emprunt = Column(DateTime, nullable=True)
+    en_maintenance = Column(Boolean, default=False, nullable=False)
+    date_changement = Column(DateTime, default=datetime.now, nullable=False)
+    
+    # Index pour optimiser les filtres de disponibilité
+    __table_args__ = (
+        Index('idx_radio_etat_pret', 'id_pret'),
+        Index('idx_radio_etat_disponibilite', 'en_maintenance', 'id_pret'),
+    )
+
+class PretActiviteJour(Base):
+    """
+    Agrégat quotidien de l'activité de prêt (nombre d'emprunts et de retours par jour).
+    Maintenu par les triggers de la table Pret : les vues jour / semaine / mois de
+    l'historique additionnent ces lignes au lieu de parcourir les prêts.
+    """
+    __tablename__ = "PretActiviteJour"
+    
+    jour = Column(Date, primary_key=True)
+    emprunts = Column(Integer, default=0, nullable=False)
+    retours = Column(Integer, default=0, nullable=False)
+
+class PretDureeSketch(Base):
+    """
+    Distribution des durées de prêt (prêts rendus) sous forme de sketch DDSketch :
+    nombre de prêts par compartiment logarithmique de durée (voir sketches.py).
+    Une distribution par dimension ("global", "equipe", "cfi", "modele") et par clé ;
+    les compteurs s'additionnent, ce qui permet de fusionner les sketches.
+    """
+    __tablename__ = "PretDureeSketch"
+    
+    dimension = Column(String, primary_key=True)
+    cle = Column(String, primary_key=True)
+    indice = Column(Integer, primary_key=True)
+    nombre = Column(Integer, default=0, nullable=False)
+
+class RadioFiabilite(Base):
+    """
+    Compteurs de fiabilité d'une radio (MTBF / MTTR), maintenus par les triggers de la
+    table Maintenance : nombre de pannes (maintenances commencées), durée cumulée des
+    réparations (maintenances terminées) et durée cumulée de fonctionnement entre la fin
+    d'une maintenance et le début de la suivante.
+    """
+    __tablename__ = "RadioFiabilite"
+    
+    id_radio = Column(Integer, ForeignKey("Radio.id"), primary_key=True)
+    pannes = Column(Integer, default=0, nullable=False)
+    reparations = Column(Integer, default=0, nullable=False)
+    duree_reparation = Column(Float, default=0, nullable=False)  # secondes
+    intervalles = Column(Integer, default=0, nullable=False)  # Pannes précédées d'une réparation
+    duree_fonctionnement = Column(Float, default=0, nullable=False)  # secondes
+    derniere_fin = Column(DateTime, nullable=True)  # Fin de la dernière maintenance terminée
+
 # Définition des triggers
 
 # Trigger pour générer le code barre des radios
@@ -218,6 +371,404 @@ update_radio_maintenance_update_trigger = DDL(
     """
 )
 
+# Triggers de maintien du modèle de lecture RadioEtat
+radio_etat_triggers = [
+    # Nouvelle radio : création de sa ligne d'état
+    DDL(
+        """
+        CREATE TRIGGER IF NOT EXISTS radio_etat_radio_insert
+        AFTER INSERT ON Radio
+        FOR EACH ROW
+        BEGIN
+            INSERT OR IGNORE INTO RadioEtat (id_radio, en_maintenance, date_changement)
+            VALUES (NEW.id, NEW.en_maintenance, COALESCE(NEW.date_creation, datetime('now', 'localtime')));
+        END;
+        """
+    ),
+    # Suppression d'une radio : suppression de sa ligne d'état
+    DDL(
+        """
+        CREATE TRIGGER IF NOT EXISTS radio_etat_radio_delete
+        AFTER DELETE ON Radio
+        FOR EACH ROW
+        BEGIN
+            DELETE FROM RadioEtat WHERE id_radio = OLD.id;
+        END;
+        """
+    ),
+    # Emprunt : la radio passe en prêt
+    DDL(
+        """
+        CREATE TRIGGER IF NOT EXISTS radio_etat_pret_insert
+        AFTER INSERT ON Pret
+        FOR EACH ROW
+        WHEN NEW.date_retour IS NULL
+        BEGIN
+            UPDATE RadioEtat
+            SET id_pret = NEW.id,
+                id_personne = NEW.id_personne,
+                date_emprunt = NEW.date_emprunt,
+                date_changement = NEW.date_emprunt
+            WHERE id_radio = NEW.id_radio;
+        END;
+        """
+    ),
+    # Retour : la radio n'est plus en prêt
+    DDL(
+        """
+        CREATE TRIGGER IF NOT EXISTS radio_etat_pret_retour
+        AFTER UPDATE OF date_retour ON Pret
+        FOR EACH ROW
+        WHEN OLD.date_retour IS NULL AND NEW.date_retour IS NOT NULL
+        BEGIN
+            UPDATE RadioEtat
+            SET id_pret = NULL,
+                id_personne = NULL,
+                date_emprunt = NULL,
+                date_changement = NEW.date_retour
+            WHERE id_radio = NEW.id_radio AND id_pret = NEW.id;
+        END;
+        """
+    ),
+    # Suppression d'un prêt actif
+    DDL(
+        """
+        CREATE TRIGGER IF NOT EXISTS radio_etat_pret_delete
+        AFTER DELETE ON Pret
+        FOR EACH ROW
+        WHEN OLD.date_retour IS NULL
+        BEGIN
+            UPDATE RadioEtat
+            SET id_pret = NULL,
+                id_personne = NULL,
+                date_emprunt = NULL,
+                date_changement = datetime('now', 'localtime')
+            WHERE id_radio = OLD.id_radio AND id_pret = OLD.id;
+        END;
+        """
+    ),
+    # Début de maintenance
+    DDL(
+        """
+        CREATE TRIGGER IF NOT EXISTS radio_etat_maintenance_insert
+        AFTER INSERT ON Maintenance
+        FOR EACH ROW
+        WHEN NEW.date_fin IS NULL
+        BEGIN
+            UPDATE RadioEtat
+            SET en_maintenance = 1,
+                date_changement = NEW.date_debut
+            WHERE id_radio = NEW.id_radio;
+        END;
+        """
+    ),
+    # Fin de maintenance : la radio reste en maintenance si une autre maintenance est active
+    DDL(
+        """
+        CREATE TRIGGER IF NOT EXISTS radio_etat_maintenance_fin
+        AFTER UPDATE OF date_fin ON Maintenance
+        FOR EACH ROW
+        WHEN OLD.date_fin IS NULL AND NEW.date_fin IS NOT NULL
+        BEGIN
+            UPDATE RadioEtat
+            SET en_maintenance = EXISTS (
+                    SELECT 1 FROM Maintenance
+                    WHERE id_radio = NEW.id_radio AND date_fin IS NULL
+                ),
+                date_changement = NEW.date_fin
+            WHERE id_radio = NEW.id_radio;
+        END;
+        """
+    ),
+]
+
+# Remplissage initial de RadioEtat à partir des prêts actifs existants
+radio_etat_backfill = text(
+    """
+    INSERT OR IGNORE INTO RadioEtat (id_radio, id_pret, id_personne, date_emprunt, en_maintenance, date_changement)
+    SELECT r.id, p.id, p.id_personne, p.date_emprunt, r.en_maintenance,
+           COALESCE(p.date_emprunt, r.date_modification, r.date_creation, datetime('now', 'localtime'))
+    FROM Radio r
+    LEFT JOIN Pret p ON p.id = (
+        SELECT id FROM Pret
+        WHERE id_radio = r.id AND date_retour IS NULL
+        ORDER BY date_emprunt DESC
+        LIMIT 1
+    )
+    """
+)
+
+def install_radio_etat(connection):
+    # Installation des triggers puis calcul de l'état courant (étape de migration, idempotente)
+    RadioEtat.__table__.create(connection, checkfirst=True)
+    for trigger in radio_etat_triggers:
+        connection.execute(trigger)
+    connection.execute(radio_etat_backfill)
+
+# Triggers de maintien de l'agrégat PretActiviteJour
+# Les prêts déplacés vers Pret_archive restent comptés (pas de décrément à l'archivage).
+pret_activite_triggers = [
+    # Nouveau prêt : un emprunt (et un retour s'il est saisi déjà rendu)
+    DDL(
+        """
+        CREATE TRIGGER IF NOT EXISTS pret_activite_insert
+        AFTER INSERT ON Pret
+        FOR EACH ROW
+        BEGIN
+            INSERT INTO PretActiviteJour (jour, emprunts, retours)
+            VALUES (date(NEW.date_emprunt), 1, 0)
+            ON CONFLICT(jour) DO UPDATE SET emprunts = emprunts + 1;
+            INSERT INTO PretActiviteJour (jour, emprunts, retours)
+            SELECT date(NEW.date_retour), 0, 1 WHERE NEW.date_retour IS NOT NULL
+            ON CONFLICT(jour) DO UPDATE SET retours = retours + 1;
+        END;
+        """
+    ),
+    # Retour ou correction des dates : retrait des anciens jours, ajout des nouveaux
+    DDL(
+        """
+        CREATE TRIGGER IF NOT EXISTS pret_activite_update
+        AFTER UPDATE OF date_emprunt, date_retour ON Pret
+        FOR EACH ROW
+        BEGIN
+            UPDATE PretActiviteJour SET emprunts = emprunts - 1
+            WHERE jour = date(OLD.date_emprunt);
+            INSERT INTO PretActiviteJour (jour, emprunts, retours)
+            VALUES (date(NEW.date_emprunt), 1, 0)
+            ON CONFLICT(jour) DO UPDATE SET emprunts = emprunts + 1;
+            UPDATE PretActiviteJour SET retours = retours - 1
+            WHERE OLD.date_retour IS NOT NULL AND jour = date(OLD.date_retour);
+            INSERT INTO PretActiviteJour (jour, emprunts, retours)
+            SELECT date(NEW.date_retour), 0, 1 WHERE NEW.date_retour IS NOT NULL
+            ON CONFLICT(jour) DO UPDATE SET retours = retours + 1;
+        END;
+        """
+    ),
+    # Suppression d'un prêt (hors archivage)
+    DDL(
+        """
+        CREATE TRIGGER IF NOT EXISTS pret_activite_delete
+        AFTER DELETE ON Pret
+        FOR EACH ROW
+        WHEN NOT EXISTS (SELECT 1 FROM Pret_archive WHERE id = OLD.id)
+        BEGIN
+            UPDATE PretActiviteJour SET emprunts = emprunts - 1
+            WHERE jour = date(OLD.date_emprunt);
+            UPDATE PretActiviteJour SET retours = retours - 1
+            WHERE OLD.date_retour IS NOT NULL AND jour = date(OLD.date_retour);
+        END;
+        """
+    ),
+]
+
+# Recalcul complet de l'agrégat à partir des prêts courants et archivés
+pret_activite_rebuild = [
+    text("DELETE FROM PretActiviteJour"),
+    text(
+        """
+        INSERT INTO PretActiviteJour (jour, emprunts, retours)
+        SELECT jour, SUM(emprunts), SUM(retours)
+        FROM (
+            SELECT date(date_emprunt) AS jour, 1 AS emprunts, 0 AS retours FROM Pret
+            UNION ALL
+            SELECT date(date_retour), 0, 1 FROM Pret WHERE date_retour IS NOT NULL
+            UNION ALL
+            SELECT date(date_emprunt), 1, 0 FROM Pret_archive
+            UNION ALL
+            SELECT date(date_retour), 0, 1 FROM Pret_archive
+        )
+        GROUP BY jour
+        """
+    ),
+]
+
+def rebuild_pret_activite(connection):
+    # Remplissage initial ou correction de l'agrégat (commande : python database.py activite)
+    for statement in pret_activite_rebuild:
+        connection.execute(statement)
+
+def install_pret_activite(connection):
+    # Installation des triggers puis calcul de l'agrégat (étape de migration, idempotente)
+    PretActiviteJour.__table__.create(connection, checkfirst=True)
+    for trigger in pret_activite_triggers:
+        connection.execute(trigger)
+    rebuild_pret_activite(connection)
+
+# Triggers de maintien des compteurs RadioFiabilite
+# Le temps de fonctionnement d'une panne est compté depuis la fin de la dernière maintenance
+# terminée : une maintenance saisie a posteriori, avant d'autres, fausse ce temps jusqu'au
+# prochain recalcul (python database.py fiabilite).
+radio_fiabilite_triggers = [
+    # Début de maintenance : une panne (et une réparation si elle est saisie déjà terminée)
+    DDL(
+        """
+        CREATE TRIGGER IF NOT EXISTS radio_fiabilite_maintenance_insert
+        AFTER INSERT ON Maintenance
+        FOR EACH ROW
+        BEGIN
+            INSERT INTO RadioFiabilite (id_radio, pannes, reparations, duree_reparation, intervalles, duree_fonctionnement)
+            VALUES (NEW.id_radio, 1, 0, 0, 0, 0)
+            ON CONFLICT(id_radio) DO UPDATE SET
+                pannes = pannes + 1,
+                intervalles = intervalles + (derniere_fin IS NOT NULL),
+                duree_fonctionnement = duree_fonctionnement + COALESCE(
+                    MAX((julianday(NEW.date_debut) - julianday(derniere_fin)) * 86400.0, 0), 0
+                );
+            UPDATE RadioFiabilite
+            SET reparations = reparations + 1,
+                duree_reparation = duree_reparation + (julianday(NEW.date_fin) - julianday(NEW.date_debut)) * 86400.0,
+                derniere_fin = MAX(COALESCE(derniere_fin, NEW.date_fin), NEW.date_fin)
+            WHERE id_radio = NEW.id_radio AND NEW.date_fin IS NOT NULL;
+        END;
+        """
+    ),
+    # Fin de maintenance : une réparation
+    DDL(
+        """
+        CREATE TRIGGER IF NOT EXISTS radio_fiabilite_maintenance_fin
+        AFTER UPDATE OF date_fin ON Maintenance
+        FOR EACH ROW
+        WHEN OLD.date_fin IS NULL AND NEW.date_fin IS NOT NULL
+        BEGIN
+            UPDATE RadioFiabilite
+            SET reparations = reparations + 1,
+                duree_reparation = duree_reparation + (julianday(NEW.date_fin) - julianday(NEW.date_debut)) * 86400.0,
+                derniere_fin = MAX(COALESCE(derniere_fin, NEW.date_fin), NEW.date_fin)
+            WHERE id_radio = NEW.id_radio;
+        END;
+        """
+    ),
+    # Suppression d'une radio : suppression de ses compteurs
+    DDL(
+        """
+        CREATE TRIGGER IF NOT EXISTS radio_fiabilite_radio_delete
+        AFTER DELETE ON Radio
+        FOR EACH ROW
+        BEGIN
+            DELETE FROM RadioFiabilite WHERE id_radio = OLD.id;
+        END;
+        """
+    ),
+]
+
+# Recalcul complet des compteurs à partir de l'historique des maintenances
+# (fin_precedente : dernière fin parmi les maintenances commencées avant, comme le trigger)
+radio_fiabilite_rebuild = [
+    text("DELETE FROM RadioFiabilite"),
+    text(
+        """
+        INSERT INTO RadioFiabilite (id_radio, pannes, reparations, duree_reparation, intervalles, duree_fonctionnement, derniere_fin)
+        SELECT id_radio,
+               COUNT(*),
+               COUNT(date_fin),
+               COALESCE(SUM((julianday(date_fin) - julianday(date_debut)) * 86400.0), 0),
+               COUNT(fin_precedente),
+               COALESCE(SUM(MAX((julianday(date_debut) - julianday(fin_precedente)) * 86400.0, 0)), 0),
+               MAX(date_fin)
+        FROM (
+            SELECT id_radio, date_debut, date_fin,
+                   MAX(date_fin) OVER (
+                       PARTITION BY id_radio ORDER BY date_debut, id
+                       ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING
+                   ) AS fin_precedente
+            FROM Maintenance
+        )
+        GROUP BY id_radio
+        """
+    ),
+]
+
+def rebuild_radio_fiabilite(connection):
+    # Remplissage initial ou correction des compteurs (commande : python database.py fiabilite)
+    for statement in radio_fiabilite_rebuild:
+        connection.execute(statement)
+
+def install_radio_fiabilite(connection):
+    # Installation des triggers puis calcul des compteurs (étape de migration, idempotente)
+    RadioFiabilite.__table__.create(connection, checkfirst=True)
+    for trigger in radio_fiabilite_triggers:
+        connection.execute(trigger)
+    rebuild_radio_fiabilite(connection)
+
+# Index de recherche plein texte (FTS5)
+# Table FTS -> (table source, colonnes indexées, condition d'indexation)
+# Les tables FTS conservent leur propre copie du texte : les triggers relisent la ligne
+# source (et non NEW) afin de rester cohérents quel que soit l'ordre d'exécution des
+# triggers, notamment avec ceux qui génèrent les codes-barres juste après l'insertion.
+SEARCH_INDEXES = {
+    "radio_fts": ("Radio", ("code_barre", "marque", "modele"), None),
+    "personne_fts": ("Personne", ("code_barre", "nom", "prenom"), None),
+    "pret_fts": ("Pret", ("commentaire",), "commentaire IS NOT NULL"),
+    "maintenance_fts": ("Maintenance", ("description", "operateur"), None),
+}
+
+def search_index_ddl(fts_table):
+    source, columns, condition = SEARCH_INDEXES[fts_table]
+    cols = ", ".join(columns)
+    where = f" AND {condition}" if condition else ""
+    refresh = f"""
+            DELETE FROM {fts_table} WHERE rowid = NEW.id;
+            INSERT INTO {fts_table} (rowid, {cols})
+            SELECT id, {cols} FROM {source} WHERE id = NEW.id{where};"""
+    return [
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table}
+        USING fts5({cols}, tokenize = 'unicode61 remove_diacritics 2')
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {fts_table}_insert
+        AFTER INSERT ON {source}
+        FOR EACH ROW
+        BEGIN{refresh}
+        END;
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {fts_table}_update
+        AFTER UPDATE OF {cols} ON {source}
+        FOR EACH ROW
+        BEGIN{refresh}
+        END;
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {fts_table}_delete
+        AFTER DELETE ON {source}
+        FOR EACH ROW
+        BEGIN
+            DELETE FROM {fts_table} WHERE rowid = OLD.id;
+        END;
+        """,
+        # Indexation des lignes déjà présentes
+        f"""
+        INSERT INTO {fts_table} (rowid, {cols})
+        SELECT id, {cols} FROM {source}{' WHERE ' + condition if condition else ''}
+        """,
+    ]
+
+# Les prêts archivés restent dans pret_fts (même identifiant) pour la recherche dans l'historique
+pret_fts_delete_trigger = DDL(
+    """
+    CREATE TRIGGER IF NOT EXISTS pret_fts_delete
+    AFTER DELETE ON Pret
+    FOR EACH ROW
+    WHEN NOT EXISTS (SELECT 1 FROM Pret_archive WHERE id = OLD.id)
+    BEGIN
+        DELETE FROM pret_fts WHERE rowid = OLD.id;
+    END;
+    """
+)
+
+def install_search_indexes(connection):
+    # Création et remplissage initial des tables FTS absentes (étape de migration, idempotente)
+    for fts_table in SEARCH_INDEXES:
+        exists = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": fts_table}
+        ).first()
+        if exists:
+            continue
+        for statement in search_index_ddl(fts_table):
+            connection.execute(text(statement))
+
 # Enregistrement des triggers après la création des tables
 event.listen(Radio.__table__, 'after_create', radio_code_barre_trigger)
 event.listen(Personne.__table__, 'after_create', personne_code_barre_trigger)
@@ -225,6 +776,9 @@ event.listen(Maintenance.__table__, 'after_create', update_radio_maintenance_add
 event.listen(Maintenance.__table__, 'after_create', update_radio_maintenance_update_trigger)
 
 # Fonction pour récupérer une session de base de données
+# La session est synchrone : les routes et dépendances qui l'utilisent sont déclarées
+# avec `def` (et non `async def`) pour que FastAPI les exécute dans son pool de threads
+# au lieu de bloquer la boucle d'événements pendant les requêtes SQL.
 def get_db():
     db = SessionLocal()
     try:
@@ -239,43 +793,36 @@ def create_tables():
 # Fonction pour exécuter des commandes SQL directement
 def execute_sql(sql):
     with engine.connect() as conn:
-        conn.execute(sql)
+        conn.execute(text(sql))
         conn.commit()
 
 # Fonction pour vérifier et mettre à jour le schéma si nécessaire
+# Les migrations sont versionnées (table schema_version, voir migrations.py) : une fois la
+# base à jour, le démarrage se limite à la lecture du numéro de version.
 def init_db():
-    # Création des tables si elles n'existent pas déjà
-    create_tables()
-    
-    # Mettre à jour la structure de la table Radio si nécessaire
-    try:
-        # Vérifier si la colonne accessoires existe encore dans la table Radio
-        execute_sql("SELECT accessoires FROM Radio LIMIT 1")
-        # Si aucune exception n'est levée, cela signifie que la colonne existe encore
-        # On exécute la migration pour la retirer
-        print("Migration: suppression de la colonne accessoires de la table Radio")
-        execute_sql("ALTER TABLE Radio DROP COLUMN accessoires")
-    except Exception:
-        # La colonne n'existe pas ou a déjà été supprimée
-        pass
+    from migrations import run_migrations
     
-    # Vérifier si la colonne accessoires existe dans la table Pret
-    try:
-        execute_sql("SELECT accessoires FROM Pret LIMIT 1")
-        # Si aucune exception n'est levée, la colonne existe déjà
-    except Exception:
-        # La colonne n'existe pas, on l'ajoute
-        print("Migration: ajout de la colonne accessoires à la table Pret")
-        execute_sql("""
-            ALTER TABLE Pret 
-            ADD COLUMN accessoires TEXT 
-            CHECK(accessoires IN ('oreillettes', 'micro', 'les deux', 'aucun')) 
-            NOT NULL 
-            DEFAULT 'aucun'
-        """)
+    applied = run_migrations()
+    for version, description in applied:
+        print(f"Migration {version}: {description}")
     
-    print("Base de données initialisée avec succès.")
+    if applied:
+        print("Base de données initialisée avec succès.")
 
 # Si ce fichier est exécuté directement, initialiser la base de données
+# `python database.py activite` recalcule en plus l'agrégat PretActiviteJour,
+# `python database.py fiabilite` les compteurs RadioFiabilite
 if __name__ == "__main__":
-    init_db()
\ No newline at end of file
+    import sys
+    
+    init_db()
+    
+    if "activite" in sys.argv[1:]:
+        with engine.begin() as conn:
+            rebuild_pret_activite(conn)
+        print("Agrégat d'activité des prêts recalculé.")
+    
+    if "fiabilite" in sys.argv[1:]:
+        with engine.begin() as conn:
+            rebuild_radio_fiabilite(conn)
+        print("Compteurs de fiabilité des radios recalculés.")
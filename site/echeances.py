@@ -0,0 +1,163 @@
+import heapq
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+from database import SessionLocal, Pret, Personne, Equipe
+
+# Échéances des prêts et suivi des retards
+# Chaque prêt reçoit à sa création une date d'échéance : date d'emprunt + durée de prêt
+# maximale de l'équipe de l'emprunteur (Equipe.duree_pret_heures, DUREE_PRET_DEFAUT si
+# elle n'est pas renseignée). Le statut "en retard" se lit alors sur l'index partiel
+# idx_pret_echeance_actif au lieu de recalculer date_emprunt < maintenant - 7 jours.
+# Les prêts actifs sont aussi tenus en mémoire dans un tas (min-heap) trié par échéance :
+# un thread se réveille à la prochaine échéance et fait passer les prêts concernés dans
+# l'ensemble des prêts en retard, lu tel quel par /api/prets/overdue.
+# Le tas est propre à chaque processus : les créations / retours de ce processus y sont
+# reportés immédiatement, ceux des autres workers au rechargement périodique (depuis
+# l'index partiel, donc en lisant les seuls prêts actifs).
+# Configuration :
+# - RADIOTRACK_DUREE_PRET_HEURES : durée de prêt par défaut (défaut 168, soit 7 jours)
+# - RADIOTRACK_ECHEANCES_RESYNC_SECONDES : période de rechargement du tas (défaut 60)
+
+DUREE_PRET_DEFAUT = float(os.getenv("RADIOTRACK_DUREE_PRET_HEURES", "168"))
+ECHEANCES_RESYNC = float(os.getenv("RADIOTRACK_ECHEANCES_RESYNC_SECONDES", "60"))
+
+def duree_pret(db: Session, id_personne: int):
+    """Durée de prêt maximale applicable à une personne (selon son équipe)"""
+    heures = db.query(Equipe.duree_pret_heures).join(
+        Personne, Personne.id_equipe == Equipe.id
+    ).filter(Personne.id == id_personne).scalar()
+    return timedelta(hours=heures if heures is not None else DUREE_PRET_DEFAUT)
+
+
+class EcheanceScheduler:
+    """Tas des échéances des prêts actifs et ensemble des prêts en retard"""
+
+    def __init__(self):
+        self._heap = []          # (échéance, id du prêt), suppression paresseuse
+        self._echeances = {}     # Prêts actifs pas encore en retard : id -> échéance
+        self._overdue = {}       # Prêts en retard : id -> échéance
+        self._loaded = False
+        self._condition = threading.Condition()
+
+    def load(self, db: Session):
+        """(Re)charge les prêts actifs depuis la base"""
+        rows = db.execute(
+            select(Pret.id, Pret.date_echeance).where(
+                Pret.date_retour.is_(None),
+                Pret.date_echeance.isnot(None)
+            )
+        ).all()
+        with self._condition:
+            self._echeances = {row.id: row.date_echeance for row in rows}
+            self._overdue = {}
+            self._heap = [(echeance, pret_id) for pret_id, echeance in self._echeances.items()]
+            heapq.heapify(self._heap)
+            self._loaded = True
+            self._condition.notify()
+
+    def schedule(self, pret_id: int, echeance: Optional[datetime]):
+        """Enregistre (ou remplace) l'échéance d'un prêt actif"""
+        with self._condition:
+            self._overdue.pop(pret_id, None)
+            if echeance is None:
+                self._echeances.pop(pret_id, None)
+                return
+            self._echeances[pret_id] = echeance
+            heapq.heappush(self._heap, (echeance, pret_id))
+            self._condition.notify()
+
+    def cancel(self, pret_id: int):
+        """Retire un prêt rendu (son entrée du tas est ignorée quand elle en sort)"""
+        with self._condition:
+            self._echeances.pop(pret_id, None)
+            self._overdue.pop(pret_id, None)
+
+    def _advance(self, now: datetime):
+        # Fait passer en retard les prêts dont l'échéance est atteinte
+        while self._heap and self._heap[0][0] <= now:
+            echeance, pret_id = heapq.heappop(self._heap)
+            if self._echeances.get(pret_id) == echeance:
+                del self._echeances[pret_id]
+                self._overdue[pret_id] = echeance
+
+    def overdue(self):
+        """Prêts en retard : liste (id, échéance) triée par échéance"""
+        if not self._loaded:
+            db = SessionLocal()
+            try:
+                self.load(db)
+            finally:
+                db.close()
+        with self._condition:
+            self._advance(datetime.now())
+            return sorted(self._overdue.items(), key=lambda item: item[1])
+
+    def run(self, stop: threading.Event):
+        resync = datetime.now()
+        while not stop.is_set():
+            now = datetime.now()
+            if now >= resync:
+                try:
+                    db = SessionLocal()
+                    try:
+                        self.load(db)
+                    finally:
+                        db.close()
+                except Exception as e:
+                    print(f"Erreur lors du chargement des échéances de prêt: {e}")
+                resync = now + timedelta(seconds=ECHEANCES_RESYNC)
+
+            with self._condition:
+                self._advance(now)
+                # Réveil à la prochaine échéance, au prochain rechargement ou à un nouvel ajout
+                reveil = resync
+                if self._heap:
+                    reveil = min(reveil, self._heap[0][0])
+                self._condition.wait(max((reveil - datetime.now()).total_seconds(), 0.01))
+
+
+scheduler = EcheanceScheduler()
+
+def start_echeance_scheduler():
+    """Lance le suivi des échéances dans un thread de fond (une fois par processus)"""
+    stop = threading.Event()
+    threading.Thread(target=scheduler.run, args=(stop,), name="echeances-prets", daemon=True).start()
+    return stop
+
+def reschedule_prets(db: Session, prets, duree: timedelta):
+    """Enregistre la nouvelle échéance (date d'emprunt + duree) de prêts actifs (id, date_emprunt)"""
+    for pret in prets:
+        db.execute(
+            update(Pret).where(Pret.id == pret.id).values(date_echeance=pret.date_emprunt + duree)
+        )
+    db.commit()
+    for pret in prets:
+        scheduler.schedule(pret.id, pret.date_emprunt + duree)
+
+def reschedule_equipe(db: Session, equipe_id: int):
+    """Recalcule l'échéance des prêts actifs des membres d'une équipe (durée de prêt modifiée)"""
+    duree = db.query(Equipe.duree_pret_heures).filter(Equipe.id == equipe_id).scalar()
+    duree = timedelta(hours=duree if duree is not None else DUREE_PRET_DEFAUT)
+    prets = db.execute(
+        select(Pret.id, Pret.date_emprunt).join(
+            Personne, Pret.id_personne == Personne.id
+        ).where(
+            Personne.id_equipe == equipe_id,
+            Pret.date_retour.is_(None)
+        )
+    ).all()
+    reschedule_prets(db, prets, duree)
+
+def reschedule_personne(db: Session, personne_id: int):
+    """Recalcule l'échéance des prêts actifs d'une personne (changement d'équipe)"""
+    prets = db.execute(
+        select(Pret.id, Pret.date_emprunt).where(
+            Pret.id_personne == personne_id,
+            Pret.date_retour.is_(None)
+        )
+    ).all()
+    reschedule_prets(db, prets, duree_pret(db, personne_id))
@@ -0,0 +1,194 @@
+import csv
+import os
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from io import StringIO
+from sqlalchemy import select, func
+from database import SessionLocal
+
+# Production des exports CSV
+# - csv_chunks : génération par lots depuis un curseur serveur (réponse en streaming),
+#   éventuellement compressée à la volée (gzip_chunks)
+# - tâches d'export : le fichier est écrit en arrière-plan par un pool de threads, son
+#   avancement est consultable, puis il est téléchargeable (requêtes Range acceptées)
+#   jusqu'à son expiration.
+# Les tâches sont propres à chaque processus (comme le cache, voir cache.py) : avec
+# plusieurs workers uvicorn, le suivi et le téléchargement doivent viser le même worker.
+# Configuration :
+# - RADIOTRACK_EXPORT_DIR : répertoire des fichiers produits (défaut : répertoire temporaire)
+# - RADIOTRACK_EXPORT_WORKERS : nombre d'exports simultanés (défaut 2)
+# - RADIOTRACK_EXPORT_TTL_MINUTES : durée de conservation d'un export terminé (défaut 60)
+
+EXPORT_LOT = 1000  # Lignes lues par aller-retour et écrites par morceau
+EXPORT_DIR = os.getenv("RADIOTRACK_EXPORT_DIR", os.path.join(tempfile.gettempdir(), "radiotrack_exports"))
+EXPORT_WORKERS = int(os.getenv("RADIOTRACK_EXPORT_WORKERS", "2"))
+EXPORT_TTL = timedelta(minutes=float(os.getenv("RADIOTRACK_EXPORT_TTL_MINUTES", "60")))
+
+def csv_chunks(statement, header, format_row, progress=None):
+    """
+    Générateur du contenu CSV de `statement` : les lignes sont lues par lots et chaque lot
+    est renvoyé sous forme de texte (mémoire constante quel que soit le nombre de lignes).
+    Utilise sa propre session : il peut être consommé après la fin du gestionnaire de la
+    requête ou dans un autre thread. `progress(n)` est appelé après chaque lot de n lignes.
+    """
+    output = StringIO()
+    writer = csv.writer(output)
+    writer.writerow(header)
+
+    now = datetime.now()
+    db = SessionLocal()
+    try:
+        result = db.execute(statement.execution_options(yield_per=EXPORT_LOT))
+        for rows in result.partitions():
+            for row in rows:
+                writer.writerow(format_row(row, now))
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate(0)
+            if progress:
+                progress(len(rows))
+        yield output.getvalue()
+    finally:
+        db.close()
+
+def gzip_chunks(chunks, level: int = 6):
+    """Compresse au format gzip, morceau par morceau, le texte produit par `chunks` (csv_chunks)"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+def count_statement(statement):
+    """Nombre de lignes renvoyées par `statement`"""
+    db = SessionLocal()
+    try:
+        return db.execute(
+            select(func.count()).select_from(statement.order_by(None).subquery())
+        ).scalar()
+    finally:
+        db.close()
+
+
+class ExportJob:
+    """Tâche d'export CSV exécutée en arrière-plan"""
+
+    def __init__(self, type_export: str, id_user: int, filename: str):
+        self.id = uuid.uuid4().hex
+        self.type = type_export
+        self.id_user = id_user
+        self.filename = filename
+        self.statut = "en_attente"
+        self.lignes_total = None
+        self.lignes_ecrites = 0
+        self.erreur = None
+        self.annule = False
+        self.date_creation = datetime.now()
+        self.date_fin = None
+        self.path = os.path.join(EXPORT_DIR, f"{self.id}.csv")
+
+    def to_dict(self):
+        progression = None
+        if self.statut == "termine":
+            progression = 100
+        elif self.lignes_total:
+            progression = min(99, int(100 * self.lignes_ecrites / self.lignes_total))
+        return {
+            "id": self.id,
+            "type": self.type,
+            "statut": self.statut,
+            "lignes_total": self.lignes_total,
+            "lignes_ecrites": self.lignes_ecrites,
+            "progression": progression,
+            "taille": os.path.getsize(self.path) if self.statut == "termine" else None,
+            "erreur": self.erreur,
+            "date_creation": self.date_creation,
+            "date_fin": self.date_fin,
+            "date_expiration": self.date_fin + EXPORT_TTL if self.date_fin else None,
+        }
+
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=EXPORT_WORKERS, thread_name_prefix="export")
+
+def submit_export(type_export: str, id_user: int, filename: str, statement, header, format_row):
+    """Enregistre une tâche d'export et la confie au pool de threads"""
+    purge_expired()
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+
+    job = ExportJob(type_export, id_user, filename)
+    with _jobs_lock:
+        _jobs[job.id] = job
+    _executor.submit(_run_export, job, statement, header, format_row)
+    return job
+
+def _run_export(job: ExportJob, statement, header, format_row):
+    job.statut = "en_cours"
+    partial = job.path + ".part"
+
+    def progress(count):
+        job.lignes_ecrites += count
+        if job.annule:
+            raise RuntimeError("Export annulé")
+
+    try:
+        job.lignes_total = count_statement(statement)
+        with open(partial, "w", encoding="utf-8", newline="") as f:
+            for chunk in csv_chunks(statement, header, format_row, progress):
+                f.write(chunk)
+        # Le fichier n'apparaît sous son nom définitif qu'une fois complet
+        os.replace(partial, job.path)
+        job.statut = "termine"
+    except Exception as e:
+        job.statut = "erreur"
+        job.erreur = str(e)
+        if os.path.exists(partial):
+            os.remove(partial)
+    finally:
+        job.date_fin = datetime.now()
+
+def get_job(job_id: str, id_user: int):
+    """Tâche `job_id` de l'utilisateur, None si inconnue, expirée ou appartenant à un autre utilisateur"""
+    purge_expired()
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is None or job.id_user != id_user:
+        return None
+    return job
+
+def delete_job(job: ExportJob):
+    # Un export en cours s'interrompt au lot suivant et supprime son fichier partiel
+    job.annule = True
+    with _jobs_lock:
+        _jobs.pop(job.id, None)
+    if job.statut in ("termine", "erreur") and os.path.exists(job.path):
+        os.remove(job.path)
+
+def purge_expired():
+    """Supprime les tâches terminées depuis plus de EXPORT_TTL et leurs fichiers"""
+    limite = datetime.now() - EXPORT_TTL
+    with _jobs_lock:
+        expired = [job for job in _jobs.values() if job.date_fin and job.date_fin < limite]
+        for job in expired:
+            del _jobs[job.id]
+    for job in expired:
+        if os.path.exists(job.path):
+            os.remove(job.path)
+
+    # Fichiers laissés par un processus précédent
+    if os.path.isdir(EXPORT_DIR):
+        seuil = time.time() - EXPORT_TTL.total_seconds()
+        for name in os.listdir(EXPORT_DIR):
+            path = os.path.join(EXPORT_DIR, name)
+            try:
+                if name.split(".")[0] not in _jobs and os.path.getmtime(path) < seuil:
+                    os.remove(path)
+            except OSError:
+                pass
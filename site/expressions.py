@@ -0,0 +1,29 @@
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.types import Float
+
+# Expressions SQL portables entre SQLite et PostgreSQL
+# SQLite n'a pas de type date natif (les dates sont stockées en texte) : EXTRACT(EPOCH ...)
+# n'y existe pas, la différence de deux dates se calcule avec julianday().
+
+class duree_entre(FunctionElement):
+    """
+    Durée en secondes entre deux dates : duree_entre(debut, fin).
+    Utilisable dans les agrégats (func.avg(duree_entre(...)), func.sum(...)) ; NULL si une
+    des deux dates est NULL (prêt ou maintenance en cours).
+    """
+    type = Float()
+    name = "duree_entre"
+    inherit_cache = True
+
+@compiles(duree_entre)
+def _duree_entre_default(element, compiler, **kw):
+    # PostgreSQL : la différence de deux timestamps est un intervalle
+    debut, fin = [compiler.process(clause, **kw) for clause in element.clauses]
+    return f"EXTRACT(EPOCH FROM ({fin} - {debut}))"
+
+@compiles(duree_entre, "sqlite")
+def _duree_entre_sqlite(element, compiler, **kw):
+    # SQLite : julianday() renvoie un nombre de jours fractionnaire
+    debut, fin = [compiler.process(clause, **kw) for clause in element.clauses]
+    return f"((julianday({fin}) - julianday({debut})) * 86400.0)"
@@ -0,0 +1,80 @@
+import numpy as np
+
+# Calculs sur des intervalles de temps (prêts) : temps occupé et prêts simultanés
+# Les intervalles sont donnés sous forme de tableaux NumPy (secondes depuis l'epoch) :
+# `starts`, `ends` et, pour les regroupements, l'indice de groupe de chaque intervalle.
+# Tous les calculs sont vectorisés (tri, cumul, recherche dichotomique), sans boucle
+# Python par intervalle.
+
+def index_of(values, ids, missing: int):
+    """Position de chaque valeur dans la liste d'identifiants `ids`, `missing` si absente (ou NaN)"""
+    ids = np.asarray(ids, dtype=np.int64)
+    lookup = np.full(int(ids.max()) + 1 if len(ids) else 1, missing, dtype=np.int64)
+    lookup[ids] = np.arange(len(ids))
+    values = np.nan_to_num(values, nan=-1).astype(np.int64)
+    known = (values >= 0) & (values < len(lookup))
+    result = np.full(len(values), missing, dtype=np.int64)
+    result[known] = lookup[values[known]]
+    return result
+
+def clip_intervals(starts, ends, t0: float, t1: float):
+    """
+    Restreint les intervalles à la fenêtre [t0, t1) ; une fin inconnue (NaN, prêt en cours)
+    est prolongée jusqu'à t1. Retourne (starts, ends, masque des intervalles non vides).
+    """
+    starts = np.clip(starts, t0, t1)
+    ends = np.clip(np.where(np.isnan(ends), t1, ends), t0, t1)
+    return starts, ends, ends > starts
+
+def busy_time(starts, ends, keys, n_keys: int):
+    """Durée totale couverte par les intervalles de chaque clé (indices 0..n_keys-1)"""
+    return np.bincount(keys, weights=ends - starts, minlength=n_keys)
+
+def sweep(starts, ends, groups):
+    """
+    Balayage des débuts (+1) et fins (-1) d'intervalles, groupe par groupe.
+    Retourne les événements triés (groupe, instant) et le nombre d'intervalles actifs
+    après chacun d'eux. Une fin et un début simultanés ne se cumulent pas (fin d'abord).
+    """
+    times = np.concatenate([starts, ends])
+    deltas = np.concatenate([np.ones(len(starts), dtype=np.int64), -np.ones(len(ends), dtype=np.int64)])
+    event_groups = np.concatenate([groups, groups])
+    order = np.lexsort((deltas, times, event_groups))
+    # Chaque groupe a autant de fins que de débuts : le cumul revient à 0 entre deux groupes
+    return event_groups[order], times[order], np.cumsum(deltas[order])
+
+def peak_concurrency(starts, ends, groups, n_groups: int):
+    """Nombre maximal d'intervalles simultanés de chaque groupe"""
+    peaks = np.zeros(n_groups, dtype=np.int64)
+    if len(starts):
+        event_groups, _, active = sweep(starts, ends, groups)
+        np.maximum.at(peaks, event_groups, active)
+    return peaks
+
+def concurrency_series(starts, ends, groups, n_groups: int, t0: float, t1: float, step: float):
+    """
+    Nombre maximal d'intervalles simultanés par groupe et par pas de temps sur [t0, t1).
+    Retourne (débuts des pas, tableau n_groups x nombre de pas).
+    """
+    grid = np.arange(t0, t1, step)
+    series = np.zeros((n_groups, len(grid)), dtype=np.int64)
+    if not len(starts) or not len(grid):
+        return grid, series
+
+    # Intervalles actifs au début de chaque pas : instants décalés par groupe pour traiter
+    # tous les groupes en une seule recherche dichotomique
+    width = (t1 - t0) + step
+    sorted_starts = np.sort(groups * width + (starts - t0))
+    sorted_ends = np.sort(groups * width + (ends - t0))
+    instants = (np.arange(n_groups)[:, None] * width + (grid - t0)[None, :]).ravel()
+    series[:] = (
+        np.searchsorted(sorted_starts, instants, side="right")
+        - np.searchsorted(sorted_ends, instants, side="right")
+    ).reshape(n_groups, len(grid))
+
+    # Pics atteints à l'intérieur de chaque pas
+    event_groups, times, active = sweep(starts, ends, groups)
+    buckets = ((times - t0) // step).astype(np.int64)
+    inside = buckets < len(grid)
+    np.maximum.at(series, (event_groups[inside], buckets[inside]), active[inside])
+    return grid, series
@@ -5,9 +5,13 @@ from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse, RedirectResponse
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta 
+from contextlib import asynccontextmanager
 import os
 
-from database import get_db, create_tables, User
+from database import get_db, init_db, User
+from archive import start_archive_scheduler
+from sketches import start_sketch_flusher, flush_sketches
+from echeances import start_echeance_scheduler
 from auth import (
     authenticate_user, create_access_token, get_current_active_user,
     ACCESS_TOKEN_EXPIRE_MINUTES, get_password_hash, UserCreate, Token
@@ -22,10 +26,28 @@ from routes.cfi import router as cfi_router    # Nouvelle importation pour les C
 from routes.etiquette import router as etiquette_router
 from routes.historique import router as historique_router
 from routes.maintenance import router as maintenance_router  # Nouvelle importation pour la maintenance
-
+from routes.export import router as export_router
+
+
+# Tâches de fond liées au cycle de vie de l'application
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Archivage périodique des prêts anciens (voir archive.py)
+    stop_archivage = start_archive_scheduler()
+    # Écriture périodique des sketches de durée des prêts (voir sketches.py)
+    stop_sketches = start_sketch_flusher()
+    # Passage en retard des prêts à leur échéance (voir echeances.py)
+    stop_echeances = start_echeance_scheduler()
+    yield
+    stop_echeances.set()
+    if stop_archivage:
+        stop_archivage.set()
+    if stop_sketches:
+        stop_sketches.set()
+    flush_sketches()
 
 # Création de l'application FastAPI
-app = FastAPI(title="Mon Application FastAPI")
+app = FastAPI(title="Mon Application FastAPI", lifespan=lifespan)
 
 # Ajout des routes API
 app.include_router(radio_router)
@@ -36,9 +58,10 @@ app.include_router(cfi_router)   # Ajout du routeur pour les CFIs
 app.include_router(etiquette_router)  # Ajout du routeur pour les étiquettes
 app.include_router(historique_router)
 app.include_router(maintenance_router)
+app.include_router(export_router)
 
-# Création des tables de base de données
-create_tables()
+# Création / mise à jour du schéma de la base de données (migrations versionnées)
+init_db()
 
 # Configuration des fichiers statiques et des templates
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -56,7 +79,7 @@ async def login_form(request: Request):
 
 # Route d'authentification (API)
 @app.post("/token")
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     user = authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
@@ -92,7 +115,7 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
 
 # Route d'inscription
 @app.post("/register")
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+def register(user_data: UserCreate, db: Session = Depends(get_db)):
     # Vérification si l'utilisateur existe déjà
     db_user = db.query(User).filter(User.username == user_data.username).first()
     if db_user:
@@ -0,0 +1,231 @@
+import time
+from datetime import datetime
+from sqlalchemy import text, update
+from sqlalchemy.exc import OperationalError
+from database import (
+    engine, Base, Pret, PretArchive, Maintenance, install_radio_etat, install_search_indexes,
+    pret_fts_delete_trigger, install_pret_activite, PretDureeSketch, install_radio_fiabilite
+)
+from sketches import rebuild_sketches
+from echeances import DUREE_PRET_DEFAUT
+from expressions import duree_entre
+
+# Migrations versionnées du schéma
+# Chaque étape est appliquée une seule fois, dans l'ordre, et son numéro est enregistré
+# dans la table schema_version. Les étapes restent idempotentes (vérification avant
+# modification) : sur une base neuve, l'étape 1 crée déjà le schéma complet.
+# Ne jamais renuméroter ni modifier une étape publiée : ajouter une nouvelle étape à la fin.
+
+MIGRATIONS = []
+
+def migration(version: int, description: str):
+    def register(step):
+        MIGRATIONS.append((version, description, step))
+        return step
+    return register
+
+# Fonctions utilitaires d'inspection du schéma
+def table_exists(conn, name: str):
+    return conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {"name": name}
+    ).first() is not None
+
+def column_names(conn, table: str):
+    return {row[1] for row in conn.execute(text(f'PRAGMA table_info("{table}")'))}
+
+def create_index(conn, table, name: str):
+    index = next(index for index in table.indexes if index.name == name)
+    index.create(conn, checkfirst=True)
+
+def check_prets_actifs_uniques(conn):
+    """
+    Vérifie qu'aucune radio n'a plusieurs prêts actifs avant de créer idx_pret_actif_unique.
+    Sinon la migration échoue (et n'est pas enregistrée) en listant les prêts en double,
+    à clôturer avant de relancer l'application.
+    """
+    doublons = conn.execute(text("""
+        SELECT id_radio, GROUP_CONCAT(id, ', ')
+        FROM Pret
+        WHERE date_retour IS NULL
+        GROUP BY id_radio
+        HAVING COUNT(*) > 1
+        ORDER BY id_radio
+    """)).all()
+    if doublons:
+        details = "; ".join(f"radio {id_radio} : prêts {ids}" for id_radio, ids in doublons)
+        raise RuntimeError(
+            f"Index idx_pret_actif_unique impossible à créer, plusieurs prêts actifs "
+            f"pour une même radio ({details}). Renseigner la date de retour des prêts "
+            f"en trop puis redémarrer l'application."
+        )
+
+@migration(1, "création des tables")
+def create_schema(conn):
+    Base.metadata.create_all(conn)
+
+@migration(2, "suppression de la colonne accessoires de la table Radio")
+def drop_radio_accessoires(conn):
+    if "accessoires" in column_names(conn, "Radio"):
+        conn.execute(text("ALTER TABLE Radio DROP COLUMN accessoires"))
+
+@migration(3, "ajout de la colonne accessoires à la table Pret")
+def add_pret_accessoires(conn):
+    if "accessoires" not in column_names(conn, "Pret"):
+        conn.execute(text("""
+            ALTER TABLE Pret
+            ADD COLUMN accessoires TEXT
+            CHECK(accessoires IN ('oreillettes', 'micro', 'les deux', 'aucun'))
+            NOT NULL
+            DEFAULT 'aucun'
+        """))
+
+@migration(4, "modèle de lecture RadioEtat")
+def add_radio_etat(conn):
+    install_radio_etat(conn)
+
+@migration(5, "index unique partiel sur les prêts actifs")
+def add_pret_actif_unique(conn):
+    check_prets_actifs_uniques(conn)
+    create_index(conn, Pret.__table__, "idx_pret_actif_unique")
+
+@migration(6, "index de recherche plein texte")
+def add_search_indexes(conn):
+    install_search_indexes(conn)
+
+@migration(7, "table d'archive des prêts")
+def add_pret_archive(conn):
+    PretArchive.__table__.create(conn, checkfirst=True)
+    conn.execute(text("DROP TRIGGER IF EXISTS pret_fts_delete"))
+    conn.execute(pret_fts_delete_trigger)
+
+@migration(8, "agrégat quotidien de l'activité des prêts")
+def add_pret_activite(conn):
+    install_pret_activite(conn)
+
+@migration(9, "sketches de durée des prêts")
+def add_pret_duree_sketch(conn):
+    PretDureeSketch.__table__.create(conn, checkfirst=True)
+    rebuild_sketches(conn)
+
+@migration(10, "index composites radio / date de début des prêts et maintenances")
+def add_radio_date_indexes(conn):
+    create_index(conn, Pret.__table__, "idx_pret_radio_emprunt")
+    create_index(conn, PretArchive.__table__, "idx_pret_archive_radio_emprunt")
+    create_index(conn, Maintenance.__table__, "idx_maintenance_radio_debut")
+
+@migration(11, "durée de prêt par équipe et échéance des prêts")
+def add_pret_echeance(conn):
+    if "duree_pret_heures" not in column_names(conn, "Equipe"):
+        conn.execute(text("ALTER TABLE Equipe ADD COLUMN duree_pret_heures INTEGER"))
+    for table in ("Pret", "Pret_archive"):
+        if "date_echeance" not in column_names(conn, table):
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN date_echeance DATETIME"))
+        # Échéance des prêts existants selon l'équipe actuelle de l'emprunteur
+        conn.execute(
+            text(f"""
+                UPDATE {table}
+                SET date_echeance = datetime(date_emprunt, '+' || COALESCE(
+                    (SELECT e.duree_pret_heures FROM Personne p JOIN Equipe e ON e.id = p.id_equipe
+                     WHERE p.id = {table}.id_personne),
+                    :defaut
+                ) || ' hours')
+                WHERE date_echeance IS NULL
+            """),
+            {"defaut": DUREE_PRET_DEFAUT}
+        )
+    create_index(conn, Pret.__table__, "idx_pret_echeance_actif")
+
+@migration(12, "durée des prêts rendus")
+def add_pret_duree(conn):
+    for model in (Pret, PretArchive):
+        table = model.__table__
+        if "duree_secondes" not in column_names(conn, table.name):
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN duree_secondes FLOAT"))
+        conn.execute(
+            update(table).where(
+                table.c.date_retour.isnot(None),
+                table.c.duree_secondes.is_(None)
+            ).values(duree_secondes=duree_entre(table.c.date_emprunt, table.c.date_retour))
+        )
+    create_index(conn, Pret.__table__, "idx_pret_duree")
+    create_index(conn, PretArchive.__table__, "idx_pret_archive_duree")
+
+@migration(13, "compteurs de fiabilité des radios")
+def add_radio_fiabilite(conn):
+    install_radio_fiabilite(conn)
+
+@migration(14, "index des accessoires des prêts")
+def add_pret_accessoires_index(conn):
+    create_index(conn, Pret.__table__, "idx_pret_accessoires_emprunt")
+    create_index(conn, PretArchive.__table__, "idx_pret_archive_accessoires_emprunt")
+
+@migration(15, "index unique partiel sur les prêts actifs (nouvelle tentative)")
+def retry_pret_actif_unique(conn):
+    # L'étape 5 pouvait être enregistrée sans l'index quand des prêts actifs étaient en double
+    check_prets_actifs_uniques(conn)
+    create_index(conn, Pret.__table__, "idx_pret_actif_unique")
+
+@migration(16, "fractions de seconde des échéances calculées par l'étape 11")
+def fix_pret_echeance_fraction(conn):
+    # datetime() de SQLite tronque à la seconde : l'échéance calculée par l'étape 11 perdait
+    # les microsecondes de la date d'emprunt. La durée de prêt ajoutée étant un nombre entier
+    # de secondes, la fraction de seconde de l'échéance est celle de la date d'emprunt.
+    for table in ("Pret", "Pret_archive"):
+        conn.execute(text(f"""
+            UPDATE {table}
+            SET date_echeance = date_echeance || substr(date_emprunt, 20)
+            WHERE length(date_echeance) = 19 AND length(date_emprunt) > 19
+        """))
+
+
+def current_version(conn):
+    if not table_exists(conn, "schema_version"):
+        return 0
+    return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_version")).scalar()
+
+def run_migrations(lock_retries: int = 60):
+    """
+    Applique les migrations manquantes et retourne la liste (version, description) appliquée.
+    Chemin rapide : une lecture de la version courante quand la base est à jour.
+    Les workers démarrant en même temps se sérialisent sur le verrou d'écriture SQLite :
+    le premier applique les migrations, les autres constatent ensuite qu'il n'y a plus rien à faire.
+    """
+    latest = MIGRATIONS[-1][0]
+    with engine.connect() as conn:
+        if current_version(conn) >= latest:
+            return []
+
+    for attempt in range(lock_retries):
+        try:
+            return _apply_pending()
+        except OperationalError as e:
+            if "locked" not in str(e) or attempt == lock_retries - 1:
+                raise
+            time.sleep(1)
+
+def _apply_pending():
+    applied = []
+    with engine.begin() as conn:
+        conn.execute(text("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                date_application DATETIME NOT NULL
+            )
+        """))
+        # Prise du verrou d'écriture avant de relire la version : toutes les étapes
+        # s'exécutent ensuite dans cette même transaction
+        conn.execute(text("UPDATE schema_version SET version = version WHERE 0"))
+        current = current_version(conn)
+
+        for version, description, step in MIGRATIONS:
+            if version <= current:
+                continue
+            step(conn)
+            conn.execute(
+                text("INSERT INTO schema_version (version, description, date_application) VALUES (:v, :d, :t)"),
+                {"v": version, "d": description, "t": datetime.now()}
+            )
+            applied.append((version, description))
+    return applied
@@ -0,0 +1,116 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+from fastapi import HTTPException, status
+from sqlalchemy import tuple_, func, inspect, select
+from cache import GenerationCache
+
+# Pagination par curseur (keyset) pour les listes
+# Le curseur est un jeton opaque contenant les colonnes et les valeurs de tri de la dernière
+# ligne renvoyée : la page suivante reprend directement après elle grâce à l'index, au lieu
+# de parcourir puis d'ignorer `skip` lignes comme le fait OFFSET.
+# Un curseur produit pour un autre tri (ex: sort=date puis sort=duree) ou dont les valeurs
+# n'ont pas le type des colonnes est refusé (400) plutôt que comparé à tort.
+# Les index secondaires SQLite contiennent implicitement l'id (rowid) : un index sur
+# (date_emprunt) sert donc aussi le tri (date_emprunt, id).
+
+def encode_cursor(columns, values):
+    payload = json.dumps({
+        "tri": [column.key for column in columns],
+        "valeurs": [{"dt": value.isoformat()} if isinstance(value, datetime) else value for value in values],
+    })
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def cursor_value_valid(column, value):
+    # Valeur du curseur compatible avec le type de la colonne de tri (un entier convient
+    # pour une colonne flottante ; NULL n'est jamais une position de curseur)
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value is not None
+    if python_type is float:
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    return isinstance(value, python_type) and not isinstance(value, bool)
+
+def decode_cursor(cursor: str, columns):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        values = [
+            datetime.fromisoformat(value["dt"]) if isinstance(value, dict) else value
+            for value in payload["valeurs"]
+        ]
+        valid = (
+            payload["tri"] == [column.key for column in columns]
+            and len(values) == len(columns)
+            and all(cursor_value_valid(column, value) for column, value in zip(columns, values))
+        )
+    except (ValueError, TypeError, KeyError):
+        valid = False
+
+    if not valid:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Curseur de pagination invalide"
+        )
+    return values
+
+def paginate(query, columns, skip: int = 0, limit: int = 100, cursor: Optional[str] = None,
+             descending: bool = False, keyset: bool = True):
+    """
+    Applique le tri sur `columns` puis la pagination.
+    Avec un curseur, la page commence après la ligne qu'il désigne (skip est ignoré) ;
+    sinon skip/limit sont utilisés comme auparavant.
+    Retourne (lignes, curseur de la page suivante ou None).
+    keyset=False : tri déjà imposé par l'appelant (ex: pertinence), pas de curseur.
+    """
+    query = query.order_by(*[column.desc() if descending else column.asc() for column in columns])
+
+    if keyset and cursor:
+        values = decode_cursor(cursor, columns)
+        key = tuple_(*columns)
+        query = query.filter(key < tuple_(*values) if descending else key > tuple_(*values))
+    else:
+        query = query.offset(skip)
+
+    rows = query.limit(limit).all()
+
+    next_cursor = None
+    if keyset and rows and len(rows) == limit:
+        next_cursor = encode_cursor(columns, [getattr(rows[-1], column.key) for column in columns])
+
+    return rows, next_cursor
+
+# Comptage du total (en-tête X-Total-Count)
+# Le comptage porte uniquement sur les lignes filtrées : sans chargement des relations ni tri.
+# COUNT(*) sur la sous-requête des identifiants plutôt que COUNT(id) : SQLite aplatit la
+# sous-requête et compte les entrées de l'index parcouru sans lire la valeur de chaque ligne
+# (environ trois fois plus rapide sur 500 000 prêts).
+# Le résultat peut être mis en cache par combinaison de filtres ; il est invalidé dès
+# qu'une des tables dont il dépend est modifiée (voir cache.py).
+_count_cache = GenerationCache()
+
+def count_rows(query):
+    entity = query.column_descriptions[0]["entity"]
+    # Attribut de clé primaire de l'entité (fonctionne aussi pour une entité aliasée)
+    mapper = inspect(entity).mapper
+    primary_key = getattr(entity, mapper.get_property_by_column(mapper.primary_key[0]).key)
+    ids = query.enable_eagerloads(False).order_by(None).with_entities(primary_key).subquery()
+    return query.session.execute(select(func.count()).select_from(ids)).scalar()
+
+def count_total(query, cache_key=None, tables=()):
+    """
+    Nombre total de lignes de `query`.
+    cache_key : identifiant de la combinaison de filtres (None = pas de cache, par exemple
+    pour un filtre relatif à l'heure courante) ; tables : tables dont dépend le résultat.
+    """
+    if cache_key is None:
+        return count_rows(query)
+    return _count_cache.get_or_compute(cache_key, tables, lambda: count_rows(query))
+
+def pagination_headers(total_count: int, next_cursor: Optional[str]):
+    headers = {"X-Total-Count": str(total_count)}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    return headers
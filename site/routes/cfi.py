@@ -5,6 +5,7 @@ from pydantic import BaseModel, Field
 from datetime import datetime
 from database import get_db, CFI, Personne
 from auth import get_current_active_user, User
+from pagination import paginate, pagination_headers, count_total
 
 router = APIRouter(prefix="/api/cfis", tags=["cfis"])
 
@@ -61,9 +62,10 @@ def get_cfi(db: Session, cfi_id: int):
 
 # Routes pour la gestion des CFIs
 @router.get("/", response_model=List[CFIResponse])
-async def list_cfis(
+def list_cfis(
     skip: int = 0, 
     limit: int = 100, 
+    cursor: Optional[str] = None,
     search: Optional[str] = None,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -86,10 +88,10 @@ async def list_cfis(
         )
     
     # Compter le nombre total pour la pagination
-    total_count = query.count()
+    total_count = count_total(query, ("cfis", search), ("CFI",))
     
     # Appliquer pagination
-    cfis = query.order_by(CFI.nom).offset(skip).limit(limit).all()
+    cfis, next_cursor = paginate(query, [CFI.nom, CFI.id], skip, limit, cursor)
     
     # Convertir les objets SQLAlchemy en dictionnaires
     cfis_data = jsonable_encoder(cfis)
@@ -97,11 +99,11 @@ async def list_cfis(
     # Créer une réponse JSON avec l'en-tête personnalisé
     return JSONResponse(
         content=cfis_data,
-        headers={"X-Total-Count": str(total_count)}
+        headers=pagination_headers(total_count, next_cursor)
     )
 
 @router.get("/{cfi_id}", response_model=CFIDetailResponse)
-async def get_cfi_details(
+def get_cfi_details(
     cfi_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -135,7 +137,7 @@ async def get_cfi_details(
     return response
 
 @router.post("/", response_model=CFIResponse, status_code=status.HTTP_201_CREATED)
-async def create_cfi(
+def create_cfi(
     cfi_data: CFICreate,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -167,7 +169,7 @@ async def create_cfi(
     return new_cfi
 
 @router.put("/{cfi_id}", response_model=CFIResponse)
-async def update_cfi(
+def update_cfi(
     cfi_id: int,
     cfi_data: CFIUpdate,
     current_user: User = Depends(get_current_active_user),
@@ -202,7 +204,7 @@ async def update_cfi(
     return cfi
 
 @router.delete("/{cfi_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_cfi(
+def delete_cfi(
     cfi_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -228,7 +230,7 @@ async def delete_cfi(
 
 # Routes pour la gestion des membres du CFI
 @router.get("/{cfi_id}/membres", response_model=List[PersonneBase])
-async def get_cfi_membres(
+def get_cfi_membres(
     cfi_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -245,7 +247,7 @@ async def get_cfi_membres(
     return membres
 
 @router.post("/{cfi_id}/membres/{personne_id}", status_code=status.HTTP_200_OK)
-async def add_membre_to_cfi(
+def add_membre_to_cfi(
     cfi_id: int,
     personne_id: int,
     current_user: User = Depends(get_current_active_user),
@@ -272,7 +274,7 @@ async def add_membre_to_cfi(
     return {"message": "Membre ajouté au CFI avec succès"}
 
 @router.delete("/{cfi_id}/membres/{personne_id}", status_code=status.HTTP_200_OK)
-async def remove_membre_from_cfi(
+def remove_membre_from_cfi(
     cfi_id: int,
     personne_id: int,
     current_user: User = Depends(get_current_active_user),
@@ -5,6 +5,8 @@ from pydantic import BaseModel, Field
 from datetime import datetime
 from database import get_db, Equipe, Personne
 from auth import get_current_active_user, User
+from pagination import paginate, pagination_headers, count_total
+from echeances import reschedule_equipe, reschedule_personne
 
 router = APIRouter(prefix="/api/equipes", tags=["equipes"])
 
@@ -12,6 +14,7 @@ router = APIRouter(prefix="/api/equipes", tags=["equipes"])
 class EquipeBase(BaseModel):
     nom: str
     categorie: str
+    duree_pret_heures: Optional[int] = Field(None, gt=0)  # Durée de prêt maximale, défaut si absente
 
 class EquipeCreate(EquipeBase):
     pass
@@ -19,6 +22,7 @@ class EquipeCreate(EquipeBase):
 class EquipeUpdate(BaseModel):
     nom: Optional[str] = None
     categorie: Optional[str] = None
+    duree_pret_heures: Optional[int] = Field(None, gt=0)
 
 class PersonneBase(BaseModel):
     id: int
@@ -55,9 +59,10 @@ def get_equipe(db: Session, equipe_id: int):
 
 # Routes pour la gestion des équipes
 @router.get("/", response_model=List[EquipeResponse])
-async def list_equipes(
+def list_equipes(
     skip: int = 0, 
     limit: int = 100, 
+    cursor: Optional[str] = None,
     search: Optional[str] = None,
     categorie: Optional[str] = None,
     current_user: User = Depends(get_current_active_user),
@@ -80,10 +85,10 @@ async def list_equipes(
         query = query.filter(Equipe.categorie == categorie)
     
     # Compter le nombre total pour la pagination
-    total_count = query.count()
+    total_count = count_total(query, ("equipes", search, categorie), ("Equipe",))
     
     # Appliquer pagination
-    equipes = query.offset(skip).limit(limit).all()
+    equipes, next_cursor = paginate(query, [Equipe.nom, Equipe.id], skip, limit, cursor)
     
     # Convertir les objets SQLAlchemy en dictionnaires
     equipes_data = jsonable_encoder(equipes)
@@ -91,11 +96,11 @@ async def list_equipes(
     # Créer une réponse JSON avec l'en-tête personnalisé
     return JSONResponse(
         content=equipes_data,
-        headers={"X-Total-Count": str(total_count)}
+        headers=pagination_headers(total_count, next_cursor)
     )
 
 @router.get("/{equipe_id}", response_model=EquipeDetailResponse)
-async def get_equipe_details(
+def get_equipe_details(
     equipe_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -113,6 +118,7 @@ async def get_equipe_details(
         id=equipe.id,
         nom=equipe.nom,
         categorie=equipe.categorie,
+        duree_pret_heures=equipe.duree_pret_heures,
         date_creation=equipe.date_creation,
         date_modification=equipe.date_modification,
         membres=[PersonneBase(
@@ -126,7 +132,7 @@ async def get_equipe_details(
     return response
 
 @router.post("/", response_model=EquipeResponse, status_code=status.HTTP_201_CREATED)
-async def create_equipe(
+def create_equipe(
     equipe_data: EquipeCreate,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -153,7 +159,8 @@ async def create_equipe(
     # Créer la nouvelle équipe
     new_equipe = Equipe(
         nom=equipe_data.nom,
-        categorie=equipe_data.categorie
+        categorie=equipe_data.categorie,
+        duree_pret_heures=equipe_data.duree_pret_heures
     )
     
     db.add(new_equipe)
@@ -163,7 +170,7 @@ async def create_equipe(
     return new_equipe
 
 @router.put("/{equipe_id}", response_model=EquipeResponse)
-async def update_equipe(
+def update_equipe(
     equipe_id: int,
     equipe_data: EquipeUpdate,
     current_user: User = Depends(get_current_active_user),
@@ -201,12 +208,17 @@ async def update_equipe(
         setattr(equipe, key, value)
     
     db.commit()
+    
+    # Nouvelle durée de prêt : échéance des prêts en cours des membres recalculée
+    if "duree_pret_heures" in update_data:
+        reschedule_equipe(db, equipe_id)
+    
     db.refresh(equipe)
     
     return equipe
 
 @router.delete("/{equipe_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_equipe(
+def delete_equipe(
     equipe_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -232,7 +244,7 @@ async def delete_equipe(
 
 # Routes pour la gestion des membres de l'équipe
 @router.get("/{equipe_id}/membres", response_model=List[PersonneBase])
-async def get_equipe_membres(
+def get_equipe_membres(
     equipe_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -249,7 +261,7 @@ async def get_equipe_membres(
     return membres
 
 @router.post("/{equipe_id}/membres/{personne_id}", status_code=status.HTTP_200_OK)
-async def add_membre_to_equipe(
+def add_membre_to_equipe(
     equipe_id: int,
     personne_id: int,
     current_user: User = Depends(get_current_active_user),
@@ -270,13 +282,18 @@ async def add_membre_to_equipe(
         )
     
     # Mettre à jour l'équipe de la personne
+    changement_equipe = personne.id_equipe != equipe_id
     personne.id_equipe = equipe_id
     db.commit()
     
+    # Échéance des prêts en cours recalculée avec la durée de prêt de l'équipe
+    if changement_equipe:
+        reschedule_personne(db, personne_id)
+    
     return {"message": "Membre ajouté à l'équipe avec succès"}
 
 @router.delete("/{equipe_id}/membres/{personne_id}", status_code=status.HTTP_200_OK)
-async def remove_membre_from_equipe(
+def remove_membre_from_equipe(
     equipe_id: int,
     personne_id: int,
     current_user: User = Depends(get_current_active_user),
@@ -305,4 +322,7 @@ async def remove_membre_from_equipe(
     personne.id_equipe = None
     db.commit()
     
+    # Échéance des prêts en cours recalculée avec la durée de prêt par défaut
+    reschedule_personne(db, personne_id)
+    
     return {"message": "Membre retiré de l'équipe avec succès"}
\ No newline at end of file
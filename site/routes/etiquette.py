@@ -10,7 +10,7 @@ import json
 router = APIRouter(prefix="/api/etiquettes", tags=["etiquettes"])
 
 @router.get("/preview")
-async def generate_barcode_preview(
+def generate_barcode_preview(
     code: str,
     label: Optional[str] = None,
     current_user: User = Depends(get_current_active_user)
@@ -28,7 +28,7 @@ async def generate_barcode_preview(
         )
 
 @router.get("/single", response_class=StreamingResponse)
-async def generate_single_barcode(
+def generate_single_barcode(
     code: str,
     label: Optional[str] = None,
     current_user: User = Depends(get_current_active_user)
@@ -59,7 +59,7 @@ async def generate_single_barcode(
         )
 
 @router.post("/multiple", response_class=StreamingResponse)
-async def generate_multiple_barcodes(
+def generate_multiple_barcodes(
     codes: List[dict],
     current_user: User = Depends(get_current_active_user)
 ):
@@ -99,7 +99,7 @@ async def generate_multiple_barcodes(
         )
 
 @router.get("/radios")
-async def get_radios_for_barcodes(
+def get_radios_for_barcodes(
     search: Optional[str] = None,
     disponible: Optional[bool] = None,
     current_user: User = Depends(get_current_active_user),
@@ -156,7 +156,7 @@ async def get_radios_for_barcodes(
         )
 
 @router.get("/personnes")
-async def get_personnes_for_barcodes(
+def get_personnes_for_barcodes(
     search: Optional[str] = None,
     equipe_id: Optional[int] = None,
     current_user: User = Depends(get_current_active_user),
@@ -212,7 +212,7 @@ async def get_personnes_for_barcodes(
         )
 
 @router.get("/equipes")
-async def get_equipes(
+def get_equipes(
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
@@ -239,7 +239,7 @@ async def get_equipes(
         )
 
 @router.get("/all-radios", response_class=StreamingResponse)
-async def generate_all_radios_barcodes(
+def generate_all_radios_barcodes(
     disponible: Optional[bool] = None,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -298,7 +298,7 @@ async def generate_all_radios_barcodes(
         )
 
 @router.get("/all-personnes", response_class=StreamingResponse)
-async def generate_all_personnes_barcodes(
+def generate_all_personnes_barcodes(
     equipe_id: Optional[int] = None,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -0,0 +1,151 @@
+import os
+import re
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from datetime import datetime
+from database import get_db
+from auth import get_current_active_user, User
+from exports import submit_export, get_job, delete_job
+from routes.historique import PretFilter, PRET_CSV_HEADER, pret_csv_row, pret_export_query
+from routes.maintenance import (
+    MaintenanceFilter, MAINTENANCE_CSV_HEADER, maintenance_csv_row, maintenance_export_query
+)
+
+router = APIRouter(prefix="/api/exports", tags=["exports"])
+
+# Taille des morceaux lus lors du téléchargement
+DOWNLOAD_CHUNK = 64 * 1024
+
+def find_job(job_id: str, current_user: User):
+    job = get_job(job_id, current_user.id)
+    if job is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Export non trouvé ou expiré"
+        )
+    return job
+
+def parse_range(range_header: str, size: int):
+    """
+    Intervalle (début, fin inclus) demandé par un en-tête `Range: bytes=...`.
+    Une seule plage est acceptée : `debut-fin`, `debut-` ou `-suffixe`.
+    """
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", range_header.strip())
+    if match and (match.group(1) or match.group(2)):
+        if match.group(1):
+            start = int(match.group(1))
+            end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+        else:
+            start = max(size - int(match.group(2)), 0)
+            end = size - 1
+        if start <= end:
+            return start, end
+
+    raise HTTPException(
+        status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+        detail="Plage demandée invalide",
+        headers={"Content-Range": f"bytes */{size}"}
+    )
+
+def read_file(path: str, start: int, length: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(DOWNLOAD_CHUNK, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+@router.post("/prets", status_code=status.HTTP_202_ACCEPTED)
+def create_prets_export(
+    filtres: PretFilter,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Lancer l'export CSV des prêts en arrière-plan (mêmes filtres que /api/historique/prets/export)
+    """
+    job = submit_export(
+        "prets", current_user.id, "historique_prets.csv",
+        pret_export_query(db, filtres), PRET_CSV_HEADER, pret_csv_row
+    )
+    return job.to_dict()
+
+@router.post("/maintenance", status_code=status.HTTP_202_ACCEPTED)
+def create_maintenance_export(
+    filtres: MaintenanceFilter,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Lancer l'export CSV des maintenances en arrière-plan (mêmes filtres que /api/maintenance/export)
+    """
+    filename = f"historique_maintenance_{datetime.now().strftime('%Y%m%d')}.csv"
+    job = submit_export(
+        "maintenance", current_user.id, filename,
+        maintenance_export_query(filtres), MAINTENANCE_CSV_HEADER, maintenance_csv_row
+    )
+    return job.to_dict()
+
+@router.get("/{job_id}")
+def get_export(
+    job_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Récupérer l'état et l'avancement d'un export
+    """
+    return find_job(job_id, current_user).to_dict()
+
+@router.get("/{job_id}/download")
+def download_export(
+    job_id: str,
+    request: Request,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Télécharger le fichier d'un export terminé (reprise possible avec l'en-tête Range)
+    """
+    job = find_job(job_id, current_user)
+    if job.statut != "termine":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="L'export n'est pas terminé"
+        )
+
+    size = os.path.getsize(job.path)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'attachment; filename="{job.filename}"'
+    }
+
+    range_header = request.headers.get("range")
+    if range_header:
+        start, end = parse_range(range_header, size)
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(
+            read_file(job.path, start, end - start + 1),
+            status_code=status.HTTP_206_PARTIAL_CONTENT,
+            media_type="text/csv; charset=utf-8",
+            headers=headers
+        )
+
+    headers["Content-Length"] = str(size)
+    return StreamingResponse(
+        read_file(job.path, 0, size),
+        media_type="text/csv; charset=utf-8",
+        headers=headers
+    )
+
+@router.delete("/{job_id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_export(
+    job_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Supprimer un export et son fichier (un export en cours est interrompu)
+    """
+    delete_job(find_job(job_id, current_user))
+    return None
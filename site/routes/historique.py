@@ -1,13 +1,21 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import func, and_, or_, text
+from sqlalchemy import func, and_, or_, text, select, case, literal
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime, timedelta
-from database import get_db, Pret, Radio, Personne, Equipe, CFI
+from database import get_db, SessionLocal, Pret, PretArchive, Radio, Personne, Equipe, CFI, Maintenance
 from auth import get_current_active_user, User
-from io import StringIO
-import csv
+from pagination import paginate, pagination_headers, count_total
+from cache import RefreshCache
+from exports import csv_chunks
+from expressions import duree_entre
+import intervals
+from search import build_match_query, fts_ids
+from archive import pret_source, archive_needed
+from sketches import load_sketches
+import numpy as np
 
 router = APIRouter(prefix="/api/historique", tags=["historique"])
 
@@ -21,11 +29,100 @@ class PretFilter(BaseModel):
     accessoires: Optional[str] = None
     dateDebut: Optional[str] = None
     dateFin: Optional[str] = None
+    min_duree: Optional[float] = None  # heures
+    max_duree: Optional[float] = None  # heures
+
+def parse_date(value: Optional[str]):
+    """Date au format YYYY-MM-DD, None si absente ou invalide"""
+    if not value:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        return None
+
+def pret_source_filtree(db: Session, filtres: PretFilter):
+    """
+    Source des prêts : la table Pret, ou son union avec l'archive quand la période
+    demandée remonte avant l'horizon d'archivage (prêts actifs : jamais archivés)
+    """
+    if filtres.status in ("active", "overdue"):
+        return Pret
+    return pret_source(db, parse_date(filtres.dateDebut))
+
+def pret_conditions(P, filtres: PretFilter):
+    """
+    Conditions WHERE des filtres de l'historique, communes à la liste et aux exports.
+    Aucun filtre n'ajoute de jointure à la requête : les filtres sur l'emprunteur (équipe,
+    CFI) forment une seule semi-jointure sur Personne. Toutes les valeurs sont des paramètres
+    liés : une même combinaison de filtres produit une requête de même forme, compilée
+    une seule fois (cache de compilation de SQLAlchemy).
+    """
+    conditions = []
+    
+    if filtres.search:
+        # Recherche plein texte : radio, emprunteur ou commentaire du prêt
+        match_query = build_match_query(filtres.search)
+        if match_query:
+            conditions.append(or_(
+                P.id_radio.in_(fts_ids("radio_fts", match_query)),
+                P.id_personne.in_(fts_ids("personne_fts", match_query)),
+                P.id.in_(fts_ids("pret_fts", match_query))
+            ))
+    
+    if filtres.status == "active":
+        conditions.append(P.date_retour == None)
+    elif filtres.status == "returned":
+        conditions.append(P.date_retour != None)
+    elif filtres.status == "overdue":
+        conditions.append(and_(P.date_retour == None, P.date_echeance < datetime.now()))
+    
+    if filtres.radio:
+        conditions.append(P.id_radio == filtres.radio)
+    
+    if filtres.personne:
+        conditions.append(P.id_personne == filtres.personne)
+    
+    # Sous-requête IN non corrélée plutôt que EXISTS : SQLite peut alors partir des
+    # personnes de l'équipe / du CFI (index) au lieu de tester chaque prêt
+    personne_conditions = []
+    if filtres.equipe:
+        personne_conditions.append(Personne.id_equipe == filtres.equipe)
+    if filtres.cfi:
+        personne_conditions.append(Personne.id_cfi == filtres.cfi)
+    if personne_conditions:
+        # correlate(None) : sous-requête indépendante même si la requête joint déjà Personne (export)
+        conditions.append(P.id_personne.in_(
+            select(Personne.id).where(*personne_conditions).correlate(None)
+        ))
+    
+    if filtres.accessoires:
+        conditions.append(P.accessoires == filtres.accessoires)
+    
+    # Dates invalides ignorées
+    date_debut = parse_date(filtres.dateDebut)
+    if date_debut:
+        conditions.append(P.date_emprunt >= date_debut)
+    
+    date_fin = parse_date(filtres.dateFin)
+    if date_fin:
+        # Ajouter un jour pour inclure toute la journée
+        conditions.append(P.date_emprunt <= date_fin + timedelta(days=1))
+    
+    # Filtres de durée : prêts rendus uniquement (index idx_pret_duree)
+    if filtres.min_duree is not None:
+        conditions.append(P.duree_secondes >= filtres.min_duree * 3600)
+    
+    if filtres.max_duree is not None:
+        conditions.append(P.duree_secondes <= filtres.max_duree * 3600)
+    
+    return conditions
 
 @router.get("/prets")
-async def list_prets(
+def list_prets(
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     search: Optional[str] = None,
     status: Optional[str] = None,
     radio: Optional[int] = None,
@@ -35,93 +132,50 @@ async def list_prets(
     accessoires: Optional[str] = None,
     dateDebut: Optional[str] = None,
     dateFin: Optional[str] = None,
+    min_duree: Optional[float] = None,
+    max_duree: Optional[float] = None,
+    sort: str = "date",
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """
     Récupérer la liste des prêts avec filtres avancés
+    (durées en heures ; sort=duree : prêts rendus, du plus long au plus court)
     """
     from fastapi.responses import JSONResponse
     from fastapi.encoders import jsonable_encoder
     
-    # Base de la requête avec les jointures nécessaires
-    query = db.query(Pret).options(
-        joinedload(Pret.radio),
-        joinedload(Pret.personne).joinedload(Personne.equipe),
-        joinedload(Pret.personne).joinedload(Personne.cfi)
+    filtres = PretFilter(
+        search=search, status=status, radio=radio, personne=personne, equipe=equipe,
+        cfi=cfi, accessoires=accessoires, dateDebut=dateDebut, dateFin=dateFin,
+        min_duree=min_duree, max_duree=max_duree
     )
+    P = pret_source_filtree(db, filtres)
     
-    # Appliquer les filtres
-    if search:
-        search_term = f"%{search}%"
-        query = query.join(Radio, Pret.id_radio == Radio.id).join(
-            Personne, Pret.id_personne == Personne.id
-        ).filter(
-            or_(
-                Radio.code_barre.ilike(search_term),
-                Radio.marque.ilike(search_term),
-                Radio.modele.ilike(search_term),
-                Personne.code_barre.ilike(search_term),
-                Personne.nom.ilike(search_term),
-                Personne.prenom.ilike(search_term),
-                Pret.commentaire.ilike(search_term)
-            )
-        )
-    
-    if status:
-        now = datetime.now()
-        one_week_ago = now - timedelta(days=7)
-        
-        if status == "active":
-            query = query.filter(Pret.date_retour == None)
-        elif status == "returned":
-            query = query.filter(Pret.date_retour != None)
-        elif status == "overdue":
-            query = query.filter(and_(
-                Pret.date_retour == None,
-                Pret.date_emprunt < one_week_ago
-            ))
-    
-    if radio:
-        query = query.filter(Pret.id_radio == radio)
+    # Base de la requête : relations chargées par jointures, filtres sans jointure supplémentaire
+    query = db.query(P).options(
+        joinedload(P.radio),
+        joinedload(P.personne).joinedload(Personne.equipe),
+        joinedload(P.personne).joinedload(Personne.cfi)
+    ).filter(*pret_conditions(P, filtres))
     
-    if personne:
-        query = query.filter(Pret.id_personne == personne)
-    
-    if equipe:
-        query = query.join(Personne, Pret.id_personne == Personne.id).filter(
-            Personne.id_equipe == equipe
-        )
-    
-    if cfi:
-        query = query.join(Personne, Pret.id_personne == Personne.id).filter(
-            Personne.id_cfi == cfi
-        )
-    
-    if accessoires:
-        query = query.filter(Pret.accessoires == accessoires)
-    
-    if dateDebut:
-        try:
-            date_debut = datetime.strptime(dateDebut, "%Y-%m-%d")
-            query = query.filter(Pret.date_emprunt >= date_debut)
-        except ValueError:
-            pass  # Ignorer les erreurs de format de date
-    
-    if dateFin:
-        try:
-            date_fin = datetime.strptime(dateFin, "%Y-%m-%d")
-            # Ajouter un jour pour inclure toute la journée
-            date_fin = date_fin + timedelta(days=1)
-            query = query.filter(Pret.date_emprunt <= date_fin)
-        except ValueError:
-            pass  # Ignorer les erreurs de format de date
+    # Tri par durée : parcours de l'index des durées, limité aux prêts rendus
+    tri = [P.date_emprunt, P.id]
+    if sort == "duree":
+        query = query.filter(P.duree_secondes != None)
+        tri = [P.duree_secondes, P.id]
     
     # Compter le nombre total pour la pagination
-    total_count = query.count()
+    # (pas de cache pour le statut "en retard", qui dépend de l'heure courante)
+    cache_key = None
+    if status != "overdue":
+        cache_key = ("historique", sort == "duree") + tuple(filtres.model_dump().values())
+    total_count = count_total(query, cache_key, ("Pret", "Pret_archive", "Radio", "Personne"))
     
     # Appliquer le tri et la pagination
-    prets = query.order_by(Pret.date_emprunt.desc()).offset(skip).limit(limit).all()
+    prets, next_cursor = paginate(
+        query, tri, skip, limit, cursor, descending=True
+    )
     
     # Convertir les objets SQLAlchemy en dictionnaires
     prets_data = jsonable_encoder(prets)
@@ -129,11 +183,98 @@ async def list_prets(
     # Créer une réponse JSON avec l'en-tête personnalisé
     return JSONResponse(
         content=prets_data,
-        headers={"X-Total-Count": str(total_count)}
+        headers=pagination_headers(total_count, next_cursor)
     )
 
+# En-tête et lignes de l'export CSV des prêts
+PRET_CSV_HEADER = [
+    "ID", "Radio", "Modèle", "Emprunteur", "Équipe", "CFI", 
+    "Date d'emprunt", "Date de retour", "Durée", "Accessoires", "Commentaire", "Statut"
+]
+
+def pret_csv_row(row, now: datetime):
+    """Ligne CSV d'un prêt à partir de la projection de l'export"""
+    radio_code = row.code_barre or "N/A"
+    radio_modele = f"{row.marque} {row.modele}" if row.code_barre else "N/A"
+    
+    personne_nom = f"{row.nom} {row.prenom}" if row.nom is not None else "N/A"
+    equipe_nom = row.equipe_nom or "N/A"
+    cfi_nom = row.cfi_nom or "N/A"
+    
+    date_emprunt = row.date_emprunt.strftime("%d/%m/%Y %H:%M") if row.date_emprunt else "N/A"
+    date_retour = row.date_retour.strftime("%d/%m/%Y %H:%M") if row.date_retour else "Non retourné"
+    
+    # Durée enregistrée au retour, ou durée écoulée pour un prêt en cours
+    if row.date_retour:
+        diff = timedelta(seconds=row.duree_secondes or 0)
+        suffixe = ""
+    else:
+        diff = now - row.date_emprunt
+        suffixe = " (en cours)"
+    days = diff.days
+    hours = diff.seconds // 3600
+    duree = f"{days}j {hours}h{suffixe}" if days > 0 else f"{hours}h{suffixe}"
+    
+    # Convertir les accessoires
+    accessoires_text = "Aucun"
+    if row.accessoires == "oreillettes":
+        accessoires_text = "Oreillettes"
+    elif row.accessoires == "micro":
+        accessoires_text = "Micro"
+    elif row.accessoires == "les deux":
+        accessoires_text = "Oreillettes + Micro"
+    
+    # Déterminer le statut
+    statut = "Retourné"
+    if not row.date_retour:
+        statut = "En retard" if row.date_echeance and row.date_echeance < now else "Actif"
+    
+    return [
+        row.id,
+        radio_code,
+        radio_modele,
+        personne_nom,
+        equipe_nom,
+        cfi_nom,
+        date_emprunt,
+        date_retour,
+        duree,
+        accessoires_text,
+        row.commentaire or "",
+        statut
+    ]
+
+def pret_export_query(db: Session, filtres: PretFilter, limit: Optional[int] = None):
+    """
+    Requête de l'export CSV des prêts (projection, filtres de list_prets, tri par date d'emprunt).
+    Utilisée par l'export direct et par les tâches d'export (routes/export.py).
+    """
+    P = pret_source_filtree(db, filtres)
+    
+    # Projection des seules colonnes exportées, sans objets ORM ni relations chargées
+    query = select(
+        P.id, P.date_emprunt, P.date_retour, P.date_echeance, P.duree_secondes, P.accessoires, P.commentaire,
+        Radio.code_barre, Radio.marque, Radio.modele,
+        Personne.nom, Personne.prenom,
+        Equipe.nom.label("equipe_nom"), CFI.nom.label("cfi_nom")
+    ).select_from(P).outerjoin(
+        Radio, P.id_radio == Radio.id
+    ).outerjoin(
+        Personne, P.id_personne == Personne.id
+    ).outerjoin(
+        Equipe, Personne.id_equipe == Equipe.id
+    ).outerjoin(
+        CFI, Personne.id_cfi == CFI.id
+    ).where(
+        *pret_conditions(P, filtres)
+    ).order_by(P.date_emprunt.desc())
+    if limit:
+        query = query.limit(limit)
+    
+    return query
+
 @router.get("/prets/export")
-async def export_prets_csv(
+def export_prets_csv(
     search: Optional[str] = None,
     status: Optional[str] = None,
     radio: Optional[int] = None,
@@ -143,200 +284,55 @@ async def export_prets_csv(
     accessoires: Optional[str] = None,
     dateDebut: Optional[str] = None,
     dateFin: Optional[str] = None,
-    limit: int = 10000,  # Limite élevée car on veut tous les résultats
+    min_duree: Optional[float] = None,
+    max_duree: Optional[float] = None,
+    limit: Optional[int] = None,  # Pas de limite par défaut : tous les prêts filtrés
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """
     Exporter les prêts au format CSV
     """
-    # Base de la requête avec les jointures nécessaires
-    query = db.query(Pret).options(
-        joinedload(Pret.radio),
-        joinedload(Pret.personne).joinedload(Personne.equipe),
-        joinedload(Pret.personne).joinedload(Personne.cfi)
+    filtres = PretFilter(
+        search=search, status=status, radio=radio, personne=personne, equipe=equipe,
+        cfi=cfi, accessoires=accessoires, dateDebut=dateDebut, dateFin=dateFin,
+        min_duree=min_duree, max_duree=max_duree
     )
+    query = pret_export_query(db, filtres, limit)
     
-    # Appliquer les filtres (même logique que list_prets)
-    if search:
-        search_term = f"%{search}%"
-        query = query.join(Radio, Pret.id_radio == Radio.id).join(
-            Personne, Pret.id_personne == Personne.id
-        ).filter(
-            or_(
-                Radio.code_barre.ilike(search_term),
-                Radio.marque.ilike(search_term),
-                Radio.modele.ilike(search_term),
-                Personne.code_barre.ilike(search_term),
-                Personne.nom.ilike(search_term),
-                Personne.prenom.ilike(search_term),
-                Pret.commentaire.ilike(search_term)
-            )
-        )
-    
-    if status:
-        now = datetime.now()
-        one_week_ago = now - timedelta(days=7)
-        
-        if status == "active":
-            query = query.filter(Pret.date_retour == None)
-        elif status == "returned":
-            query = query.filter(Pret.date_retour != None)
-        elif status == "overdue":
-            query = query.filter(and_(
-                Pret.date_retour == None,
-                Pret.date_emprunt < one_week_ago
-            ))
-    
-    if radio:
-        query = query.filter(Pret.id_radio == radio)
-    
-    if personne:
-        query = query.filter(Pret.id_personne == personne)
-    
-    if equipe:
-        query = query.join(Personne, Pret.id_personne == Personne.id).filter(
-            Personne.id_equipe == equipe
-        )
-    
-    if cfi:
-        query = query.join(Personne, Pret.id_personne == Personne.id).filter(
-            Personne.id_cfi == cfi
-        )
-    
-    if accessoires:
-        query = query.filter(Pret.accessoires == accessoires)
-    
-    if dateDebut:
-        try:
-            date_debut = datetime.strptime(dateDebut, "%Y-%m-%d")
-            query = query.filter(Pret.date_emprunt >= date_debut)
-        except ValueError:
-            pass
-    
-    if dateFin:
-        try:
-            date_fin = datetime.strptime(dateFin, "%Y-%m-%d")
-            date_fin = date_fin + timedelta(days=1)
-            query = query.filter(Pret.date_emprunt <= date_fin)
-        except ValueError:
-            pass
-    
-    # Récupérer les prêts
-    prets = query.order_by(Pret.date_emprunt.desc()).limit(limit).all()
-    
-    # Créer le contenu CSV
-    output = StringIO()
-    writer = csv.writer(output)
-    
-    # Écrire l'en-tête
-    writer.writerow([
-        "ID", "Radio", "Modèle", "Emprunteur", "Équipe", "CFI", 
-        "Date d'emprunt", "Date de retour", "Durée", "Accessoires", "Commentaire", "Statut"
-    ])
-    
-    # Écrire les données
-    for pret in prets:
-        # Extraire les informations nécessaires
-        radio_code = pret.radio.code_barre if pret.radio else "N/A"
-        radio_modele = f"{pret.radio.marque} {pret.radio.modele}" if pret.radio else "N/A"
-        
-        personne_nom = f"{pret.personne.nom} {pret.personne.prenom}" if pret.personne else "N/A"
-        
-        equipe_nom = pret.personne.equipe.nom if pret.personne and pret.personne.equipe else "N/A"
-        
-        cfi_nom = pret.personne.cfi.nom if pret.personne and pret.personne.cfi else "N/A"
-        
-        date_emprunt = pret.date_emprunt.strftime("%d/%m/%Y %H:%M") if pret.date_emprunt else "N/A"
-        date_retour = pret.date_retour.strftime("%d/%m/%Y %H:%M") if pret.date_retour else "Non retourné"
-        
-        # Calculer la durée
-        duree = "En cours"
-        if pret.date_retour:
-            diff = pret.date_retour - pret.date_emprunt
-            days = diff.days
-            hours = diff.seconds // 3600
-            if days > 0:
-                duree = f"{days}j {hours}h"
-            else:
-                duree = f"{hours}h"
-        else:
-            diff = datetime.now() - pret.date_emprunt
-            days = diff.days
-            hours = diff.seconds // 3600
-            if days > 0:
-                duree = f"{days}j {hours}h (en cours)"
-            else:
-                duree = f"{hours}h (en cours)"
-        
-        # Convertir les accessoires
-        accessoires_text = "Aucun"
-        if pret.accessoires == "oreillettes":
-            accessoires_text = "Oreillettes"
-        elif pret.accessoires == "micro":
-            accessoires_text = "Micro"
-        elif pret.accessoires == "les deux":
-            accessoires_text = "Oreillettes + Micro"
-        
-        # Déterminer le statut
-        statut = "Retourné"
-        if not pret.date_retour:
-            now = datetime.now()
-            if (now - pret.date_emprunt).days > 7:
-                statut = "En retard"
-            else:
-                statut = "Actif"
-        
-        writer.writerow([
-            pret.id,
-            radio_code,
-            radio_modele,
-            personne_nom,
-            equipe_nom,
-            cfi_nom,
-            date_emprunt,
-            date_retour,
-            duree,
-            accessoires_text,
-            pret.commentaire or "",
-            statut
-        ])
-    
-    # Retourner le CSV
-    output.seek(0)
-    response = Response(content=output.getvalue(), media_type="text/csv")
-    response.headers["Content-Disposition"] = f"attachment; filename=historique_prets.csv"
-    
-    return response
+    # Envoyer le CSV au fur et à mesure de sa production
+    return StreamingResponse(
+        csv_chunks(query, PRET_CSV_HEADER, pret_csv_row),
+        media_type="text/csv",
+        headers={"Content-Disposition": "attachment; filename=historique_prets.csv"}
+    )
 
 @router.get("/stats")
-async def get_prets_stats(
+def get_prets_stats(
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """
     Obtenir des statistiques sur les prêts
     """
-    # Nombre total de prêts
-    total_prets = db.query(func.count(Pret.id)).scalar()
+    # Nombre total de prêts (y compris les prêts archivés)
+    total_prets = db.query(func.count(Pret.id)).scalar() + db.query(func.count(PretArchive.id)).scalar()
     
     # Nombre de prêts actifs
     prets_actifs = db.query(func.count(Pret.id)).filter(Pret.date_retour == None).scalar()
     
     # Durée moyenne des prêts terminés
+    P = pret_source(db)
     duree_moyenne_query = db.query(
-        func.avg(
-            func.extract('epoch', Pret.date_retour) - func.extract('epoch', Pret.date_emprunt)
-        ) / 3600  # Convertir en heures
-    ).filter(Pret.date_retour != None)
+        func.avg(P.duree_secondes) / 3600  # Convertir en heures
+    ).filter(P.date_retour != None)
     
     duree_moyenne = duree_moyenne_query.scalar() or 0
     
-    # Nombre de prêts de longue durée (plus de 7 jours)
-    date_limite = datetime.now() - timedelta(days=7)
+    # Nombre de prêts en retard (échéance dépassée, index partiel des prêts actifs)
     prets_long_terme = db.query(func.count(Pret.id)).filter(
         Pret.date_retour == None,
-        Pret.date_emprunt < date_limite
+        Pret.date_echeance < datetime.now()
     ).scalar()
     
     return {
@@ -347,7 +343,7 @@ async def get_prets_stats(
     }
 
 @router.get("/top/radios")
-async def get_top_radios(
+def get_top_radios(
     limit: int = 10,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -355,15 +351,18 @@ async def get_top_radios(
     """
     Obtenir le top des radios les plus empruntées
     """
+    # Prêts courants et archivés
+    P = pret_source(db)
+    
     # Compter les prêts par radio
     top_radios_query = db.query(
-        Pret.id_radio,
-        func.count(Pret.id).label('count'),
+        P.id_radio,
+        func.count(P.id).label('count'),
         Radio.code_barre,
         Radio.marque,
         Radio.modele
-    ).join(Radio, Pret.id_radio == Radio.id).group_by(
-        Pret.id_radio, Radio.code_barre, Radio.marque, Radio.modele
+    ).join(Radio, P.id_radio == Radio.id).group_by(
+        P.id_radio, Radio.code_barre, Radio.marque, Radio.modele
     ).order_by(text('count DESC')).limit(limit)
     
     top_radios = top_radios_query.all()
@@ -380,7 +379,7 @@ async def get_top_radios(
     return result
 
 @router.get("/top/emprunteurs")
-async def get_top_emprunteurs(
+def get_top_emprunteurs(
     limit: int = 10,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -388,15 +387,18 @@ async def get_top_emprunteurs(
     """
     Obtenir le top des emprunteurs les plus actifs
     """
+    # Prêts courants et archivés
+    P = pret_source(db)
+    
     # Compter les prêts par personne
     top_emprunteurs_query = db.query(
-        Pret.id_personne,
-        func.count(Pret.id).label('count'),
+        P.id_personne,
+        func.count(P.id).label('count'),
         Personne.code_barre,
         Personne.nom,
         Personne.prenom
-    ).join(Personne, Pret.id_personne == Personne.id).group_by(
-        Pret.id_personne, Personne.code_barre, Personne.nom, Personne.prenom
+    ).join(Personne, P.id_personne == Personne.id).group_by(
+        P.id_personne, Personne.code_barre, Personne.nom, Personne.prenom
     ).order_by(text('count DESC')).limit(limit)
     
     top_emprunteurs = top_emprunteurs_query.all()
@@ -413,27 +415,28 @@ async def get_top_emprunteurs(
     return result
 
 @router.get("/duree/equipes")
-async def get_duree_par_equipe(
+def get_duree_par_equipe(
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """
     Obtenir la durée moyenne des prêts par équipe
     """
+    # Prêts courants et archivés
+    P = pret_source(db)
+    
     # Durée moyenne par équipe pour les prêts terminés
     duree_par_equipe_query = db.query(
         Personne.id_equipe,
         Equipe.nom.label('equipe_nom'),
-        func.avg(
-            func.extract('epoch', Pret.date_retour) - func.extract('epoch', Pret.date_emprunt)
-        ).label('avg_duration'),
-        func.count(Pret.id).label('count')
+        func.avg(P.duree_secondes).label('avg_duration'),
+        func.count(P.id).label('count')
     ).join(
-        Personne, Pret.id_personne == Personne.id
+        Personne, P.id_personne == Personne.id
     ).join(
         Equipe, Personne.id_equipe == Equipe.id
     ).filter(
-        Pret.date_retour != None
+        P.date_retour != None
     ).group_by(
         Personne.id_equipe, Equipe.nom
     ).order_by(text('avg_duration DESC'))
@@ -454,8 +457,338 @@ async def get_duree_par_equipe(
     
     return result
 
+@router.get("/durees")
+def get_durees(
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Obtenir les percentiles (p50, p90, p99) et l'histogramme des durées de prêt,
+    au global et par équipe, CFI et modèle de radio
+    """
+    # Lecture des seuls sketches de durée (voir sketches.py), sans parcours des prêts
+    sketches = load_sketches(db)
+    ids_equipes = [int(cle) for dimension, cle in sketches if dimension == "equipe"]
+    ids_cfis = [int(cle) for dimension, cle in sketches if dimension == "cfi"]
+    noms_equipes = dict(db.query(Equipe.id, Equipe.nom).filter(Equipe.id.in_(ids_equipes)).all())
+    noms_cfis = dict(db.query(CFI.id, CFI.nom).filter(CFI.id.in_(ids_cfis)).all())
+    
+    def par_dimension(dimension):
+        return sorted(
+            ((cle, sketch) for (nom_dimension, cle), sketch in sketches.items() if nom_dimension == dimension),
+            key=lambda item: item[1].count, reverse=True
+        )
+    
+    return {
+        "global": sketches[("global", "")].summary(),
+        "equipes": [
+            {"id_equipe": int(cle), "equipe_nom": noms_equipes.get(int(cle)), **sketch.summary()}
+            for cle, sketch in par_dimension("equipe")
+        ],
+        "cfis": [
+            {"id_cfi": int(cle), "cfi_nom": noms_cfis.get(int(cle)), **sketch.summary()}
+            for cle, sketch in par_dimension("cfi")
+        ],
+        "modeles": [
+            {"modele": cle, **sketch.summary()}
+            for cle, sketch in par_dimension("modele")
+        ]
+    }
+
+# Tableau de bord analytique : statistiques, tops et durées par équipe en un seul appel
+# Le résultat est mis en cache (voir cache.RefreshCache) : recalcul immédiat après la
+# création ou le retour d'un prêt, rafraîchissement en fond une fois la durée de vie
+# dépassée (le nombre de prêts en retard dépend de l'heure courante).
+ANALYTICS_TTL = 60  # secondes
+ANALYTICS_STALE_TTL = 600  # secondes pendant lesquelles une valeur expirée reste servie
+ANALYTICS_TABLES = ("Pret", "Pret_archive", "Radio", "Personne", "Equipe")
+
+_analytics_cache = RefreshCache(ANALYTICS_TTL, ANALYTICS_STALE_TTL)
+
+def compute_analytics(limit: int):
+    """
+    Calcule les données de /stats, /top/radios, /top/emprunteurs et /duree/equipes
+    en deux parcours des prêts : un agrégat par emprunteur et un agrégat par radio.
+    """
+    db = SessionLocal()
+    try:
+        # Prêts courants et archivés
+        P = pret_source(db)
+        now = datetime.now()
+        duree = P.duree_secondes
+        
+        # Parcours 1 : agrégat par emprunteur (statistiques globales, top emprunteurs, équipes)
+        # L'agrégation porte sur les seuls prêts (parcours dans l'ordre de l'index id_personne),
+        # les noms sont joints ensuite sur une ligne par emprunteur
+        agregat = db.query(
+            P.id_personne.label('id_personne'),
+            func.count(P.id).label('count'),
+            func.count(P.date_retour).label('rendus'),
+            func.sum(duree).label('duree_totale'),
+            func.sum(case((P.date_retour == None, 1), else_=0)).label('actifs'),
+            func.sum(case((and_(P.date_retour == None, P.date_echeance < now), 1), else_=0)).label('long_terme')
+        ).group_by(P.id_personne).subquery()
+        
+        par_personne = db.query(
+            agregat,
+            Personne.code_barre,
+            Personne.nom,
+            Personne.prenom,
+            Personne.id_equipe,
+            Equipe.nom.label('equipe_nom')
+        ).outerjoin(
+            Personne, agregat.c.id_personne == Personne.id
+        ).outerjoin(
+            Equipe, Personne.id_equipe == Equipe.id
+        ).all()
+        
+        # Parcours 2 : agrégat par radio (top radios)
+        agregat = db.query(
+            P.id_radio.label('id_radio'),
+            func.count(P.id).label('count')
+        ).group_by(P.id_radio).subquery()
+        
+        top_radios = db.query(
+            agregat,
+            Radio.code_barre,
+            Radio.marque,
+            Radio.modele
+        ).join(Radio, agregat.c.id_radio == Radio.id).order_by(
+            agregat.c.count.desc()
+        ).limit(limit).all()
+    finally:
+        db.close()
+    
+    # Statistiques globales
+    rendus = sum(row.rendus for row in par_personne)
+    duree_totale = sum(row.duree_totale or 0 for row in par_personne)
+    stats = {
+        "total_prets": sum(row.count for row in par_personne),
+        "prets_actifs": sum(row.actifs or 0 for row in par_personne),
+        "duree_moyenne_heures": duree_totale / rendus / 3600 if rendus else 0,
+        "prets_long_terme": sum(row.long_terme or 0 for row in par_personne)
+    }
+    
+    # Top des emprunteurs
+    emprunteurs = sorted(
+        (row for row in par_personne if row.nom is not None),
+        key=lambda row: row.count, reverse=True
+    )[:limit]
+    
+    # Durée moyenne des prêts terminés par équipe
+    equipes = {}
+    for row in par_personne:
+        if row.equipe_nom is None or not row.rendus:
+            continue
+        equipe = equipes.setdefault(row.id_equipe, {"equipe_nom": row.equipe_nom, "duree": 0, "count": 0})
+        equipe["duree"] += row.duree_totale or 0
+        equipe["count"] += row.rendus
+    durees = sorted(
+        (
+            {
+                "id_equipe": id_equipe,
+                "equipe_nom": equipe["equipe_nom"],
+                "duree_moyenne_heures": equipe["duree"] / equipe["count"] / 3600,
+                "count": equipe["count"]
+            }
+            for id_equipe, equipe in equipes.items()
+        ),
+        key=lambda duree: duree["duree_moyenne_heures"], reverse=True
+    )
+    
+    return {
+        "stats": stats,
+        "top_radios": [
+            {
+                "id_radio": radio.id_radio,
+                "count": radio.count,
+                "code_barre": radio.code_barre,
+                "label": f"{radio.code_barre} ({radio.marque} {radio.modele})"
+            }
+            for radio in top_radios
+        ],
+        "top_emprunteurs": [
+            {
+                "id_personne": personne.id_personne,
+                "count": personne.count,
+                "code_barre": personne.code_barre,
+                "label": f"{personne.nom} {personne.prenom}"
+            }
+            for personne in emprunteurs
+        ],
+        "duree_equipes": durees
+    }
+
+@router.get("/analytics")
+def get_analytics(
+    limit: int = 10,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Obtenir en un seul appel les statistiques, les tops radios / emprunteurs et la durée moyenne par équipe
+    """
+    return _analytics_cache.get_or_compute(
+        ("analytics", limit), ANALYTICS_TABLES, lambda: compute_analytics(limit)
+    )
+
+# Taux d'utilisation des radios et prêts simultanés sur une fenêtre de temps
+EPOCH = datetime(1970, 1, 1)
+UTILISATION_PAS = {"hour": 3600, "day": 86400}
+
+def epoch_seconds(date: datetime):
+    return (date - EPOCH).total_seconds()
+
+@router.get("/utilisation")
+def get_utilisation(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    pas: Optional[str] = None,
+    groupe: str = "equipe",
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Obtenir le taux d'utilisation de chaque radio (et par modèle) et l'évolution du nombre
+    de prêts simultanés par équipe ou par CFI sur une période (30 derniers jours par défaut)
+    """
+    if groupe not in ("equipe", "cfi"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Le groupe doit être 'equipe' ou 'cfi'"
+        )
+    if pas is not None and pas not in UTILISATION_PAS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Le pas doit être 'hour' ou 'day'"
+        )
+    
+    # Fenêtre [debut, fin) : jour de fin inclus, limitée à l'instant présent
+    now = datetime.now()
+    fin = now
+    if end_date:
+        try:
+            fin = min(datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1), now)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Format de date fin invalide (YYYY-MM-DD attendu)"
+            )
+    
+    debut = fin - timedelta(days=30)
+    if start_date:
+        try:
+            debut = datetime.strptime(start_date, "%Y-%m-%d")
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Format de date début invalide (YYYY-MM-DD attendu)"
+            )
+    
+    if debut >= fin:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="La date de début doit précéder la date de fin"
+        )
+    
+    # Pas de la série temporelle : horaire jusqu'à 14 jours, quotidien au-delà
+    if pas is None:
+        pas = "hour" if fin - debut <= timedelta(days=14) else "day"
+    
+    # Prêts qui chevauchent la fenêtre, dates converties en secondes par la base
+    P = pret_source(db, debut)
+    cle_groupe = Personne.id_equipe if groupe == "equipe" else Personne.id_cfi
+    prets = db.execute(
+        select(
+            P.id_radio,
+            duree_entre(literal(EPOCH), P.date_emprunt),
+            duree_entre(literal(EPOCH), P.date_retour),
+            cle_groupe
+        ).select_from(P).outerjoin(
+            Personne, P.id_personne == Personne.id
+        ).where(
+            P.date_emprunt < fin,
+            or_(P.date_retour == None, P.date_retour > debut)
+        )
+    ).all()
+    
+    radios = db.query(Radio.id, Radio.code_barre, Radio.marque, Radio.modele).order_by(Radio.id).all()
+    modele_table = Equipe if groupe == "equipe" else CFI
+    groupes = db.query(modele_table.id, modele_table.nom).order_by(modele_table.nom).all()
+    
+    t0, t1 = epoch_seconds(debut), epoch_seconds(fin)
+    # Une colonne NumPy par champ (NULL -> NaN)
+    colonnes = [np.array(colonne, dtype=float) for colonne in zip(*prets)] or [np.empty(0)] * 4
+    pret_radios, pret_debuts, pret_fins, pret_groupes = colonnes
+    starts, ends, valides = intervals.clip_intervals(pret_debuts, pret_fins, t0, t1)
+    
+    # Indices des radios et des groupes (dernier groupe : emprunteurs sans équipe / CFI)
+    radio_index = intervals.index_of(pret_radios, [radio.id for radio in radios], -1)
+    groupe_index = intervals.index_of(pret_groupes, [g.id for g in groupes], len(groupes))
+    valides &= radio_index >= 0
+    
+    starts, ends = starts[valides], ends[valides]
+    radio_index, groupe_index = radio_index[valides], groupe_index[valides]
+    
+    # Taux d'utilisation par radio puis par modèle
+    duree_fenetre = t1 - t0
+    occupation = intervals.busy_time(starts, ends, radio_index, len(radios))
+    result_radios = []
+    modeles = {}
+    for radio, secondes in zip(radios, occupation.tolist()):
+        result_radios.append({
+            "id_radio": radio.id,
+            "code_barre": radio.code_barre,
+            "marque": radio.marque,
+            "modele": radio.modele,
+            "heures_pret": secondes / 3600,
+            "taux_utilisation": 100 * secondes / duree_fenetre
+        })
+        modele = modeles.setdefault((radio.marque, radio.modele), {"nombre_radios": 0, "secondes": 0})
+        modele["nombre_radios"] += 1
+        modele["secondes"] += secondes
+    
+    result_modeles = [
+        {
+            "marque": marque,
+            "modele": modele,
+            "nombre_radios": valeurs["nombre_radios"],
+            "taux_utilisation": 100 * valeurs["secondes"] / (valeurs["nombre_radios"] * duree_fenetre)
+        }
+        for (marque, modele), valeurs in sorted(modeles.items(), key=lambda item: (item[0][0], item[0][1]))
+    ]
+    
+    # Prêts simultanés : pic global et série par groupe
+    pic_global = int(intervals.peak_concurrency(starts, ends, np.zeros(len(starts), dtype=np.int64), 1)[0])
+    n_groupes = len(groupes) + 1
+    grille, series = intervals.concurrency_series(
+        starts, ends, groupe_index, n_groupes, t0, t1, UTILISATION_PAS[pas]
+    )
+    pics = intervals.peak_concurrency(starts, ends, groupe_index, n_groupes)
+    
+    sans_groupe = "Sans équipe" if groupe == "equipe" else "Sans CFI"
+    noms = [(g.id, g.nom) for g in groupes] + [(None, sans_groupe)]
+    result_groupes = [
+        {"id": id_groupe, "nom": nom, "pic": int(pic), "prets_actifs": serie}
+        for (id_groupe, nom), pic, serie in zip(noms, pics.tolist(), series.tolist())
+        if pic > 0
+    ]
+    
+    return {
+        "debut": debut,
+        "fin": fin,
+        "pas": pas,
+        "radios": result_radios,
+        "modeles": result_modeles,
+        "pic_prets_simultanes": pic_global,
+        "series": {
+            "groupe": groupe,
+            "instants": [EPOCH + timedelta(seconds=t) for t in grille.tolist()],
+            "groupes": result_groupes
+        }
+    }
+
 @router.get("/activite/{periode}")
-async def get_activite_par_periode(
+def get_activite_par_periode(
     periode: str,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
@@ -497,47 +830,37 @@ async def get_activite_par_periode(
             )
     
     # Construire la requête SQL en fonction de la période
+    # Les comptes proviennent de l'agrégat quotidien PretActiviteJour (maintenu par triggers,
+    # prêts archivés compris) : au plus une ligne par jour de la période est lue.
     if periode == 'day':
         # Pour un affichage quotidien
-        date_format = "DATE(date_emprunt)"
-        date_format_retour = "DATE(date_retour)"
+        date_format = "jour"
     elif periode == 'week':
         # Pour un affichage hebdomadaire
         # La fonction d'extraction de semaine peut varier selon la base de données
         # Ici on utilise une syntaxe pour SQLite mais à adapter pour PostgreSQL ou MySQL
-        date_format = "strftime('%Y-%W', date_emprunt)"
-        date_format_retour = "strftime('%Y-%W', date_retour)"
+        date_format = "strftime('%Y-%W', jour)"
     else:  # month
         # Pour un affichage mensuel
-        date_format = "strftime('%Y-%m', date_emprunt)"
-        date_format_retour = "strftime('%Y-%m', date_retour)"
-    
-    # Requête pour les emprunts
-    emprunt_query = text(f"""
-        SELECT {date_format} as period, COUNT(*) as count
-        FROM Pret
-        WHERE date_emprunt BETWEEN :start AND :end
-        GROUP BY {date_format}
-        ORDER BY period
-    """)
+        date_format = "strftime('%Y-%m', jour)"
     
-    # Requête pour les retours
-    retour_query = text(f"""
-        SELECT {date_format_retour} as period, COUNT(*) as count
-        FROM Pret
-        WHERE date_retour IS NOT NULL
-        AND date_retour BETWEEN :start AND :end
-        GROUP BY {date_format_retour}
+    # Requête pour les emprunts et les retours
+    activite_query = text(f"""
+        SELECT {date_format} as period, SUM(emprunts) as emprunts, SUM(retours) as retours
+        FROM PretActiviteJour
+        WHERE jour BETWEEN :start AND :end
+        GROUP BY {date_format}
         ORDER BY period
     """)
     
-    # Exécuter les requêtes
-    emprunts_result = db.execute(emprunt_query, {"start": start, "end": end}).fetchall()
-    retours_result = db.execute(retour_query, {"start": start, "end": end}).fetchall()
+    # Exécuter la requête (bornes au jour près)
+    activite_result = db.execute(
+        activite_query, {"start": start.date().isoformat(), "end": end.date().isoformat()}
+    ).fetchall()
     
     # Convertir les résultats en dictionnaire
-    emprunts = {row[0]: row[1] for row in emprunts_result}
-    retours = {row[0]: row[1] for row in retours_result}
+    emprunts = {row[0]: row[1] for row in activite_result if row[1]}
+    retours = {row[0]: row[2] for row in activite_result if row[2]}
     
     # Fusionner les périodes
     periodes = sorted(set(list(emprunts.keys()) + list(retours.keys())))
@@ -563,4 +886,136 @@ async def get_activite_par_periode(
             "raw_period": p  # Pour le tri côté client si nécessaire
         })
     
-    return result
\ No newline at end of file
+    return result
+
+# État du parc à un instant donné (reconstitution après un incident)
+@router.get("/snapshot")
+def get_snapshot(
+    at: str,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Obtenir, pour chaque radio, l'emprunteur et la maintenance en cours à un instant donné
+    """
+    try:
+        instant = datetime.fromisoformat(at)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Format de date invalide (YYYY-MM-DDTHH:MM:SS attendu)"
+        )
+    
+    # Les dates sont stockées en heure locale sans fuseau : un instant avec fuseau
+    # (ex: 2024-05-01T10:00:00Z envoyé par le navigateur) est converti en heure locale
+    if instant.tzinfo is not None:
+        instant = instant.astimezone().replace(tzinfo=None)
+    
+    # Dernier prêt / dernière maintenance commencé avant l'instant, pour chaque radio :
+    # une recherche dans l'index (id_radio, date) par radio, quelle que soit la profondeur
+    # de l'historique. Les prêts d'une radio ne se chevauchent pas : l'élément trouvé est
+    # en cours à l'instant s'il n'était pas encore terminé.
+    def dernier_avant(entity, date_debut):
+        return select(entity.id).where(
+            entity.id_radio == Radio.id,
+            date_debut <= instant
+        ).order_by(date_debut.desc()).limit(1).scalar_subquery()
+    
+    colonnes = [
+        Radio.id,
+        Radio.code_barre,
+        Radio.marque,
+        Radio.modele,
+        dernier_avant(Pret, Pret.date_emprunt).label('id_pret'),
+        dernier_avant(Maintenance, Maintenance.date_debut).label('id_maintenance')
+    ]
+    # Prêts archivés seulement si l'instant précède l'horizon d'archivage
+    if archive_needed(db, instant):
+        colonnes.append(dernier_avant(PretArchive, PretArchive.date_emprunt).label('id_pret_archive'))
+    radios = db.execute(select(*colonnes).order_by(Radio.id)).all()
+    
+    def prets_par_id(entity, ids):
+        if not ids:
+            return {}
+        rows = db.execute(
+            select(
+                entity.id,
+                entity.id_personne,
+                entity.date_emprunt,
+                entity.date_retour,
+                entity.accessoires,
+                Personne.code_barre,
+                Personne.nom,
+                Personne.prenom,
+                Equipe.nom.label('equipe_nom')
+            ).outerjoin(
+                Personne, entity.id_personne == Personne.id
+            ).outerjoin(
+                Equipe, Personne.id_equipe == Equipe.id
+            ).where(entity.id.in_(ids))
+        ).all()
+        return {row.id: row for row in rows}
+    
+    prets = prets_par_id(Pret, [radio.id_pret for radio in radios if radio.id_pret])
+    archives = prets_par_id(
+        PretArchive, [radio.id_pret_archive for radio in radios if getattr(radio, 'id_pret_archive', None)]
+    )
+    ids_maintenances = [radio.id_maintenance for radio in radios if radio.id_maintenance]
+    maintenances = {
+        row.id: row for row in db.execute(
+            select(
+                Maintenance.id, Maintenance.date_debut, Maintenance.date_fin,
+                Maintenance.description, Maintenance.operateur
+            ).where(Maintenance.id.in_(ids_maintenances))
+        ).all()
+    } if ids_maintenances else {}
+    
+    def en_cours(fin):
+        return fin is None or fin > instant
+    
+    result = []
+    for radio in radios:
+        # Le plus récent des deux candidats (table courante / archive)
+        pret = prets.get(radio.id_pret)
+        archive = archives.get(getattr(radio, 'id_pret_archive', None))
+        if archive is not None and (pret is None or archive.date_emprunt > pret.date_emprunt):
+            pret = archive
+        if pret is not None and not en_cours(pret.date_retour):
+            pret = None
+        maintenance = maintenances.get(radio.id_maintenance)
+        if maintenance is not None and not en_cours(maintenance.date_fin):
+            maintenance = None
+        
+        result.append({
+            "id_radio": radio.id,
+            "code_barre": radio.code_barre,
+            "marque": radio.marque,
+            "modele": radio.modele,
+            "statut": "maintenance" if maintenance else "en_pret" if pret else "disponible",
+            "pret": {
+                "id": pret.id,
+                "id_personne": pret.id_personne,
+                "code_barre": pret.code_barre,
+                "nom": pret.nom,
+                "prenom": pret.prenom,
+                "equipe_nom": pret.equipe_nom,
+                "accessoires": pret.accessoires,
+                "date_emprunt": pret.date_emprunt,
+                "date_retour": pret.date_retour
+            } if pret else None,
+            "maintenance": {
+                "id": maintenance.id,
+                "date_debut": maintenance.date_debut,
+                "date_fin": maintenance.date_fin,
+                "description": maintenance.description,
+                "operateur": maintenance.operateur
+            } if maintenance else None
+        })
+    
+    return {
+        "at": instant,
+        "total_radios": len(result),
+        "en_pret": sum(1 for radio in result if radio["pret"]),
+        "en_maintenance": sum(1 for radio in result if radio["maintenance"]),
+        "radios": result
+    }
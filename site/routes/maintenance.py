@@ -1,13 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func, extract
-from typing import List, Optional
-from pydantic import BaseModel
+from sqlalchemy import func, select, case, insert, update
+from typing import List, Optional, Union
+from pydantic import BaseModel, Field
 from datetime import datetime, timedelta
-import csv
-import io
-from database import get_db, Radio, Maintenance
+from database import get_db, SessionLocal, Radio, RadioEtat, Maintenance, RadioFiabilite
 from auth import get_current_active_user, User
+from pagination import paginate, pagination_headers, count_total
+from search import build_match_query, fts_ids
+from expressions import duree_entre
+from cache import RefreshCache
+from exports import csv_chunks, gzip_chunks
 
 router = APIRouter(prefix="/api/maintenance", tags=["maintenance"])
 
@@ -24,70 +28,305 @@ class MaintenanceResponse(BaseModel):
     class Config:
         orm_mode = True
 
+class MaintenanceBreakdown(BaseModel):
+    count: int
+    active_count: int
+    month_count: int
+    average_duration_hours: Optional[float] = None
+
+class ModelMaintenanceStatistics(MaintenanceBreakdown):
+    marque: str
+    modele: str
+
+class OperatorMaintenanceStatistics(MaintenanceBreakdown):
+    operateur: str
+
 class MaintenanceStatistics(BaseModel):
     active_count: int
     average_duration: str
     month_count: int
+    by_model: List[ModelMaintenanceStatistics] = []
+    by_operator: List[OperatorMaintenanceStatistics] = []
+
+class MaintenanceBulkStart(BaseModel):
+    radios: List[Union[int, str]] = Field(..., min_length=1)  # Identifiants ou codes-barres
+    description: str
+    operateur: str
+
+class MaintenanceBulkEnd(BaseModel):
+    radios: List[Union[int, str]] = Field(..., min_length=1)  # Identifiants ou codes-barres
+
+class MaintenanceFilter(BaseModel):
+    search: Optional[str] = None
+    status: Optional[str] = None
+    date_filter: Optional[str] = None
+
+# Projection d'une maintenance et de sa radio : une seule requête jointe par liste
+# (au lieu d'une requête Radio par maintenance)
+MAINTENANCE_COLUMNS = [
+    Maintenance.id,
+    Maintenance.id_radio,
+    Maintenance.date_debut,
+    Maintenance.date_fin,
+    Maintenance.description,
+    Maintenance.operateur,
+    Radio.id.label("radio_id"),
+    Radio.code_barre,
+    Radio.marque,
+    Radio.modele,
+    Radio.numero_serie,
+    Radio.est_geolocalisable
+]
+
+def maintenance_dict(row):
+    """Réponse JSON d'une maintenance (avec sa radio) à partir de la projection"""
+    return {
+        "id": row.id,
+        "id_radio": row.id_radio,
+        "date_debut": row.date_debut,
+        "date_fin": row.date_fin,
+        "description": row.description,
+        "operateur": row.operateur,
+        "radio": {
+            "id": row.radio_id,
+            "code_barre": row.code_barre,
+            "marque": row.marque,
+            "modele": row.modele,
+            "numero_serie": row.numero_serie,
+            "est_geolocalisable": row.est_geolocalisable
+        }
+    }
+
+def maintenance_conditions(filtres: MaintenanceFilter):
+    """Conditions WHERE des filtres de l'historique des maintenances (liste et exports)"""
+    conditions = []
+    
+    if filtres.search:
+        # Recherche plein texte par code barre, marque, modèle, description ou opérateur
+        match_query = build_match_query(filtres.search)
+        if match_query:
+            conditions.append(
+                Maintenance.id.in_(fts_ids("maintenance_fts", match_query)) |
+                Maintenance.id_radio.in_(fts_ids("radio_fts", match_query))
+            )
+    
+    if filtres.status == "active":
+        conditions.append(Maintenance.date_fin.is_(None))
+    elif filtres.status == "completed":
+        conditions.append(Maintenance.date_fin.isnot(None))
+    
+    if filtres.date_filter:
+        now = datetime.utcnow()
+        if filtres.date_filter == "week":
+            # 7 derniers jours
+            date_threshold = now - timedelta(days=7)
+        elif filtres.date_filter == "month":
+            # 30 derniers jours
+            date_threshold = now - timedelta(days=30)
+        elif filtres.date_filter == "three-month":
+            # 3 derniers mois
+            date_threshold = now - timedelta(days=90)
+        elif filtres.date_filter == "year":
+            # 12 derniers mois
+            date_threshold = now - timedelta(days=365)
+        else:
+            date_threshold = None
+        
+        if date_threshold:
+            conditions.append(Maintenance.date_debut >= date_threshold)
+    
+    return conditions
+
+# Statistiques de maintenance : compteurs, durée moyenne et répartition par modèle / opérateur
+# Le résultat est mis en cache (voir cache.RefreshCache) : recalcul immédiat au début ou
+# à la fin d'une maintenance, rafraîchissement en fond une fois la durée de vie dépassée
+# (le mois en cours et la fenêtre de 90 jours dépendent de l'heure courante).
+STATISTICS_TTL = 60  # secondes
+STATISTICS_STALE_TTL = 300  # secondes pendant lesquelles une valeur expirée reste servie
+STATISTICS_TABLES = ("Maintenance", "Radio")
+
+_statistics_cache = RefreshCache(STATISTICS_TTL, STATISTICS_STALE_TTL)
+
+def format_duree_moyenne(avg_seconds):
+    """Durée moyenne affichée sur la page maintenance ("x.x jours", "x.x heures" ou "N/A")"""
+    if avg_seconds is None:
+        return "N/A"
+    avg_days = avg_seconds / (60 * 60 * 24)
+    if avg_days >= 1:
+        return f"{avg_days:.1f} jours"
+    avg_hours = avg_seconds / (60 * 60)
+    return f"{avg_hours:.1f} heures"
+
+def compute_maintenance_statistics():
+    """
+    Calcule les statistiques de maintenance en un seul parcours : un agrégat par
+    (modèle de radio, opérateur), dont on déduit les totaux et les deux répartitions.
+    """
+    now = datetime.utcnow()
+    start_of_month = datetime(now.year, now.month, 1)
+    ninety_days_ago = now - timedelta(days=90)
+    
+    duree = duree_entre(Maintenance.date_debut, Maintenance.date_fin)
+    terminee = Maintenance.date_fin.isnot(None)
+    recente = terminee & (Maintenance.date_debut >= ninety_days_ago)
+    
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            select(
+                Radio.marque,
+                Radio.modele,
+                Maintenance.operateur,
+                func.count(Maintenance.id).label('count'),
+                func.count(Maintenance.date_fin).label('terminees'),
+                func.sum(case((Maintenance.date_fin.is_(None), 1), else_=0)).label('actives'),
+                func.sum(case((Maintenance.date_debut >= start_of_month, 1), else_=0)).label('mois'),
+                func.sum(case((terminee, duree))).label('duree_totale'),
+                func.sum(case((recente, 1), else_=0)).label('recentes'),
+                func.sum(case((recente, duree))).label('duree_recente')
+            ).outerjoin(
+                Radio, Maintenance.id_radio == Radio.id
+            ).group_by(
+                Radio.marque, Radio.modele, Maintenance.operateur
+            )
+        ).all()
+    finally:
+        db.close()
+    
+    def repartition(cle):
+        groupes = {}
+        for row in rows:
+            groupe = groupes.setdefault(cle(row), {
+                "count": 0, "active_count": 0, "month_count": 0, "terminees": 0, "duree": 0
+            })
+            groupe["count"] += row.count
+            groupe["active_count"] += row.actives
+            groupe["month_count"] += row.mois
+            groupe["terminees"] += row.terminees
+            groupe["duree"] += row.duree_totale or 0
+        # Durée moyenne (heures) des maintenances terminées du groupe, toutes périodes confondues
+        for groupe in groupes.values():
+            terminees = groupe.pop("terminees")
+            duree_totale = groupe.pop("duree")
+            groupe["average_duration_hours"] = duree_totale / terminees / 3600 if terminees else None
+        return sorted(groupes.items(), key=lambda item: item[1]["count"], reverse=True)
+    
+    # Durée moyenne des maintenances terminées (derniers 90 jours)
+    recentes = sum(row.recentes for row in rows)
+    avg_seconds = sum(row.duree_recente or 0 for row in rows) / recentes if recentes else None
+    
+    return {
+        "active_count": sum(row.actives for row in rows),
+        "average_duration": format_duree_moyenne(avg_seconds),
+        "month_count": sum(row.mois for row in rows),
+        "by_model": [
+            {"marque": marque, "modele": modele, **groupe}
+            for (marque, modele), groupe in repartition(lambda row: (row.marque, row.modele))
+            if modele is not None
+        ],
+        "by_operator": [
+            {"operateur": operateur, **groupe}
+            for operateur, groupe in repartition(lambda row: row.operateur)
+        ]
+    }
 
 # Routes pour la gestion de la maintenance
 @router.get("/statistics", response_model=MaintenanceStatistics)
-async def get_maintenance_statistics(
+def get_maintenance_statistics(
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Récupérer les statistiques de maintenance (avec la répartition par modèle et par opérateur)
+    """
+    try:
+        return _statistics_cache.get_or_compute(
+            ("statistics",), STATISTICS_TABLES, compute_maintenance_statistics
+        )
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erreur lors du calcul des statistiques: {str(e)}"
+        )
+
+def fiabilite_dict(pannes, reparations, duree_reparation, intervalles, duree_fonctionnement):
+    """MTBF / MTTR (heures) à partir des compteurs RadioFiabilite (None sans mesure)"""
+    return {
+        "pannes": pannes,
+        "reparations": reparations,
+        "mtbf_heures": duree_fonctionnement / intervalles / 3600 if intervalles else None,
+        "mttr_heures": duree_reparation / reparations / 3600 if reparations else None
+    }
+
+@router.get("/fiabilite")
+def get_fiabilite(
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """
-    Récupérer les statistiques de maintenance
+    Fiabilité par modèle et par radio : temps moyen entre pannes (MTBF) et temps moyen
+    de réparation (MTTR), lus sur les compteurs RadioFiabilite
     """
     try:
-        # Nombre de radios en maintenance
-        active_count = db.query(Maintenance).filter(Maintenance.date_fin.is_(None)).count()
-        
-        # Nombre de maintenances dans le mois en cours
-        now = datetime.utcnow()
-        start_of_month = datetime(now.year, now.month, 1)
-        month_count = db.query(Maintenance).filter(
-            Maintenance.date_debut >= start_of_month
-        ).count()
-        
-        # Durée moyenne des maintenances terminées (derniers 90 jours)
-        ninety_days_ago = now - timedelta(days=90)
-        completed_maintenances = db.query(Maintenance).filter(
-            Maintenance.date_fin.isnot(None),
-            Maintenance.date_debut >= ninety_days_ago
+        # Une ligne par radio (radios sans maintenance comprises, pour la taille du parc)
+        rows = db.query(
+            Radio.id,
+            Radio.code_barre,
+            Radio.marque,
+            Radio.modele,
+            func.coalesce(RadioFiabilite.pannes, 0).label('pannes'),
+            func.coalesce(RadioFiabilite.reparations, 0).label('reparations'),
+            func.coalesce(RadioFiabilite.duree_reparation, 0).label('duree_reparation'),
+            func.coalesce(RadioFiabilite.intervalles, 0).label('intervalles'),
+            func.coalesce(RadioFiabilite.duree_fonctionnement, 0).label('duree_fonctionnement')
+        ).outerjoin(
+            RadioFiabilite, RadioFiabilite.id_radio == Radio.id
         ).all()
         
-        if completed_maintenances:
-            total_duration = 0
-            for m in completed_maintenances:
-                duration = (m.date_fin - m.date_debut).total_seconds()
-                total_duration += duration
-            
-            avg_seconds = total_duration / len(completed_maintenances)
-            avg_days = avg_seconds / (60 * 60 * 24)
-            
-            if avg_days >= 1:
-                avg_duration = f"{avg_days:.1f} jours"
-            else:
-                avg_hours = avg_seconds / (60 * 60)
-                avg_duration = f"{avg_hours:.1f} heures"
-        else:
-            avg_duration = "N/A"
+        # Cumul des compteurs par modèle
+        compteurs = ("pannes", "reparations", "duree_reparation", "intervalles", "duree_fonctionnement")
+        modeles = {}
+        for row in rows:
+            modele = modeles.setdefault((row.marque, row.modele), {"radios": 0, **dict.fromkeys(compteurs, 0)})
+            modele["radios"] += 1
+            for compteur in compteurs:
+                modele[compteur] += getattr(row, compteur)
+        
+        par_modele = [
+            {
+                "marque": marque,
+                "modele": modele,
+                "radios": valeurs["radios"],
+                "pannes_par_radio": valeurs["pannes"] / valeurs["radios"],
+                **fiabilite_dict(*(valeurs[compteur] for compteur in compteurs))
+            }
+            for (marque, modele), valeurs in modeles.items()
+        ]
+        par_radio = [
+            {
+                "id_radio": row.id,
+                "code_barre": row.code_barre,
+                "marque": row.marque,
+                "modele": row.modele,
+                **fiabilite_dict(*(getattr(row, compteur) for compteur in compteurs))
+            }
+            for row in rows if row.pannes
+        ]
         
-        # Retourner les statistiques
+        # Les modèles et radios les plus souvent en maintenance en premier
         return {
-            "active_count": active_count,
-            "average_duration": avg_duration,
-            "month_count": month_count
+            "modeles": sorted(par_modele, key=lambda modele: modele["pannes_par_radio"], reverse=True),
+            "radios": sorted(par_radio, key=lambda radio: radio["pannes"], reverse=True)
         }
         
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Erreur lors du calcul des statistiques: {str(e)}"
+            detail=f"Erreur lors du calcul de la fiabilité: {str(e)}"
         )
 
 @router.get("/active")
-async def get_active_maintenances(
+def get_active_maintenances(
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
@@ -95,34 +334,14 @@ async def get_active_maintenances(
     Récupérer la liste des maintenances actives
     """
     try:
-        # Récupérer les maintenances qui n'ont pas de date de fin
-        maintenances = db.query(Maintenance).filter(
+        # Maintenances sans date de fin, avec leur radio (une seule requête)
+        rows = db.query(*MAINTENANCE_COLUMNS).join(
+            Radio, Maintenance.id_radio == Radio.id
+        ).filter(
             Maintenance.date_fin.is_(None)
         ).all()
         
-        # Pour chaque maintenance, ajouter les informations sur la radio
-        result = []
-        for maintenance in maintenances:
-            radio = db.query(Radio).filter(Radio.id == maintenance.id_radio).first()
-            
-            if radio:
-                maintenance_dict = {
-                    "id": maintenance.id,
-                    "id_radio": maintenance.id_radio,
-                    "date_debut": maintenance.date_debut,
-                    "date_fin": maintenance.date_fin,
-                    "description": maintenance.description,
-                    "operateur": maintenance.operateur,
-                    "radio": {
-                        "id": radio.id,
-                        "code_barre": radio.code_barre,
-                        "marque": radio.marque,
-                        "modele": radio.modele,
-                        "numero_serie": radio.numero_serie,
-                        "est_geolocalisable": radio.est_geolocalisable
-                    }
-                }
-                result.append(maintenance_dict)
+        result = [maintenance_dict(row) for row in rows]
         
         return result
         
@@ -133,9 +352,10 @@ async def get_active_maintenances(
         )
 
 @router.get("/history")
-async def get_maintenance_history(
+def get_maintenance_history(
     skip: int = 0,
     limit: int = 100,
+    cursor: Optional[str] = None,
     search: Optional[str] = None,
     status: Optional[str] = None,
     date_filter: Optional[str] = None,
@@ -149,94 +369,314 @@ async def get_maintenance_history(
     from fastapi.encoders import jsonable_encoder
     
     try:
-        # Construire la requête de base
-        query = db.query(Maintenance)
-        
-        # Appliquer les filtres
-        if search:
-            # Joindre avec la table Radio pour chercher par code barre, marque ou modèle
-            query = query.join(Radio, Maintenance.id_radio == Radio.id).filter(
-                (Radio.code_barre.ilike(f"%{search}%")) |
-                (Radio.marque.ilike(f"%{search}%")) |
-                (Radio.modele.ilike(f"%{search}%")) |
-                (Maintenance.description.ilike(f"%{search}%")) |
-                (Maintenance.operateur.ilike(f"%{search}%"))
-            )
-        
-        if status == "active":
-            query = query.filter(Maintenance.date_fin.is_(None))
-        elif status == "completed":
-            query = query.filter(Maintenance.date_fin.isnot(None))
-        
-        if date_filter:
-            now = datetime.utcnow()
-            if date_filter == "week":
-                # 7 derniers jours
-                date_threshold = now - timedelta(days=7)
-            elif date_filter == "month":
-                # 30 derniers jours
-                date_threshold = now - timedelta(days=30)
-            elif date_filter == "three-month":
-                # 3 derniers mois
-                date_threshold = now - timedelta(days=90)
-            elif date_filter == "year":
-                # 12 derniers mois
-                date_threshold = now - timedelta(days=365)
-            else:
-                date_threshold = None
-            
-            if date_threshold:
-                query = query.filter(Maintenance.date_debut >= date_threshold)
+        # Projection maintenance + radio et filtres
+        query = db.query(*MAINTENANCE_COLUMNS).join(
+            Radio, Maintenance.id_radio == Radio.id
+        ).filter(*maintenance_conditions(
+            MaintenanceFilter(search=search, status=status, date_filter=date_filter)
+        ))
         
         # Compter le nombre total pour la pagination
-        total_count = query.count()
+        # (pas de cache pour les filtres de date, relatifs à l'heure courante)
+        cache_key = None if date_filter else ("maintenances", search, status)
+        total_count = count_total(query, cache_key, ("Maintenance", "Radio"))
         
-        # Appliquer la pagination
-        query = query.order_by(Maintenance.date_debut.desc()).offset(skip).limit(limit)
-        
-        # Exécuter la requête
-        maintenances = query.all()
+        # Appliquer le tri et la pagination
+        maintenances, next_cursor = paginate(
+            query, [Maintenance.date_debut, Maintenance.id], skip, limit, cursor, descending=True
+        )
         
-        # Pour chaque maintenance, ajouter les informations sur la radio
-        result = []
-        for maintenance in maintenances:
-            radio = db.query(Radio).filter(Radio.id == maintenance.id_radio).first()
-            
-            if radio:
-                maintenance_dict = {
-                    "id": maintenance.id,
-                    "id_radio": maintenance.id_radio,
-                    "date_debut": maintenance.date_debut,
-                    "date_fin": maintenance.date_fin,
-                    "description": maintenance.description,
-                    "operateur": maintenance.operateur,
-                    "radio": {
-                        "id": radio.id,
-                        "code_barre": radio.code_barre,
-                        "marque": radio.marque,
-                        "modele": radio.modele,
-                        "numero_serie": radio.numero_serie,
-                        "est_geolocalisable": radio.est_geolocalisable
-                    }
-                }
-                result.append(maintenance_dict)
+        result = [maintenance_dict(row) for row in maintenances]
         
         # Convertir en JSON et ajouter l'en-tête personnalisé
         result_json = jsonable_encoder(result)
         
         return JSONResponse(
             content=result_json,
-            headers={"X-Total-Count": str(total_count)}
+            headers=pagination_headers(total_count, next_cursor)
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Erreur lors de la récupération de l'historique des maintenances: {str(e)}"
         )
 
+# En-tête et lignes de l'export CSV des maintenances
+MAINTENANCE_CSV_HEADER = [
+    "ID", "Code Radio", "Marque", "Modèle", "Description", 
+    "Opérateur", "Date de début", "Date de fin", "Durée", "Statut"
+]
+
+def maintenance_csv_row(row, now: datetime):
+    """Ligne CSV d'une maintenance à partir de la projection de l'export"""
+    # Formater les dates
+    date_debut = row.date_debut.strftime("%d/%m/%Y %H:%M")
+    date_fin = row.date_fin.strftime("%d/%m/%Y %H:%M") if row.date_fin else ""
+    
+    # Calculer la durée
+    if row.date_fin:
+        duration = row.date_fin - row.date_debut
+        suffixe = ""
+    else:
+        duration = now - row.date_debut
+        suffixe = " (en cours)"
+    days = duration.days
+    hours = duration.seconds // 3600
+    
+    if days > 0:
+        duration_str = f"{days} jour(s) {hours} heure(s){suffixe}"
+    else:
+        duration_str = f"{hours} heure(s){suffixe}"
+    
+    # Déterminer le statut
+    statut = "Terminée" if row.date_fin else "En cours"
+    
+    return [
+        row.id,
+        row.code_barre,
+        row.marque,
+        row.modele,
+        row.description,
+        row.operateur,
+        date_debut,
+        date_fin,
+        duration_str,
+        statut
+    ]
+
+def maintenance_export_query(filtres: MaintenanceFilter):
+    """
+    Requête de l'export CSV des maintenances (projection avec la radio, filtres de
+    get_maintenance_history). Utilisée par l'export direct et par les tâches d'export.
+    """
+    query = select(*MAINTENANCE_COLUMNS).join(
+        Radio, Maintenance.id_radio == Radio.id
+    ).where(*maintenance_conditions(filtres))
+    
+    return query.order_by(Maintenance.date_debut.desc())
+
+# Déclarée avant /{maintenance_id}, qui sinon intercepte /export
+@router.get("/export", response_class=StreamingResponse)
+def export_maintenance_history(
+    search: Optional[str] = None,
+    status: Optional[str] = None,
+    date_filter: Optional[str] = None,
+    gzip: bool = False,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Exporter l'historique des maintenances au format CSV (compressé en gzip si gzip=true)
+    """
+    # Mêmes filtres que get_maintenance_history
+    query = maintenance_export_query(
+        MaintenanceFilter(search=search, status=status, date_filter=date_filter)
+    )
+    
+    # Nom de fichier avec la date actuelle
+    filename = f"historique_maintenance_{datetime.now().strftime('%Y%m%d')}.csv"
+    
+    # Envoyer le CSV au fur et à mesure de sa lecture (curseur serveur, voir exports.csv_chunks)
+    chunks = csv_chunks(query, MAINTENANCE_CSV_HEADER, maintenance_csv_row)
+    if gzip:
+        return StreamingResponse(
+            gzip_chunks(chunks),
+            media_type="application/gzip",
+            headers={"Content-Disposition": f'attachment; filename="{filename}.gz"'}
+        )
+    
+    return StreamingResponse(
+        chunks,
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+# Début / fin de maintenance d'un lot de radios (ex: contrôle des batteries après un exercice)
+# Les radios sont validées par des requêtes ensemblistes, toutes les maintenances sont
+# créées ou terminées dans une seule transaction ; chaque radio reçoit son propre résultat.
+def resolve_radios(db: Session, radios: List[Union[int, str]]):
+    """
+    Radios désignées par identifiant (entier) ou code-barre (texte), avec leur état courant.
+    Retourne (radio demandée, ligne ou None, erreur ou None) dans l'ordre de la requête.
+    """
+    ids = [radio for radio in radios if isinstance(radio, int)]
+    codes = [radio for radio in radios if isinstance(radio, str)]
+    rows = db.query(
+        Radio.id,
+        Radio.code_barre,
+        Radio.en_maintenance,
+        RadioEtat.id_pret
+    ).outerjoin(
+        RadioEtat, RadioEtat.id_radio == Radio.id
+    ).filter(
+        Radio.id.in_(ids) | Radio.code_barre.in_(codes)
+    ).all()
+    par_id = {row.id: row for row in rows}
+    par_code = {row.code_barre: row for row in rows}
+    
+    resolues = []
+    vues = set()
+    for radio in radios:
+        row = par_id.get(radio) if isinstance(radio, int) else par_code.get(radio)
+        if row is None:
+            resolues.append((radio, None, "Radio non trouvée"))
+        elif row.id in vues:
+            resolues.append((radio, row, "Radio présente plusieurs fois dans la requête"))
+        else:
+            vues.add(row.id)
+            resolues.append((radio, row, None))
+    return resolues
+
+def maintenance_base_dict(maintenance):
+    """Réponse JSON d'une maintenance (objet ou ligne), sans sa radio"""
+    return {
+        "id": maintenance.id,
+        "id_radio": maintenance.id_radio,
+        "date_debut": maintenance.date_debut,
+        "date_fin": maintenance.date_fin,
+        "description": maintenance.description,
+        "operateur": maintenance.operateur
+    }
+
+def bulk_result(radio, row, erreur=None, **details):
+    return {
+        "radio": radio,
+        "id_radio": row.id if row is not None else None,
+        "statut": "erreur" if erreur else "ok",
+        "erreur": erreur,
+        **details
+    }
+
+def bulk_response(resultats):
+    return {
+        "succes": sum(resultat["statut"] == "ok" for resultat in resultats),
+        "echecs": sum(resultat["statut"] == "erreur" for resultat in resultats),
+        "resultats": resultats
+    }
+
+@router.post("/bulk-start")
+def bulk_start_maintenance(
+    data: MaintenanceBulkStart,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Mettre un lot de radios en maintenance (identifiants ou codes-barres)
+    """
+    # Validation : radio existante, pas déjà en maintenance, pas en prêt (RadioEtat)
+    resolues = []
+    for radio, row, erreur in resolve_radios(db, data.radios):
+        if erreur is None and row.en_maintenance:
+            erreur = "Cette radio est déjà en maintenance"
+        elif erreur is None and row.id_pret is not None:
+            erreur = "Impossible de mettre en maintenance une radio actuellement en prêt"
+        resolues.append((radio, row, erreur))
+    
+    # Une maintenance par radio valide, même date de début pour tout le lot
+    now = datetime.now()
+    valides = [row.id for radio, row, erreur in resolues if erreur is None]
+    
+    try:
+        creees = {}
+        if valides:
+            # Une seule instruction INSERT multi-lignes (les triggers s'exécutent pour chaque ligne)
+            inserees = db.execute(
+                insert(Maintenance).values([
+                    {
+                        "id_radio": id_radio,
+                        "date_debut": now,
+                        "description": data.description,
+                        "operateur": data.operateur
+                    }
+                    for id_radio in valides
+                ]).returning(
+                    Maintenance.id, Maintenance.id_radio, Maintenance.date_debut,
+                    Maintenance.date_fin, Maintenance.description, Maintenance.operateur
+                )
+            ).all()
+            creees = {maintenance.id_radio: maintenance_base_dict(maintenance) for maintenance in inserees}
+            db.execute(
+                update(Radio).where(Radio.id.in_(valides)).values(en_maintenance=True),
+                execution_options={"synchronize_session": False}
+            )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erreur lors de la mise en maintenance des radios: {str(e)}"
+        )
+    
+    return bulk_response([
+        bulk_result(
+            radio, row, erreur,
+            maintenance=creees[row.id] if erreur is None else None
+        )
+        for radio, row, erreur in resolues
+    ])
+
+@router.post("/bulk-end")
+def bulk_end_maintenance(
+    data: MaintenanceBulkEnd,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Terminer les maintenances en cours d'un lot de radios (identifiants ou codes-barres)
+    """
+    resolues = resolve_radios(db, data.radios)
+    
+    # Maintenances en cours des radios trouvées (index idx_maintenance_active)
+    trouvees = [row.id for radio, row, erreur in resolues if erreur is None]
+    actives = {}
+    for maintenance in db.query(Maintenance).filter(
+        Maintenance.id_radio.in_(trouvees),
+        Maintenance.date_fin.is_(None)
+    ):
+        actives.setdefault(maintenance.id_radio, []).append(maintenance_base_dict(maintenance))
+    
+    resolues = [
+        (radio, row, erreur or (None if row.id in actives else "Aucune maintenance en cours pour cette radio"))
+        for radio, row, erreur in resolues
+    ]
+    
+    # Toutes les maintenances en cours des radios valides sont terminées à la même date
+    now = datetime.now()
+    ids = [maintenance["id"] for maintenances in actives.values() for maintenance in maintenances]
+    
+    try:
+        if ids:
+            db.execute(
+                update(Maintenance).where(Maintenance.id.in_(ids)).values(date_fin=now),
+                execution_options={"synchronize_session": False}
+            )
+            db.execute(
+                update(Radio).where(Radio.id.in_(actives)).values(en_maintenance=False),
+                execution_options={"synchronize_session": False}
+            )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erreur lors de la fin de maintenance des radios: {str(e)}"
+        )
+    
+    return bulk_response([
+        bulk_result(
+            radio, row, erreur,
+            maintenances=[
+                {**maintenance, "date_fin": now}
+                for maintenance in actives[row.id]
+            ] if erreur is None else []
+        )
+        for radio, row, erreur in resolues
+    ])
+
 @router.get("/{maintenance_id}")
-async def get_maintenance_details(
+def get_maintenance_details(
     maintenance_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -245,43 +685,24 @@ async def get_maintenance_details(
     Récupérer les détails d'une maintenance spécifique
     """
     try:
-        # Récupérer la maintenance
-        maintenance = db.query(Maintenance).filter(Maintenance.id == maintenance_id).first()
+        # Récupérer la maintenance et sa radio en une requête
+        row = db.query(*MAINTENANCE_COLUMNS).outerjoin(
+            Radio, Maintenance.id_radio == Radio.id
+        ).filter(Maintenance.id == maintenance_id).first()
         
-        if not maintenance:
+        if not row:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Maintenance avec l'ID {maintenance_id} non trouvée"
             )
         
-        # Récupérer la radio associée
-        radio = db.query(Radio).filter(Radio.id == maintenance.id_radio).first()
-        
-        if not radio:
+        if row.radio_id is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Radio associée à cette maintenance non trouvée"
             )
         
-        # Construire la réponse
-        result = {
-            "id": maintenance.id,
-            "id_radio": maintenance.id_radio,
-            "date_debut": maintenance.date_debut,
-            "date_fin": maintenance.date_fin,
-            "description": maintenance.description,
-            "operateur": maintenance.operateur,
-            "radio": {
-                "id": radio.id,
-                "code_barre": radio.code_barre,
-                "marque": radio.marque,
-                "modele": radio.modele,
-                "numero_serie": radio.numero_serie,
-                "est_geolocalisable": radio.est_geolocalisable
-            }
-        }
-        
-        return result
+        return maintenance_dict(row)
         
     except HTTPException:
         raise
@@ -290,131 +711,3 @@ async def get_maintenance_details(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Erreur lors de la récupération des détails de la maintenance: {str(e)}"
         )
-
-@router.get("/export", response_class=Response)
-async def export_maintenance_history(
-    search: Optional[str] = None,
-    status: Optional[str] = None,
-    date_filter: Optional[str] = None,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-):
-    """
-    Exporter l'historique des maintenances au format CSV
-    """
-    try:
-        # Construire la requête avec les mêmes filtres que get_maintenance_history
-        query = db.query(Maintenance).join(Radio, Maintenance.id_radio == Radio.id)
-        
-        # Appliquer les filtres
-        if search:
-            query = query.filter(
-                (Radio.code_barre.ilike(f"%{search}%")) |
-                (Radio.marque.ilike(f"%{search}%")) |
-                (Radio.modele.ilike(f"%{search}%")) |
-                (Maintenance.description.ilike(f"%{search}%")) |
-                (Maintenance.operateur.ilike(f"%{search}%"))
-            )
-        
-        if status == "active":
-            query = query.filter(Maintenance.date_fin.is_(None))
-        elif status == "completed":
-            query = query.filter(Maintenance.date_fin.isnot(None))
-        
-        if date_filter:
-            now = datetime.utcnow()
-            if date_filter == "week":
-                date_threshold = now - timedelta(days=7)
-            elif date_filter == "month":
-                date_threshold = now - timedelta(days=30)
-            elif date_filter == "three-month":
-                date_threshold = now - timedelta(days=90)
-            elif date_filter == "year":
-                date_threshold = now - timedelta(days=365)
-            else:
-                date_threshold = None
-            
-            if date_threshold:
-                query = query.filter(Maintenance.date_debut >= date_threshold)
-        
-        # Exécuter la requête
-        maintenances = query.order_by(Maintenance.date_debut.desc()).all()
-        
-        # Créer le buffer pour le CSV
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Écrire l'en-tête du CSV
-        writer.writerow([
-            "ID", "Code Radio", "Marque", "Modèle", "Description", 
-            "Opérateur", "Date de début", "Date de fin", "Durée", "Statut"
-        ])
-        
-        # Écrire les données
-        for maintenance in maintenances:
-            radio = db.query(Radio).filter(Radio.id == maintenance.id_radio).first()
-            
-            if radio:
-                # Formater les dates
-                date_debut = maintenance.date_debut.strftime("%d/%m/%Y %H:%M")
-                date_fin = maintenance.date_fin.strftime("%d/%m/%Y %H:%M") if maintenance.date_fin else ""
-                
-                # Calculer la durée
-                if maintenance.date_fin:
-                    duration = maintenance.date_fin - maintenance.date_debut
-                    days = duration.days
-                    hours = duration.seconds // 3600
-                    
-                    if days > 0:
-                        duration_str = f"{days} jour(s) {hours} heure(s)"
-                    else:
-                        duration_str = f"{hours} heure(s)"
-                else:
-                    now = datetime.utcnow()
-                    duration = now - maintenance.date_debut
-                    days = duration.days
-                    hours = duration.seconds // 3600
-                    
-                    if days > 0:
-                        duration_str = f"{days} jour(s) {hours} heure(s) (en cours)"
-                    else:
-                        duration_str = f"{hours} heure(s) (en cours)"
-                
-                # Déterminer le statut
-                statut = "Terminée" if maintenance.date_fin else "En cours"
-                
-                # Écrire la ligne
-                writer.writerow([
-                    maintenance.id,
-                    radio.code_barre,
-                    radio.marque,
-                    radio.modele,
-                    maintenance.description,
-                    maintenance.operateur,
-                    date_debut,
-                    date_fin,
-                    duration_str,
-                    statut
-                ])
-        
-        # Préparer le contenu pour le téléchargement
-        output.seek(0)
-        content = output.getvalue()
-        
-        # Définir un nom de fichier avec la date actuelle
-        current_date = datetime.now().strftime("%Y%m%d")
-        filename = f"historique_maintenance_{current_date}.csv"
-        
-        # Retourner le CSV comme un téléchargement
-        headers = {
-            'Content-Disposition': f'attachment; filename="{filename}"',
-            'Content-Type': 'text/csv; charset=utf-8'
-        }
-        
-        return Response(content=content, headers=headers)
-        
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Erreur lors de l'export des données: {str(e)}"
-        )
\ No newline at end of file
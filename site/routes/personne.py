@@ -3,8 +3,11 @@ from sqlalchemy.orm import Session
 from typing import List, Optional
 from pydantic import BaseModel, Field
 from datetime import datetime
-from database import get_db, Personne, CFI, Equipe, Pret
+from database import get_db, Personne, CFI, Equipe, Pret, PretArchive
 from auth import get_current_active_user, User
+from pagination import paginate, pagination_headers, count_total
+from search import build_match_query, fts_table, fts_match
+from echeances import reschedule_personne
 from typing import Optional, Union
 from pydantic import BaseModel, Field
 
@@ -79,9 +82,10 @@ def get_personne(db: Session, personne_id: int):
 
 # Routes pour la gestion des personnes
 @router.get("/", response_model=List[PersonneResponse])
-async def list_personnes(
+def list_personnes(
     skip: int = 0, 
     limit: int = 100, 
+    cursor: Optional[str] = None,
     search: Optional[str] = None,
     equipe_id: Optional[int] = None,
     cfi_id: Optional[int] = None,
@@ -98,12 +102,13 @@ async def list_personnes(
     
     # Appliquer les filtres si fournis
     if search:
-        search_term = f"%{search}%"
-        query = query.filter(
-            (Personne.nom.ilike(search_term)) | 
-            (Personne.prenom.ilike(search_term)) |
-            (Personne.code_barre.ilike(search_term))
-        )
+        # Recherche plein texte (préfixes) sur nom, prénom et code-barre, triée par pertinence
+        match_query = build_match_query(search)
+        if match_query:
+            personne_fts = fts_table("personne_fts")
+            query = query.join(personne_fts, personne_fts.c.rowid == Personne.id).filter(
+                fts_match("personne_fts", match_query)
+            ).order_by(personne_fts.c.rank)
     
     if equipe_id:
         query = query.filter(Personne.id_equipe == equipe_id)
@@ -112,10 +117,13 @@ async def list_personnes(
         query = query.filter(Personne.id_cfi == cfi_id)
     
     # Compter le nombre total pour la pagination
-    total_count = query.count()
+    total_count = count_total(query, ("personnes", search, equipe_id, cfi_id), ("Personne",))
     
     # Appliquer pagination
-    personnes = query.offset(skip).limit(limit).all()
+    # Une recherche est triée par pertinence : pagination par skip/limit uniquement
+    personnes, next_cursor = paginate(
+        query, [Personne.nom, Personne.prenom, Personne.id], skip, limit, cursor, keyset=not search
+    )
     
     # Convertir les objets SQLAlchemy en dictionnaires
     personnes_data = jsonable_encoder(personnes)
@@ -123,11 +131,11 @@ async def list_personnes(
     # Créer une réponse JSON avec l'en-tête personnalisé
     return JSONResponse(
         content=personnes_data,
-        headers={"X-Total-Count": str(total_count)}
+        headers=pagination_headers(total_count, next_cursor)
     )
 
 @router.get("/{personne_id}", response_model=PersonneDetailResponse)
-async def get_personne_details(
+def get_personne_details(
     personne_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -146,7 +154,7 @@ async def get_personne_details(
     return personne
 
 @router.post("/", response_model=PersonneResponse, status_code=status.HTTP_201_CREATED)
-async def create_personne(
+def create_personne(
     personne_data: PersonneCreate,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -190,7 +198,7 @@ async def create_personne(
     return new_personne
 
 @router.put("/{personne_id}", response_model=PersonneResponse)
-async def update_personne(
+def update_personne(
     personne_id: int,
     personne_data: PersonneUpdate,
     current_user: User = Depends(get_current_active_user),
@@ -227,16 +235,23 @@ async def update_personne(
                 detail=f"CFI avec l'ID {update_data['id_cfi']} non trouvé"
             )
     
+    changement_equipe = "id_equipe" in update_data and update_data["id_equipe"] != personne.id_equipe
+    
     for key, value in update_data.items():
         setattr(personne, key, value)
     
     db.commit()
+    
+    # Nouvelle équipe : échéance des prêts en cours recalculée avec sa durée de prêt
+    if changement_equipe:
+        reschedule_personne(db, personne_id)
+    
     db.refresh(personne)
     
     return personne
 
 @router.delete("/{personne_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_personne(
+def delete_personne(
     personne_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -248,6 +263,8 @@ async def delete_personne(
     
     # Vérifier s'il y a des prêts associés
     prets = db.query(Pret).filter(Pret.id_personne == personne_id).first()
+    if not prets:
+        prets = db.query(PretArchive).filter(PretArchive.id_personne == personne_id).first()
     if prets:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -263,7 +280,7 @@ async def delete_personne(
 # Routes supplémentaires
 
 @router.get("/{personne_id}/prets", response_model=List[PretResponse])
-async def get_personne_prets(
+def get_personne_prets(
     personne_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -282,7 +299,7 @@ async def get_personne_prets(
     return prets
 
 @router.get("/{personne_id}/prets/actifs", response_model=List[PretResponse])
-async def get_personne_prets_actifs(
+def get_personne_prets_actifs(
     personne_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
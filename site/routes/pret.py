@@ -1,10 +1,17 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import select, insert, exists, literal, true, String, Text, DateTime
+from sqlalchemy.exc import IntegrityError
 from typing import List, Optional
 from pydantic import BaseModel, Field
 from datetime import datetime
 from database import get_db, Pret, Radio, Personne
 from auth import get_current_active_user, User
+from pagination import paginate, pagination_headers, count_total
+from search import build_match_query, fts_ids
+from sketches import record_pret
+from echeances import scheduler, duree_pret
+from archive import next_pret_id
 
 router = APIRouter(prefix="/api/prets", tags=["prets"])
 
@@ -43,6 +50,8 @@ class PretResponse(PretBase):
     id: int
     date_emprunt: datetime
     date_retour: Optional[datetime] = None
+    date_echeance: Optional[datetime] = None
+    duree_secondes: Optional[float] = None
     radio: Optional[RadioResponse] = None
     personne: Optional[PersonneResponse] = None
     
@@ -59,11 +68,45 @@ def get_pret(db: Session, pret_id: int):
         )
     return pret
 
+# Fonction utilitaire pour expliquer pourquoi une radio ne peut pas être empruntée
+def check_disponibilite(db: Session, radio_id: int, personne_id: int):
+    radio = db.query(Radio).filter(Radio.id == radio_id).first()
+    if not radio:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Radio avec l'ID {radio_id} non trouvée"
+        )
+    
+    personne = db.query(Personne).filter(Personne.id == personne_id).first()
+    if not personne:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Personne avec l'ID {personne_id} non trouvée"
+        )
+    
+    if radio.en_maintenance:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cette radio est actuellement en maintenance et ne peut pas être empruntée"
+        )
+    
+    active_loan = db.query(Pret).filter(
+        Pret.id_radio == radio_id,
+        Pret.date_retour.is_(None)
+    ).first()
+    
+    if active_loan:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cette radio est déjà en prêt"
+        )
+
 # Routes pour la gestion des prêts
 @router.get("/", response_model=List[PretResponse])
-async def list_prets(
+def list_prets(
     skip: int = 0, 
     limit: int = 100, 
+    cursor: Optional[str] = None,
     search: Optional[str] = None,
     actif: Optional[bool] = None,
     id_personne: Optional[int] = None,
@@ -85,16 +128,14 @@ async def list_prets(
     
     # Appliquer les filtres si fournis
     if search:
-        # Recherche dans les commentaires ou via les relations
-        search_term = f"%{search}%"
-        query = query.join(Radio, Pret.id_radio == Radio.id).join(
-            Personne, Pret.id_personne == Personne.id
-        ).filter(
-            (Pret.commentaire.ilike(search_term)) | 
-            (Radio.code_barre.ilike(search_term)) |
-            (Personne.nom.ilike(search_term)) |
-            (Personne.prenom.ilike(search_term))
-        )
+        # Recherche plein texte dans les commentaires ou via les relations (sans jointure)
+        match_query = build_match_query(search)
+        if match_query:
+            query = query.filter(
+                Pret.id.in_(fts_ids("pret_fts", match_query)) |
+                Pret.id_radio.in_(fts_ids("radio_fts", match_query)) |
+                Pret.id_personne.in_(fts_ids("personne_fts", match_query))
+            )
     
     if actif is not None:
         if actif:
@@ -109,10 +150,14 @@ async def list_prets(
         query = query.filter(Pret.id_radio == id_radio)
     
     # Compter le nombre total pour la pagination
-    total_count = query.count()
+    total_count = count_total(
+        query, ("prets", search, actif, id_personne, id_radio), ("Pret", "Radio", "Personne")
+    )
     
     # Appliquer pagination
-    prets = query.order_by(Pret.date_emprunt.desc()).offset(skip).limit(limit).all()
+    prets, next_cursor = paginate(
+        query, [Pret.date_emprunt, Pret.id], skip, limit, cursor, descending=True
+    )
     
     # Convertir les objets SQLAlchemy en dictionnaires
     prets_data = jsonable_encoder(prets)
@@ -120,11 +165,37 @@ async def list_prets(
     # Créer une réponse JSON avec l'en-tête personnalisé
     return JSONResponse(
         content=prets_data,
-        headers={"X-Total-Count": str(total_count)}
+        headers=pagination_headers(total_count, next_cursor)
     )
 
+# Déclarée avant /{pret_id}, qui sinon intercepte /overdue
+@router.get("/overdue", response_model=List[PretResponse])
+def list_overdue_prets(
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Récupérer les prêts en retard (échéance dépassée), du plus ancien au plus récent
+    """
+    # Ensemble tenu à jour par le suivi des échéances (voir echeances.py) : seuls les k prêts
+    # en retard sont lus, par clé primaire
+    echeances = scheduler.overdue()
+    if not echeances:
+        return []
+    
+    prets = db.query(Pret).options(
+        joinedload(Pret.radio),
+        joinedload(Pret.personne)
+    ).filter(
+        Pret.id.in_([pret_id for pret_id, _ in echeances]),
+        # Prêt rendu entre-temps via un autre worker
+        Pret.date_retour.is_(None)
+    ).all()
+    
+    return sorted(prets, key=lambda pret: (pret.date_echeance, pret.id))
+
 @router.get("/{pret_id}", response_model=PretResponse)
-async def get_pret_details(
+def get_pret_details(
     pret_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -147,7 +218,7 @@ async def get_pret_details(
     return pret
 
 @router.post("/", response_model=PretResponse, status_code=status.HTTP_201_CREATED)
-async def create_pret(
+def create_pret(
     pret_data: PretCreate,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -155,72 +226,75 @@ async def create_pret(
     """
     Créer un nouveau prêt (emprunter une radio)
     """
-    # Vérifier si la radio existe
-    radio = db.query(Radio).filter(Radio.id == pret_data.id_radio).first()
-    if not radio:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Radio avec l'ID {pret_data.id_radio} non trouvée"
-        )
-    
-    # Vérifier si la personne existe
-    personne = db.query(Personne).filter(Personne.id == pret_data.id_personne).first()
-    if not personne:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Personne avec l'ID {pret_data.id_personne} non trouvée"
-        )
-    
-    # Vérifier si la radio est disponible (pas en maintenance et pas déjà en prêt)
-    if radio.en_maintenance:
+    # Valider les accessoires
+    valid_accessoires = ['oreillettes', 'micro', 'les deux', 'aucun']
+    if pret_data.accessoires not in valid_accessoires:
+        # Les erreurs radio / personne / disponibilité restent prioritaires
+        check_disponibilite(db, pret_data.id_radio, pret_data.id_personne)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Cette radio est actuellement en maintenance et ne peut pas être empruntée"
+            detail=f"Les accessoires doivent être l'un des suivants: {', '.join(valid_accessoires)}"
         )
     
-    active_loan = db.query(Pret).filter(
-        Pret.id_radio == pret_data.id_radio,
-        Pret.date_retour.is_(None)
-    ).first()
-    
-    if active_loan:
+    # Insertion gardée en une seule instruction : la ligne n'est insérée que si la radio
+    # et la personne existent, que la radio n'est pas en maintenance et qu'elle n'a pas
+    # de prêt actif. L'index unique partiel idx_pret_actif_unique tranche les courses
+    # entre deux emprunts simultanés de la même radio. L'identifiant dépasse ceux des
+    # prêts archivés (voir archive.next_pret_id).
+    # Échéance selon la durée de prêt de l'équipe de l'emprunteur
+    date_emprunt = datetime.now()
+    date_echeance = date_emprunt + duree_pret(db, pret_data.id_personne)
+    eligible = select(
+        next_pret_id(),
+        Radio.id,
+        Personne.id,
+        literal(pret_data.accessoires, String),
+        literal(pret_data.commentaire, Text),
+        literal(date_emprunt, DateTime),
+        literal(date_echeance, DateTime)
+    ).select_from(Radio).join(
+        # Produit cartésien explicite : une ligne au plus de chaque côté (clés primaires)
+        Personne, true()
+    ).where(
+        Radio.id == pret_data.id_radio,
+        Personne.id == pret_data.id_personne,
+        Radio.en_maintenance == False,
+        ~exists().where(Pret.id_radio == Radio.id, Pret.date_retour.is_(None))
+    )
+    stmt = insert(Pret).from_select(
+        ["id", "id_radio", "id_personne", "accessoires", "commentaire", "date_emprunt", "date_echeance"], eligible
+    ).returning(Pret.id)
+    
+    try:
+        new_pret_id = db.execute(stmt).scalar()
+        db.commit()
+    except IntegrityError:
+        db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Cette radio est déjà en prêt"
         )
     
-    # Valider les accessoires
-    valid_accessoires = ['oreillettes', 'micro', 'les deux', 'aucun']
-    if pret_data.accessoires not in valid_accessoires:
+    if new_pret_id is None:
+        # Aucune ligne insérée : déterminer la raison pour retourner l'erreur appropriée
+        check_disponibilite(db, pret_data.id_radio, pret_data.id_personne)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Les accessoires doivent être l'un des suivants: {', '.join(valid_accessoires)}"
+            detail="Cette radio est déjà en prêt"
         )
     
-    # Créer le nouveau prêt
-    new_pret = Pret(
-        id_radio=pret_data.id_radio,
-        id_personne=pret_data.id_personne,
-        accessoires=pret_data.accessoires,
-        commentaire=pret_data.commentaire,
-        date_emprunt=datetime.now(),
-        date_retour=None
-    )
-    
-    db.add(new_pret)
-    db.commit()
-    db.refresh(new_pret)
+    scheduler.schedule(new_pret_id, date_echeance)
     
-    # Recharger le prêt avec ses relations pour la réponse
+    # Charger le prêt avec ses relations pour la réponse
     pret_with_relations = db.query(Pret).options(
         joinedload(Pret.radio),
         joinedload(Pret.personne)
-    ).filter(Pret.id == new_pret.id).first()
+    ).filter(Pret.id == new_pret_id).first()
     
     return pret_with_relations
 
 @router.put("/{pret_id}/retour", response_model=PretResponse)
-async def return_radio(
+def return_radio(
     pret_id: int,
     pret_update: Optional[PretUpdate] = None,
     current_user: User = Depends(get_current_active_user),
@@ -238,14 +312,16 @@ async def return_radio(
             detail="Cette radio a déjà été retournée"
         )
     
-    # Mettre à jour la date de retour
+    # Mettre à jour la date de retour et la durée du prêt
     pret.date_retour = datetime.now()
+    pret.duree_secondes = (pret.date_retour - pret.date_emprunt).total_seconds()
     
     # Mettre à jour le commentaire si fourni
     if pret_update and pret_update.commentaire is not None:
         pret.commentaire = pret_update.commentaire
     
     db.commit()
+    scheduler.cancel(pret.id)
     
     # Recharger le prêt avec ses relations pour la réponse
     pret_with_relations = db.query(Pret).options(
@@ -253,10 +329,13 @@ async def return_radio(
         joinedload(Pret.personne)
     ).filter(Pret.id == pret.id).first()
     
+    # Durée du prêt ajoutée aux sketches de durée (percentiles de l'historique)
+    record_pret(pret_with_relations)
+    
     return pret_with_relations
 
 @router.put("/{pret_id}", response_model=PretResponse)
-async def update_pret(
+def update_pret(
     pret_id: int,
     pret_update: PretUpdate,
     current_user: User = Depends(get_current_active_user),
@@ -282,7 +361,7 @@ async def update_pret(
     return pret_with_relations
 
 @router.get("/radio/{radio_id}/actif", response_model=Optional[PretResponse])
-async def get_active_loan_for_radio(
+def get_active_loan_for_radio(
     radio_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -310,7 +389,7 @@ async def get_active_loan_for_radio(
     return active_loan
 
 @router.get("/personne/{personne_id}/actifs", response_model=List[PretResponse])
-async def get_active_loans_for_personne(
+def get_active_loans_for_personne(
     personne_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
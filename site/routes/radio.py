@@ -3,8 +3,10 @@ from sqlalchemy.orm import Session
 from typing import List, Optional
 from pydantic import BaseModel, Field
 from datetime import datetime
-from database import get_db, Radio, Maintenance, Pret
+from database import get_db, Radio, RadioEtat, Maintenance, Pret, PretArchive
 from auth import get_current_active_user, User
+from pagination import paginate, pagination_headers, count_total
+from search import build_match_query, fts_table, fts_match
 
 router = APIRouter(prefix="/api/radios", tags=["radios"])
 
@@ -75,9 +77,10 @@ def get_radio(db: Session, radio_id: int):
 
 # Routes pour la gestion des radios
 @router.get("/", response_model=List[RadioResponse])
-async def list_radios(
+def list_radios(
     skip: int = 0, 
     limit: int = 100, 
+    cursor: Optional[str] = None,
     search: Optional[str] = None,
     maintenance: Optional[bool] = None,
     en_pret: Optional[bool] = None,
@@ -95,33 +98,37 @@ async def list_radios(
     
     # Appliquer les filtres si fournis
     if search:
-        search_term = f"%{search}%"
-        query = query.filter(
-            (Radio.code_barre.ilike(search_term)) | 
-            (Radio.marque.ilike(search_term)) | 
-            (Radio.modele.ilike(search_term))
-        )
+        # Recherche plein texte (préfixes) sur code-barre, marque et modèle, triée par pertinence
+        match_query = build_match_query(search)
+        if match_query:
+            radio_fts = fts_table("radio_fts")
+            query = query.join(radio_fts, radio_fts.c.rowid == Radio.id).filter(
+                fts_match("radio_fts", match_query)
+            ).order_by(radio_fts.c.rank)
     
     if maintenance is not None:
         query = query.filter(Radio.en_maintenance == maintenance)
     
+    # Les filtres de disponibilité s'appuient sur l'état courant maintenu par les triggers (RadioEtat)
+    if en_pret or disponible:
+        query = query.join(RadioEtat, RadioEtat.id_radio == Radio.id)
+    
     # Nouveau filtre pour les radios en prêt
     if en_pret is not None and en_pret:
-        # Sous-requête pour trouver les radios qui ont au moins un prêt actif
-        subquery = db.query(Pret.id_radio).filter(Pret.date_retour.is_(None)).distinct().subquery()
-        query = query.filter(Radio.id.in_(subquery))
+        query = query.filter(RadioEtat.id_pret.isnot(None))
     
     # Filtre pour les radios disponibles (ni en prêt, ni en maintenance)
     if disponible is not None and disponible:
-        # Sous-requête pour exclure les radios en prêt
-        pret_subquery = db.query(Pret.id_radio).filter(Pret.date_retour.is_(None)).distinct().subquery()
-        query = query.filter(~Radio.id.in_(pret_subquery)).filter(Radio.en_maintenance == False)
+        query = query.filter(RadioEtat.id_pret.is_(None), RadioEtat.en_maintenance == False)
     
     # Compter le nombre total pour la pagination
-    total_count = query.count()
+    total_count = count_total(
+        query, ("radios", search, maintenance, en_pret, disponible), ("Radio", "Pret", "Maintenance")
+    )
     
     # Appliquer pagination
-    radios = query.offset(skip).limit(limit).all()
+    # Une recherche est triée par pertinence : pagination par skip/limit uniquement
+    radios, next_cursor = paginate(query, [Radio.id], skip, limit, cursor, keyset=not search)
     
     # Convertir les objets SQLAlchemy en dictionnaires
     radios_data = jsonable_encoder(radios)
@@ -129,12 +136,12 @@ async def list_radios(
     # Créer une réponse JSON avec l'en-tête personnalisé
     return JSONResponse(
         content=radios_data,
-        headers={"X-Total-Count": str(total_count)}
+        headers=pagination_headers(total_count, next_cursor)
     )
 
 
 @router.get("/{radio_id}", response_model=RadioDetailResponse)
-async def get_radio_details(
+def get_radio_details(
     radio_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -151,7 +158,7 @@ async def get_radio_details(
     return radio
 
 @router.post("/", response_model=RadioResponse, status_code=status.HTTP_201_CREATED)
-async def create_radio(
+def create_radio(
     radio_data: RadioCreate,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -179,7 +186,7 @@ async def create_radio(
     return new_radio
 
 @router.put("/{radio_id}", response_model=RadioResponse)
-async def update_radio(
+def update_radio(
     radio_id: int,
     radio_data: RadioUpdate,
     current_user: User = Depends(get_current_active_user),
@@ -215,7 +222,7 @@ async def update_radio(
     return radio
 
 @router.delete("/{radio_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_radio(
+def delete_radio(
     radio_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -227,6 +234,8 @@ async def delete_radio(
     
     # Vérifier s'il y a des prêts associés
     loans = db.query(Pret).filter(Pret.id_radio == radio_id).first()
+    if not loans:
+        loans = db.query(PretArchive).filter(PretArchive.id_radio == radio_id).first()
     if loans:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -244,7 +253,7 @@ async def delete_radio(
 
 # Routes pour la gestion de la maintenance
 @router.post("/{radio_id}/maintenance", response_model=MaintenanceResponse, status_code=status.HTTP_201_CREATED)
-async def start_maintenance(
+def start_maintenance(
     radio_id: int,
     maintenance_data: MaintenanceCreate,
     current_user: User = Depends(get_current_active_user),
@@ -292,7 +301,7 @@ async def start_maintenance(
     return maintenance
 
 @router.put("/{radio_id}/maintenance/{maintenance_id}/end", response_model=MaintenanceResponse)
-async def end_maintenance(
+def end_maintenance(
     radio_id: int,
     maintenance_id: int,
     current_user: User = Depends(get_current_active_user),
@@ -342,7 +351,7 @@ async def end_maintenance(
     return maintenance
 
 @router.get("/{radio_id}/maintenance", response_model=List[MaintenanceResponse])
-async def get_maintenance_history(
+def get_maintenance_history(
     radio_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -362,7 +371,7 @@ async def get_maintenance_history(
 
 # Nouvelle route pour vérifier si une radio est en prêt
 @router.get("/{radio_id}/en-pret", response_model=bool)
-async def is_radio_loaned(
+def is_radio_loaned(
     radio_id: int,
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
@@ -0,0 +1,27 @@
+import re
+from sqlalchemy import select, table, column, literal_column
+
+# Recherche plein texte via les tables FTS5 définies dans database.py (SEARCH_INDEXES)
+
+def build_match_query(search: str):
+    """
+    Convertit une saisie libre en requête FTS5 : chaque mot devient un préfixe
+    ("dup" trouve "Dupont", "rad 0001" trouve "RAD-00012"), tous les mots doivent correspondre.
+    Retourne None si la saisie ne contient aucun mot indexable.
+    """
+    tokens = re.findall(r"\w+", search or "")
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
+
+def fts_table(name: str):
+    return table(name, column("rowid"), column("rank"))
+
+def fts_match(name: str, match_query: str):
+    """Condition MATCH sur la table FTS `name`"""
+    return literal_column(name).op("MATCH")(match_query)
+
+def fts_ids(name: str, match_query: str):
+    """Sous-requête des identifiants (rowid) correspondant à la recherche"""
+    fts = fts_table(name)
+    return select(fts.c.rowid).where(fts_match(name, match_query))
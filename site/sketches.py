@@ -0,0 +1,267 @@
+import math
+import os
+import threading
+from collections import Counter, defaultdict
+from sqlalchemy import select, delete, text, union_all
+from sqlalchemy.orm import Session
+from database import SessionLocal, PretDureeSketch, Pret, PretArchive, Personne, Radio
+from expressions import duree_entre
+
+# Distribution des durées de prêt : sketches de quantiles DDSketch
+# Chaque durée (prêt rendu) est comptée dans un compartiment logarithmique
+# ]GAMMA^(i-1), GAMMA^i] : tout quantile est restitué avec une erreur relative d'au plus
+# PRECISION, quel que soit le nombre de prêts. Les sketches se fusionnent en additionnant
+# les compteurs, ce qui permet :
+# - de les tenir à jour au retour d'un prêt (routes/pret.py) sans relire la table Pret,
+# - d'accumuler les retours en mémoire et de les écrire périodiquement (deltas additionnés
+#   en base, y compris depuis plusieurs workers),
+# - de répondre aux requêtes en lisant uniquement les compteurs (table PretDureeSketch).
+# Les retours non encore écrits par les autres workers apparaissent à leur prochaine écriture.
+# Configuration :
+# - RADIOTRACK_SKETCH_INTERVALLE_SECONDES : période d'écriture des deltas (défaut 60,
+#   0 = écriture à chaque retour)
+
+PRECISION = 0.01  # Erreur relative maximale sur les quantiles
+GAMMA = (1 + PRECISION) / (1 - PRECISION)
+LOG_GAMMA = math.log(GAMMA)
+DUREE_MIN = 1.0  # secondes ; les durées inférieures sont comptées dans le premier compartiment
+
+SKETCH_INTERVALLE = float(os.getenv("RADIOTRACK_SKETCH_INTERVALLE_SECONDES", "60"))
+SKETCH_LOT = 1000  # Prêts lus par aller-retour lors du recalcul complet
+
+# Bornes de l'histogramme des durées (heures)
+HISTOGRAMME_BORNES = [1, 4, 12, 24, 48, 168, 720]
+
+def bucket_index(duree: float):
+    """Compartiment contenant une durée en secondes"""
+    return math.ceil(math.log(max(duree, DUREE_MIN)) / LOG_GAMMA)
+
+def bucket_value(indice: int):
+    """Valeur représentative d'un compartiment (erreur relative <= PRECISION sur tout le compartiment)"""
+    return 2 * GAMMA ** indice / (GAMMA + 1)
+
+
+class DDSketch:
+    """Sketch de quantiles : nombre de valeurs par compartiment logarithmique"""
+
+    def __init__(self, counts=None):
+        self.counts = Counter(counts or {})
+
+    @property
+    def count(self):
+        return sum(self.counts.values())
+
+    def add(self, duree: float, nombre: int = 1):
+        self.counts[bucket_index(duree)] += nombre
+
+    def merge(self, other: "DDSketch"):
+        self.counts.update(other.counts)
+        return self
+
+    def quantile(self, q: float):
+        """Quantile q (0..1) en secondes, None si le sketch est vide"""
+        total = self.count
+        if not total:
+            return None
+        rang = q * (total - 1)
+        cumul = 0
+        for indice in sorted(self.counts):
+            cumul += self.counts[indice]
+            if cumul > rang:
+                return bucket_value(indice)
+        return bucket_value(max(self.counts))
+
+    def histogram(self, bornes=HISTOGRAMME_BORNES):
+        """Nombre de valeurs par classe de durée, bornes en heures"""
+        classes = [0] * (len(bornes) + 1)
+        limites = [borne * 3600 for borne in bornes]
+        for indice, nombre in self.counts.items():
+            valeur = bucket_value(indice)
+            position = next((i for i, limite in enumerate(limites) if valeur < limite), len(limites))
+            classes[position] += nombre
+        minimums = [0] + list(bornes)
+        maximums = list(bornes) + [None]
+        return [
+            {"min_heures": minimum, "max_heures": maximum, "count": nombre}
+            for minimum, maximum, nombre in zip(minimums, maximums, classes)
+        ]
+
+    def summary(self):
+        """Nombre de prêts, percentiles p50 / p90 / p99 (heures) et histogramme"""
+        def heures(q):
+            valeur = self.quantile(q)
+            return valeur / 3600 if valeur is not None else None
+        return {
+            "count": self.count,
+            "p50_heures": heures(0.5),
+            "p90_heures": heures(0.9),
+            "p99_heures": heures(0.99),
+            "histogramme": self.histogram(),
+        }
+
+
+def sketch_keys(id_equipe, id_cfi, marque, modele):
+    """Sketches (dimension, clé) auxquels contribue un prêt"""
+    keys = [("global", "")]
+    if id_equipe is not None:
+        keys.append(("equipe", str(id_equipe)))
+    if id_cfi is not None:
+        keys.append(("cfi", str(id_cfi)))
+    if modele is not None:
+        keys.append(("modele", f"{marque} {modele}"))
+    return keys
+
+# Deltas accumulés depuis la dernière écriture : (dimension, clé) -> {compartiment: nombre}
+_pending = defaultdict(Counter)
+_pending_lock = threading.Lock()
+
+def record_duree(duree: float, id_equipe, id_cfi, marque, modele):
+    """Ajoute la durée d'un prêt rendu aux sketches (écrite en base au prochain flush_sketches)"""
+    indice = bucket_index(duree)
+    with _pending_lock:
+        for key in sketch_keys(id_equipe, id_cfi, marque, modele):
+            _pending[key][indice] += 1
+
+def record_pret(pret):
+    """Ajoute aux sketches la durée d'un prêt qui vient d'être rendu"""
+    personne = pret.personne
+    radio = pret.radio
+    record_duree(
+        pret.duree_secondes,
+        personne.id_equipe if personne else None,
+        personne.id_cfi if personne else None,
+        radio.marque if radio else None,
+        radio.modele if radio else None
+    )
+    if SKETCH_INTERVALLE <= 0:
+        # Le retour est déjà enregistré : un échec d'écriture ne doit pas le faire échouer,
+        # les deltas restent en attente jusqu'au prochain retour
+        try:
+            flush_sketches()
+        except Exception as e:
+            print(f"Erreur lors de l'écriture des sketches de durée: {e}")
+
+_upsert = text(
+    """
+    INSERT INTO PretDureeSketch (dimension, cle, indice, nombre)
+    VALUES (:dimension, :cle, :indice, :nombre)
+    ON CONFLICT(dimension, cle, indice) DO UPDATE SET nombre = nombre + excluded.nombre
+    """
+)
+
+def flush_sketches():
+    """Écrit les deltas en attente (additionnés aux compteurs en base) ; retourne le nombre de lignes"""
+    global _pending
+    with _pending_lock:
+        deltas, _pending = _pending, defaultdict(Counter)
+    rows = [
+        {"dimension": dimension, "cle": cle, "indice": indice, "nombre": nombre}
+        for (dimension, cle), counts in deltas.items()
+        for indice, nombre in counts.items()
+    ]
+    if not rows:
+        return 0
+
+    db = SessionLocal()
+    try:
+        db.execute(_upsert, rows)
+        db.commit()
+    except Exception:
+        db.rollback()
+        # Les deltas sont conservés pour la prochaine tentative
+        with _pending_lock:
+            for key, counts in deltas.items():
+                _pending[key].update(counts)
+        raise
+    finally:
+        db.close()
+    return len(rows)
+
+def load_sketches(db: Session, dimension: str = None):
+    """
+    Sketches enregistrés (plus les deltas non encore écrits de ce processus),
+    sous forme de dictionnaire (dimension, clé) -> DDSketch.
+    """
+    query = select(PretDureeSketch.dimension, PretDureeSketch.cle, PretDureeSketch.indice, PretDureeSketch.nombre)
+    if dimension is not None:
+        query = query.where(PretDureeSketch.dimension == dimension)
+
+    sketches = defaultdict(DDSketch)
+    for row in db.execute(query):
+        sketches[(row.dimension, row.cle)].counts[row.indice] += row.nombre
+    with _pending_lock:
+        for key, counts in _pending.items():
+            if dimension is None or key[0] == dimension:
+                sketches[key].counts.update(counts)
+    return sketches
+
+def rebuild_sketches(connection):
+    """
+    Recalcule tous les sketches à partir des prêts rendus, courants et archivés
+    (remplissage initial ou correction ; commande : python sketches.py).
+    """
+    # Seules les colonnes utiles sont lues (et non pret_historique(), qui sélectionne toutes
+    # les colonnes de Pret) : le recalcul s'exécute aussi dans une étape de migration,
+    # avant l'ajout des colonnes des étapes suivantes
+    prets = union_all(*[
+        select(
+            table.c.id_radio,
+            table.c.id_personne,
+            duree_entre(table.c.date_emprunt, table.c.date_retour).label("duree")
+        ).where(table.c.date_retour.isnot(None))
+        for table in (Pret.__table__, PretArchive.__table__)
+    ]).subquery("prets_rendus")
+    query = select(
+        prets.c.duree,
+        Personne.id_equipe,
+        Personne.id_cfi,
+        Radio.marque,
+        Radio.modele
+    ).select_from(prets).outerjoin(
+        Personne, prets.c.id_personne == Personne.id
+    ).outerjoin(
+        Radio, prets.c.id_radio == Radio.id
+    )
+
+    counts = defaultdict(Counter)
+    result = connection.execution_options(yield_per=SKETCH_LOT).execute(query)
+    for row in result:
+        indice = bucket_index(row.duree)
+        for key in sketch_keys(row.id_equipe, row.id_cfi, row.marque, row.modele):
+            counts[key][indice] += 1
+
+    connection.execute(delete(PretDureeSketch))
+    rows = [
+        {"dimension": dimension, "cle": cle, "indice": indice, "nombre": nombre}
+        for (dimension, cle), bucket_counts in counts.items()
+        for indice, nombre in bucket_counts.items()
+    ]
+    if rows:
+        connection.execute(PretDureeSketch.__table__.insert(), rows)
+
+def start_sketch_flusher():
+    """Lance l'écriture périodique des deltas dans un thread de fond (une fois par processus)"""
+    if SKETCH_INTERVALLE <= 0:
+        return None
+
+    stop = threading.Event()
+
+    def run():
+        while not stop.wait(SKETCH_INTERVALLE):
+            try:
+                flush_sketches()
+            except Exception as e:
+                print(f"Erreur lors de l'écriture des sketches de durée: {e}")
+
+    threading.Thread(target=run, name="sketches-durees", daemon=True).start()
+    return stop
+
+# Recalcul manuel : python sketches.py (application arrêtée, les deltas en attente
+# d'un worker en cours d'exécution seraient sinon comptés deux fois)
+if __name__ == "__main__":
+    from database import engine, init_db
+
+    init_db()
+    with engine.begin() as conn:
+        rebuild_sketches(conn)
+    print("Sketches de durée des prêts recalculés.")
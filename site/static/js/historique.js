@@ -395,8 +395,8 @@ document.addEventListener('DOMContentLoaded', function() {
                     duree = `${diffHours}h`;
                 }
                 
-                // Marquer les prêts de longue durée (plus de 7 jours)
-                if (diffDays > 7) {
+                // Marquer les prêts en retard (échéance dépassée)
+                if (estEnRetard(pret)) {
                     dureeClass = 'text-danger';
                 }
             }
@@ -405,12 +405,7 @@ document.addEventListener('DOMContentLoaded', function() {
             let statut = 'Retourné';
             let statutClass = 'status-returned';
             if (!pret.date_retour) {
-                const now = new Date();
-                const emprunt = new Date(pret.date_emprunt);
-                const diffTime = Math.abs(now - emprunt);
-                const diffDays = Math.floor(diffTime / (1000 * 60 * 60 * 24));
-                
-                if (diffDays > 7) {
+                if (estEnRetard(pret)) {
                     statut = 'En retard';
                     statutClass = 'status-overdue';
                 } else {
@@ -488,6 +483,21 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
+    /**
+     * Indiquer si un prêt actif a dépassé son échéance
+     * (durée de prêt de l'équipe, 7 jours pour les prêts sans échéance)
+     */
+    function estEnRetard(pret) {
+        if (pret.date_retour) {
+            return false;
+        }
+        const now = new Date();
+        if (pret.date_echeance) {
+            return new Date(pret.date_echeance) < now;
+        }
+        return now - new Date(pret.date_emprunt) > 7 * 24 * 60 * 60 * 1000;
+    }
+    
     /**
      * Formater les accessoires pour l'affichage
      */
@@ -583,17 +593,8 @@ document.addEventListener('DOMContentLoaded', function() {
                 dureeMoyenneElement.textContent = 'N/A';
             }
             
-            // Prêts de longue durée (plus de 7 jours)
-            const now = new Date();
-            const pretsLongueDuree = allPretsData.filter(pret => {
-                if (!pret.date_retour) {
-                    const emprunt = new Date(pret.date_emprunt);
-                    const diffTime = Math.abs(now - emprunt);
-                    const diffDays = Math.floor(diffTime / (1000 * 60 * 60 * 24));
-                    return diffDays > 7;
-                }
-                return false;
-            });
+            // Prêts en retard (échéance dépassée)
+            const pretsLongueDuree = allPretsData.filter(pret => estEnRetard(pret));
             pretsLongTermeElement.textContent = pretsLongueDuree.length;
         } else {
             // Si les données complètes ne sont pas disponibles, utiliser les filtres actuels
@@ -661,15 +662,17 @@ document.addEventListener('DOMContentLoaded', function() {
     async function exportPretsCSV() {
         try {
             // Récupérer tous les prêts avec les filtres actuels
-            let url = `/api/historique/prets/export?limit=10000`;
+            const params = new URLSearchParams();
             
             // Ajouter les filtres à l'URL
             for (const [key, value] of Object.entries(currentFilters)) {
                 if (value) {
-                    url += `&${key}=${encodeURIComponent(value)}`;
+                    params.append(key, value);
                 }
             }
             
+            let url = `/api/historique/prets/export?${params.toString()}`;
+            
             const response = await fetch(url);
             
             if (!response.ok) {
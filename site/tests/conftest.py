@@ -0,0 +1,67 @@
+import os
+import sys
+import tempfile
+import pytest
+from contextlib import contextmanager
+
+# Base de données temporaire et écriture immédiate des sketches, avant l'import de l'application
+SITE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix="radiotrack_tests_"), "radio_tracker.db")
+os.environ["RADIOTRACK_DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ["RADIOTRACK_SKETCH_INTERVALLE_SECONDES"] = "0"
+sys.path.insert(0, SITE_DIR)
+os.chdir(SITE_DIR)
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from database import init_db, engine, SessionLocal, Radio, Personne, CFI, User
+import auth
+import main
+
+init_db()
+
+@pytest.fixture
+def client():
+    main.app.dependency_overrides[auth.get_current_active_user] = lambda: User(id=1, username="test", is_active=True)
+    yield TestClient(main.app)
+    main.app.dependency_overrides.clear()
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    yield session
+    session.close()
+
+@pytest.fixture
+def radio_personne(db):
+    """Une radio et une personne disponibles pour un prêt"""
+    cfi = CFI(nom=f"CFI {os.urandom(4).hex()}", responsable="Responsable")
+    db.add(cfi)
+    db.flush()
+    radio = Radio(marque="Motorola", modele="DP4400", numero_serie=os.urandom(4).hex(), est_geolocalisable=False)
+    personne = Personne(nom="Dupont", prenom="Jean", id_cfi=cfi.id)
+    db.add_all([radio, personne])
+    db.commit()
+    return radio.id, personne.id
+
+@pytest.fixture
+def make_radio(db):
+    """Fabrique de radios (numéro de série unique)"""
+    def make(marque="Motorola", modele="DP4400"):
+        radio = Radio(marque=marque, modele=modele, numero_serie=os.urandom(6).hex(), est_geolocalisable=False)
+        db.add(radio)
+        db.commit()
+        return radio.id
+    return make
+
+@contextmanager
+def compter_requetes():
+    """Compte les instructions SQL exécutées dans le bloc (liste à un élément)"""
+    compteur = [0]
+    def compter(*args):
+        compteur[0] += 1
+    event.listen(engine, "before_cursor_execute", compter)
+    try:
+        yield compteur
+    finally:
+        event.remove(engine, "before_cursor_execute", compter)
@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from database import Pret, PretArchive
+from archive import archive_prets
+
+# Date de référence lointaine : tous les prêts rendus sont archivables
+FUTUR = datetime.now() + timedelta(days=3650)
+
+def emprunter_rendre(client, id_radio, id_personne):
+    pret_id = client.post("/api/prets", json={"id_radio": id_radio, "id_personne": id_personne}).json()["id"]
+    assert client.put(f"/api/prets/{pret_id}/retour").status_code == 200
+    return pret_id
+
+def test_archive_puis_nouveau_pret(client, db, radio_personne):
+    id_radio, id_personne = radio_personne
+    archives = [emprunter_rendre(client, id_radio, id_personne) for _ in range(2)]
+    archive_prets(1, now=FUTUR)
+    assert db.query(Pret).filter(Pret.id.in_(archives)).count() == 0
+    assert db.query(PretArchive).filter(PretArchive.id.in_(archives)).count() == 2
+
+    # Le nouveau prêt ne réutilise pas l'identifiant d'un prêt archivé
+    response = client.post("/api/prets", json={"id_radio": id_radio, "id_personne": id_personne})
+    assert response.status_code == 201
+    pret_id = response.json()["id"]
+    assert pret_id > db.query(func.max(PretArchive.id)).scalar()
+
+    # Un second passage laisse le prêt actif en place
+    archive_prets(1, now=FUTUR)
+    db.expire_all()
+    assert db.get(Pret, pret_id) is not None
+
+    # Puis l'archive une fois rendu
+    assert client.put(f"/api/prets/{pret_id}/retour").status_code == 200
+    archive_prets(1, now=FUTUR)
+    db.expire_all()
+    assert db.get(Pret, pret_id) is None
+    assert db.get(PretArchive, pret_id).id_radio == id_radio
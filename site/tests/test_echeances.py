@@ -0,0 +1,43 @@
+from datetime import timedelta
+
+from database import Pret, Equipe
+from echeances import DUREE_PRET_DEFAUT
+
+def echeance(db, pret_id):
+    db.expire_all()
+    pret = db.get(Pret, pret_id)
+    return pret.date_echeance - pret.date_emprunt
+
+def test_changement_equipe_recalcule_echeance(client, db, radio_personne):
+    id_radio, id_personne = radio_personne
+    equipe = Equipe(nom=f"Équipe {id_personne}", categorie="secours", duree_pret_heures=4)
+    db.add(equipe)
+    db.commit()
+    pret_id = client.post("/api/prets", json={"id_radio": id_radio, "id_personne": id_personne}).json()["id"]
+    assert echeance(db, pret_id) == timedelta(hours=DUREE_PRET_DEFAUT)
+
+    # Mise à jour de la personne : durée de prêt de sa nouvelle équipe
+    response = client.put(f"/api/personnes/{id_personne}", json={"id_equipe": equipe.id})
+    assert response.status_code == 200
+    assert echeance(db, pret_id) == timedelta(hours=4)
+
+    # Retrait puis ajout par les routes des membres de l'équipe
+    assert client.delete(f"/api/equipes/{equipe.id}/membres/{id_personne}").status_code == 200
+    assert echeance(db, pret_id) == timedelta(hours=DUREE_PRET_DEFAUT)
+    assert client.post(f"/api/equipes/{equipe.id}/membres/{id_personne}").status_code == 200
+    assert echeance(db, pret_id) == timedelta(hours=4)
+
+def test_pret_en_retard_apres_changement_equipe(client, db, radio_personne):
+    id_radio, id_personne = radio_personne
+    equipe = Equipe(nom=f"Équipe courte {id_personne}", categorie="secours", duree_pret_heures=1)
+    db.add(equipe)
+    db.commit()
+    pret_id = client.post("/api/prets", json={"id_radio": id_radio, "id_personne": id_personne}).json()["id"]
+    pret = db.get(Pret, pret_id)
+    pret.date_emprunt -= timedelta(hours=2)
+    db.commit()
+
+    # Emprunté il y a deux heures : en retard dès le passage dans une équipe à 1 h
+    assert client.put(f"/api/personnes/{id_personne}", json={"id_equipe": equipe.id}).status_code == 200
+    en_retard = [p["id"] for p in client.get("/api/prets/overdue").json()]
+    assert pret_id in en_retard
@@ -0,0 +1,112 @@
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert
+
+from database import Pret
+from exports import csv_chunks, get_job
+from routes.historique import PretFilter, PRET_CSV_HEADER, pret_csv_row, pret_export_query
+
+def inserer_prets(db, id_radio, id_personne, nombre):
+    debut = datetime(2020, 1, 1)
+    db.execute(insert(Pret), [
+        {
+            "id_radio": id_radio, "id_personne": id_personne, "accessoires": "aucun",
+            "commentaire": f"prêt {i}", "date_emprunt": debut + timedelta(minutes=i),
+            "date_retour": debut + timedelta(minutes=i, hours=2), "duree_secondes": 7200.0,
+        }
+        for i in range(nombre)
+    ])
+    db.commit()
+
+def pic_memoire_export(db, id_personne):
+    """Pic de mémoire (octets) et nombre de lignes de l'export CSV des prêts d'une personne"""
+    statement = pret_export_query(db, PretFilter(personne=id_personne))
+    lignes = 0
+    tracemalloc.start()
+    try:
+        for chunk in csv_chunks(statement, PRET_CSV_HEADER, pret_csv_row):
+            lignes += chunk.count("\n")
+        return tracemalloc.get_traced_memory()[1], lignes - 1
+    finally:
+        tracemalloc.stop()
+
+def test_export_csv_memoire_constante(db, radio_personne, make_radio):
+    id_radio, id_personne = radio_personne
+    try:
+        inserer_prets(db, id_radio, id_personne, 1000)
+        pic_petit, lignes = pic_memoire_export(db, id_personne)
+        assert lignes == 1000
+
+        inserer_prets(db, make_radio(), id_personne, 19000)
+        pic_grand, lignes = pic_memoire_export(db, id_personne)
+        assert lignes == 20000
+    finally:
+        db.execute(delete(Pret).where(Pret.id_personne == id_personne))
+        db.commit()
+
+    # 20 fois plus de lignes : le pic reste celui d'un lot (EXPORT_LOT lignes)
+    assert pic_grand < 2 * pic_petit, (pic_petit, pic_grand)
+
+def attendre_export(job):
+    for _ in range(600):
+        if job.statut not in ("en_attente", "en_cours"):
+            return
+        time.sleep(0.05)
+    raise AssertionError(f"export {job.id} non terminé")
+
+def pic_memoire_tache(client, id_personne):
+    """Pic de mémoire (octets, tous threads confondus) et état final d'une tâche d'export des prêts"""
+    tracemalloc.start()
+    try:
+        response = client.post("/api/exports/prets", json={"personne": id_personne})
+        assert response.status_code == 202
+        # Attente sur la tâche elle-même : les requêtes de suivi fausseraient la mesure
+        job_id = response.json()["id"]
+        attendre_export(get_job(job_id, 1))
+        pic = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return pic, client.get(f"/api/exports/{job_id}").json()
+
+def test_tache_export_puis_telechargement_partiel(client, db, radio_personne, make_radio):
+    id_radio, id_personne = radio_personne
+    try:
+        inserer_prets(db, id_radio, id_personne, 2000)
+        # Premier export : compilation des requêtes et allocations ponctuelles hors mesure
+        pic_memoire_tache(client, id_personne)
+        pic_petit, job = pic_memoire_tache(client, id_personne)
+        assert job["statut"] == "termine" and job["lignes_ecrites"] == 2000
+
+        inserer_prets(db, make_radio(), id_personne, 8000)
+        pic_grand, job = pic_memoire_tache(client, id_personne)
+        assert job["statut"] == "termine" and job["lignes_ecrites"] == 10000
+    finally:
+        db.execute(delete(Pret).where(Pret.id_personne == id_personne))
+        db.commit()
+
+    # Fichier écrit lot par lot : le pic ne dépend pas du nombre de lignes
+    # (au-delà d'un lot : lot lu et lot suivant)
+    assert pic_grand < 1.5 * pic_petit, (pic_petit, pic_grand)
+
+    url = f"/api/exports/{job['id']}/download"
+    complet = client.get(url)
+    assert complet.status_code == 200
+    assert complet.headers["accept-ranges"] == "bytes"
+    contenu = complet.content
+    taille = len(contenu)
+    assert taille == job["taille"]
+    assert contenu.decode("utf-8").count("\n") == 10001
+
+    # Reprise : une plage, la suite du fichier, les derniers octets
+    for plage, debut in [("bytes=0-99", 0), (f"bytes={taille - 1000}-", taille - 1000), ("bytes=-50", taille - 50)]:
+        fin = 99 if debut == 0 else taille - 1
+        partiel = client.get(url, headers={"Range": plage})
+        assert partiel.status_code == 206, plage
+        assert partiel.headers["content-range"] == f"bytes {debut}-{fin}/{taille}"
+        assert partiel.content == contenu[debut:fin + 1]
+
+    hors_fichier = client.get(url, headers={"Range": f"bytes={taille}-"})
+    assert hors_fichier.status_code == 416
+    assert hors_fichier.headers["content-range"] == f"bytes */{taille}"
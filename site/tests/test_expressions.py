@@ -0,0 +1,29 @@
+from datetime import datetime
+
+from sqlalchemy import func, literal, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database import Maintenance
+from expressions import duree_entre
+
+def compiler(stmt, dialect):
+    return str(stmt.compile(dialect=dialect)).replace("\n", "")
+
+def test_duree_entre_sqlite():
+    stmt = select(func.avg(duree_entre(Maintenance.date_debut, Maintenance.date_fin)))
+    sql = compiler(stmt, sqlite.dialect())
+    assert '(julianday("Maintenance".date_fin) - julianday("Maintenance".date_debut)) * 86400.0' in sql
+    assert "EXTRACT" not in sql
+
+def test_duree_entre_postgresql():
+    stmt = select(func.avg(duree_entre(Maintenance.date_debut, Maintenance.date_fin)))
+    sql = compiler(stmt, postgresql.dialect())
+    assert 'EXTRACT(EPOCH FROM ("Maintenance".date_fin - "Maintenance".date_debut))' in sql
+    assert "julianday" not in sql
+
+def test_duree_entre_valeur_sqlite(db):
+    # Le texte stocké par SQLite doit donner une durée exacte en secondes, fractions comprises
+    debut = datetime(2024, 3, 1, 8, 0, 0)
+    fin = datetime(2024, 3, 2, 9, 30, 15, 500000)
+    duree = db.execute(select(duree_entre(literal(debut), literal(fin)))).scalar_one()
+    assert abs(duree - (fin - debut).total_seconds()) < 1e-3
@@ -0,0 +1,25 @@
+from datetime import datetime, timedelta, timezone
+
+def statut_radio(snapshot, id_radio):
+    return next(radio for radio in snapshot["radios"] if radio["id_radio"] == id_radio)
+
+def test_snapshot_instant_avec_fuseau(client, radio_personne):
+    id_radio, id_personne = radio_personne
+    pret_id = client.post("/api/prets", json={"id_radio": id_radio, "id_personne": id_personne}).json()["id"]
+
+    # Même instant en UTC ("Z"), avec un décalage explicite et en heure locale sans fuseau
+    maintenant = datetime.now(timezone.utc) + timedelta(seconds=1)
+    instants = [
+        maintenant.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        maintenant.astimezone(timezone(timedelta(hours=2))).isoformat(),
+        maintenant.astimezone().replace(tzinfo=None).isoformat(),
+    ]
+    for at in instants:
+        response = client.get("/api/historique/snapshot", params={"at": at})
+        assert response.status_code == 200, at
+        radio = statut_radio(response.json(), id_radio)
+        assert radio["statut"] == "en_pret"
+        assert radio["pret"]["id"] == pret_id
+
+def test_snapshot_instant_invalide(client):
+    assert client.get("/api/historique/snapshot", params={"at": "hier"}).status_code == 400
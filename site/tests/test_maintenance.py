@@ -0,0 +1,46 @@
+import os
+import pytest
+from conftest import compter_requetes
+
+ENDPOINTS = [
+    "/api/maintenance/active",
+    "/api/maintenance/history",
+    "/api/maintenance/export",
+]
+
+def requetes(client, url, **params):
+    with compter_requetes() as compteur:
+        response = client.get(url, params=params)
+        assert response.status_code == 200
+        # Les exports sont produits pendant la lecture de la réponse
+        response.read()
+    return compteur[0], response
+
+def demarrer(client, id_radio, operateur):
+    response = client.post(f"/api/radios/{id_radio}/maintenance", json={"description": "batterie", "operateur": operateur})
+    assert response.status_code == 201
+    return response.json()["id"]
+
+@pytest.mark.parametrize("url", ENDPOINTS)
+def test_nombre_de_requetes_constant(client, make_radio, url):
+    # Opérateur propre au test : la recherche ne renvoie que ses maintenances
+    operateur = f"atelier{os.urandom(4).hex()}"
+    params = {"search": operateur} if url != "/api/maintenance/active" else {}
+
+    demarrer(client, make_radio(), operateur)
+    une, response = requetes(client, url, **params)
+    lignes_une = len(response.content.splitlines()) if "export" in url else len(response.json())
+
+    for _ in range(20):
+        demarrer(client, make_radio(), operateur)
+    vingt_et_une, response = requetes(client, url, **params)
+    lignes = len(response.content.splitlines()) if "export" in url else len(response.json())
+
+    assert lignes >= lignes_une + 20
+    assert vingt_et_une == une
+
+def test_details_une_requete(client, make_radio):
+    maintenance_id = demarrer(client, make_radio(), "atelier")
+    nombre, response = requetes(client, f"/api/maintenance/{maintenance_id}")
+    assert response.json()["radio"]["id"] is not None
+    assert nombre == 1
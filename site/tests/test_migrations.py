@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert, inspect, select, text
+
+from database import engine, Pret
+from migrations import add_pret_echeance, fix_pret_echeance_fraction, retry_pret_actif_unique
+
+def index_pret(conn):
+    return {index["name"] for index in inspect(conn).get_indexes("Pret")}
+
+def test_index_prets_actifs_doublons(radio_personne):
+    id_radio, id_personne = radio_personne
+    with engine.connect() as conn:
+        transaction = conn.begin()
+        try:
+            # Base antérieure à l'index : deux prêts actifs pour la même radio
+            conn.execute(text("DROP INDEX idx_pret_actif_unique"))
+            pret = {"id_radio": id_radio, "id_personne": id_personne, "date_emprunt": datetime.now()}
+            ids = [conn.execute(insert(Pret).values(**pret).returning(Pret.id)).scalar() for _ in range(2)]
+
+            with pytest.raises(RuntimeError) as erreur:
+                retry_pret_actif_unique(conn)
+            assert f"radio {id_radio} : prêts {ids[0]}, {ids[1]}" in str(erreur.value)
+            assert "idx_pret_actif_unique" not in index_pret(conn)
+
+            # Doublon clôturé : l'étape crée l'index
+            conn.execute(text("UPDATE Pret SET date_retour = :now WHERE id = :id"), {"now": datetime.now(), "id": ids[1]})
+            retry_pret_actif_unique(conn)
+            assert "idx_pret_actif_unique" in index_pret(conn)
+        finally:
+            transaction.rollback()
+
+def test_echeances_etape_11_fractions_de_seconde(radio_personne):
+    id_radio, id_personne = radio_personne
+    emprunt = datetime(2024, 5, 6, 7, 8, 9, 123456)
+    with engine.connect() as conn:
+        transaction = conn.begin()
+        try:
+            pret_id = conn.execute(insert(Pret).values(
+                id_radio=id_radio, id_personne=id_personne, date_emprunt=emprunt,
+                date_retour=emprunt + timedelta(hours=1)
+            ).returning(Pret.id)).scalar()
+
+            # Échéance recalculée par l'étape 11 (personne sans équipe : durée par défaut)
+            conn.execute(text("UPDATE Pret SET date_echeance = NULL WHERE id = :id"), {"id": pret_id})
+            add_pret_echeance(conn)
+            brute = conn.execute(text("SELECT date_echeance FROM Pret WHERE id = :id"), {"id": pret_id}).scalar()
+            assert brute == "2024-05-13 07:08:09"
+
+            fix_pret_echeance_fraction(conn)
+            echeance = conn.execute(select(Pret.date_echeance).where(Pret.id == pret_id)).scalar()
+            assert echeance == emprunt + timedelta(hours=168)
+            # Les échéances complètes ne sont pas modifiées
+            fix_pret_echeance_fraction(conn)
+            assert conn.execute(select(Pret.date_echeance).where(Pret.id == pret_id)).scalar() == echeance
+        finally:
+            transaction.rollback()
@@ -0,0 +1,88 @@
+import base64
+import json
+import re
+
+from sqlalchemy import event
+from sqlalchemy.orm import joinedload
+
+from database import engine, Pret, Personne, Maintenance, Radio
+from archive import pret_historique
+from pagination import count_rows
+from routes.maintenance import MAINTENANCE_COLUMNS
+from conftest import compter_requetes
+
+def forger(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+def prets_rendus(client, id_radio, id_personne, nombre):
+    for _ in range(nombre):
+        pret_id = client.post("/api/prets", json={"id_radio": id_radio, "id_personne": id_personne}).json()["id"]
+        assert client.put(f"/api/prets/{pret_id}/retour").status_code == 200
+
+def test_curseur_historique(client, radio_personne):
+    id_radio, id_personne = radio_personne
+    prets_rendus(client, id_radio, id_personne, 3)
+    url = "/api/historique/prets"
+
+    for sort in ("date", "duree"):
+        params = {"personne": id_personne, "limit": 2, "sort": sort}
+        premiere = client.get(url, params=params)
+        cursor = premiere.headers["x-next-cursor"]
+        suivante = client.get(url, params={**params, "cursor": cursor})
+        assert suivante.status_code == 200
+        ids = [pret["id"] for pret in premiere.json() + suivante.json()]
+        assert len(ids) == len(set(ids)) == 3
+
+        # Curseur d'un autre tri : refusé au lieu d'être comparé aux mauvaises colonnes
+        autre = "duree" if sort == "date" else "date"
+        assert client.get(url, params={**params, "sort": autre, "cursor": cursor}).status_code == 400
+
+def test_curseur_valeurs_invalides(client):
+    url = "/api/historique/prets"
+    for payload in [
+        [{"dt": "2024-01-01T00:00:00"}, 1],  # ancien format, sans colonnes de tri
+        {"tri": ["date_emprunt", "id"], "valeurs": ["2024-01-01", 1]},
+        {"tri": ["date_emprunt", "id"], "valeurs": [{"dt": "2024-01-01T00:00:00"}, "1"]},
+        {"tri": ["date_emprunt", "id"], "valeurs": [{"dt": "2024-01-01T00:00:00"}, None]},
+        {"tri": ["date_emprunt", "id"], "valeurs": [{"dt": "2024-01-01T00:00:00"}]},
+        {"tri": ["duree_secondes", "id"], "valeurs": [3600, 1]},
+    ]:
+        assert client.get(url, params={"cursor": forger(payload)}).status_code == 400, payload
+    assert client.get(url, params={"cursor": "pas un curseur"}).status_code == 400
+
+    valide = {"tri": ["date_emprunt", "id"], "valeurs": [{"dt": "2024-01-01T00:00:00"}, 1]}
+    assert client.get(url, params={"cursor": forger(valide)}).status_code == 200
+
+def count_sql(query):
+    instructions = []
+    def enregistrer(conn, cursor, statement, *args):
+        instructions.append(statement)
+    event.listen(engine, "before_cursor_execute", enregistrer)
+    try:
+        count_rows(query)
+    finally:
+        event.remove(engine, "before_cursor_execute", enregistrer)
+    return instructions[0]
+
+def test_count_rows(client, db, radio_personne):
+    id_radio, id_personne = radio_personne
+    prets_rendus(client, id_radio, id_personne, 2)
+    client.post(f"/api/radios/{id_radio}/maintenance", json={"description": "antenne", "operateur": "atelier"})
+
+    P = pret_historique()
+    requetes = [
+        db.query(Pret).options(joinedload(Pret.radio), joinedload(Pret.personne).joinedload(Personne.equipe)),
+        db.query(Pret).filter(Pret.id_personne == id_personne),
+        db.query(P).options(joinedload(P.radio)).filter(P.id_radio == id_radio),
+        db.query(*MAINTENANCE_COLUMNS).join(Radio, Maintenance.id_radio == Radio.id),
+    ]
+    for query in requetes:
+        with compter_requetes() as compteur:
+            total = count_rows(query)
+        assert compteur[0] == 1
+        assert total == query.count()
+
+    # COUNT(*) sur les identifiants filtrés, et non COUNT(id) qui lit chaque valeur
+    sql = count_sql(requetes[0])
+    assert sql.startswith("SELECT count(*)")
+    assert re.search(r'count\("?\w+"?\.id\)', sql) is None
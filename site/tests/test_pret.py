@@ -0,0 +1,83 @@
+import warnings
+from datetime import datetime, timedelta
+from sqlalchemy import text, update
+from sqlalchemy.exc import SAWarning
+from database import engine, Pret
+from echeances import scheduler
+import sketches
+from sketches import load_sketches, flush_sketches
+
+def sketch_count(db):
+    sketch = load_sketches(db, "global").get(("global", ""))
+    return sketch.count if sketch else 0
+
+def test_update_commentaire_pret_actif(client, db, radio_personne):
+    id_radio, id_personne = radio_personne
+    response = client.post("/api/prets", json={"id_radio": id_radio, "id_personne": id_personne})
+    assert response.status_code == 201
+    pret_id = response.json()["id"]
+    avant = sketch_count(db)
+
+    # Modifier le commentaire d'un prêt actif n'ajoute aucune durée aux sketches
+    response = client.put(f"/api/prets/{pret_id}", json={"commentaire": "antenne pliée"})
+    assert response.status_code == 200
+    assert response.json()["commentaire"] == "antenne pliée"
+    assert response.json()["date_retour"] is None
+    assert sketch_count(db) == avant
+
+def test_update_commentaire_pret_rendu(client, db, radio_personne):
+    id_radio, id_personne = radio_personne
+    pret_id = client.post("/api/prets", json={"id_radio": id_radio, "id_personne": id_personne}).json()["id"]
+    avant = sketch_count(db)
+
+    # Le retour compte le prêt une fois
+    assert client.put(f"/api/prets/{pret_id}/retour").status_code == 200
+    assert sketch_count(db) == avant + 1
+
+    # La modification du commentaire ne le compte pas une seconde fois
+    response = client.put(f"/api/prets/{pret_id}", json={"commentaire": "rendu sans étui"})
+    assert response.status_code == 200
+    assert sketch_count(db) == avant + 1
+
+def test_update_commentaire_pret_en_retard(client, db, radio_personne):
+    id_radio, id_personne = radio_personne
+    pret_id = client.post("/api/prets", json={"id_radio": id_radio, "id_personne": id_personne}).json()["id"]
+
+    # Échéance dépassée, puis rechargement du suivi des échéances
+    db.execute(update(Pret).where(Pret.id == pret_id).values(date_echeance=datetime.now() - timedelta(hours=1)))
+    db.commit()
+    scheduler.load(db)
+    assert pret_id in [pret["id"] for pret in client.get("/api/prets/overdue").json()]
+
+    # Le prêt reste en retard après la modification de son commentaire
+    assert client.put(f"/api/prets/{pret_id}", json={"commentaire": "relancé"}).status_code == 200
+    assert pret_id in [pret["id"] for pret in client.get("/api/prets/overdue").json()]
+
+def test_create_pret_sans_avertissement(client, radio_personne):
+    id_radio, id_personne = radio_personne
+
+    # L'insertion gardée ne produit pas d'avertissement de produit cartésien
+    # (vérifié à la compilation : le cache des requêtes compilées est vidé d'abord)
+    engine.clear_compiled_cache()
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", SAWarning)
+        response = client.post("/api/prets", json={"id_radio": id_radio, "id_personne": id_personne})
+    assert response.status_code == 201
+
+def test_retour_malgre_echec_ecriture_sketches(client, db, radio_personne, monkeypatch, capsys):
+    id_radio, id_personne = radio_personne
+    pret_id = client.post("/api/prets", json={"id_radio": id_radio, "id_personne": id_personne}).json()["id"]
+    avant = sketch_count(db)
+
+    # Écriture immédiate des sketches (intervalle 0) en échec : le retour aboutit quand même
+    monkeypatch.setattr(sketches, "_upsert", text("INSERT INTO table_absente VALUES (:nombre)"))
+    response = client.put(f"/api/prets/{pret_id}/retour")
+    assert response.status_code == 200
+    assert response.json()["date_retour"] is not None
+    assert "Erreur lors de l'écriture des sketches de durée" in capsys.readouterr().out
+
+    # La durée reste en attente puis est écrite une seule fois
+    assert sketch_count(db) == avant + 1
+    monkeypatch.undo()
+    assert flush_sketches() > 0
+    assert sketch_count(db) == avant + 1